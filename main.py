@@ -1,6 +1,7 @@
 import asyncio
 
 from src.agent import Agent
+from src.llm.agent_client import close_http_clients
 
 
 async def main():
@@ -34,7 +35,10 @@ async def main():
             и положить в той же директории в файл test_agent.py."""
     task7 = """В директории D:\\temp\\kodex1 лежит файл agent.py нужно написать для него ревью и положить в файл resume.txt"""
     task8 = "напиши три главы одного рассказа и сохрани их в D:\\temp\\kodex2\\st.txt"
-    await agent.async_run(task=task6)
+    try:
+        await agent.async_run(task=task6)
+    finally:
+        await close_http_clients()
 
 
 if __name__ == "__main__":
@@ -1,20 +1,55 @@
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 
 from src.action import Action
 from src.llm.agent_client import AgentClient
 from src.mcp_server.mcp_streamable_client import McpStreamClient
 from src.memory import Context, Observation, Thought
+from src.rag.agent_embeding import Embedder
+from src.rag.embeding_utils import extract_short_text
 from src.thinking.thought_manager import ThoughtManager
 from src.tool import Tool
+from src.utils.config import get_config_dict
 
 import asyncio
+import time
+
+RAG_DEADLINE = 0.5  # секунд: дольше конвейер поиск по памяти не ждёт, LLM думает без неё
+
+
+@dataclass
+class StepTimings:
+    """
+    Время этапов шага, секунды. rag и persist — сколько этап работал, rag_wait и persist_wait —
+    сколько шаг его реально ждал; разница ушла параллельно с другими этапами (overlapped).
+    """
+    rag: float = 0.0
+    rag_wait: float = 0.0
+    rag_skipped: bool = False
+    think: float = 0.0
+    tools: float = 0.0
+    persist: float = 0.0
+    persist_wait: float = 0.0
+    total: float = 0.0
+
+    @property
+    def overlapped(self) -> float:
+        return max(0.0, self.rag - self.rag_wait) + max(0.0, self.persist - self.persist_wait)
+
+    def __str__(self) -> str:
+        rag = "пропущен" if self.rag_skipped else f"{self.rag:.2f}"
+        return (f"память {rag} (ждали {self.rag_wait:.2f}) | мысль {self.think:.2f} | инструменты {self.tools:.2f}"
+                f" | запись {self.persist:.2f} (ждали {self.persist_wait:.2f})"
+                f" | параллельно {self.overlapped:.2f} | всего {self.total:.2f}")
+
 
 class Agent:
     def __init__(
             self,
             context: Optional["Context"] = None,
             tools: Optional[dict[str, Tool]] = None,
+            embedder: Optional[Embedder] = None,
     ):
         # Контекст берём через DI; если не передали — создаём пустой.
         self.mcp_client = None
@@ -24,65 +59,245 @@ class Agent:
             user_goal=None,
         )
         self.client = AgentClient("llm1")
-        self.thought_manager = ThoughtManager(context = self.context)
+        # потоковый ответ LLM: действия плана выполняются, пока модель дописывает остальные
+        agent_config = get_config_dict().get("agent", {})
+        self.streaming = agent_config.get("streaming", False)
+        # конвейер: поиск памяти для следующего шага и запись этого — параллельно с мышлением
+        self.pipelined = agent_config.get("pipelined", False)
+        self.rag_deadline = agent_config.get("rag_deadline", RAG_DEADLINE)
+        self._prefetch: Optional[Tuple[str, asyncio.Task]] = None
+        self._late_retrievals: set[asyncio.Task] = set()
+        self._persist_task: Optional[asyncio.Task] = None
+        self._tools_seconds = 0.0
+        self.thought_manager = ThoughtManager(context = self.context, embedder = embedder)
 
     async def async_run(self, task: str):
         self.context.user_goal=task,
         self.context.set_task(task)
-        async with McpStreamClient() as client:
-            self.mcp_client = client
-            self.tools = await self.mcp_client.list_tools()
+        await self.thought_manager.rag_thought_manager.init()
+        try:
+            async with McpStreamClient() as client:
+                self.mcp_client = client
+                self.tools = await self.mcp_client.list_tools()
 
-            for step in range(1, 999):
-                await self.async_step(step)
+                for step in range(1, 999):
+                    await self.async_step(step)
 
-                if self.is_task_complete():
-                    break
+                    if self.is_task_complete():
+                        break
+        finally:
+            # отложенная запись памяти не теряется ни при выходе, ни при ошибке
+            await self._drain_pipeline()
+            await self.thought_manager.rag_thought_manager.close()
+            if self.thought_manager.model_router is not None:
+                print(f"Маршрутизация моделей: {self.thought_manager.model_router.stats}")
+            if self.client.response_cache is not None:
+                print(f"Кэш ответов LLM: {self.client.response_cache.stats()}")
 
     async def async_step(self, step: int):
-        situation: str = self.build_situation()
-        # ← Думаем асинхронно (RAG и LLM — await)
-        thought: Thought = await self.thought_manager.think(self.tools, situation)
-        # ← Может вернуть одно действие или список независимых
-        actions: list[Action] = self.thought_to_actions(thought)  # не action, а actions!
+        timings = StepTimings()
+        step_started = time.monotonic()
+        # краткий ключ — для поиска по памяти и записи в неё, полный текст — для промпта
+        retrieval_key, situation = self.build_situation()
         date_time = f"[{datetime.now().strftime('%y-%m-%d %H:%M:%S.%f')[:-3]}]"
 
-        print(f"{date_time}:Шаг {step} | Мысль: {thought.reasoning} | Действий: {len(actions) if isinstance(actions, list) else 1}")
-        observations: list[Observation] = await self.actions_to_observations(actions)
+        # ← Память: в конвейере поиск уже запущен в конце прошлого шага и ждём его не дольше rag_deadline
+        started = time.monotonic()
+        if self.pipelined:
+            rag_context = await self._pipelined_rag(retrieval_key, timings)
+        else:
+            rag_context = await self.thought_manager.retrieve(retrieval_key)
+            timings.rag = time.monotonic() - started
+        timings.rag_wait = time.monotonic() - started
+
+        started, tools_before = time.monotonic(), self._tools_seconds
+        if self.streaming:
+            thought, observations = await self._think_streaming(situation, rag_context)
+            timings.think = time.monotonic() - started
+            print(f"{date_time}:Шаг {step} | Мысль: {thought.reasoning} | Действий: {len(observations)}")
+        else:
+            # ← Думаем асинхронно (LLM — await)
+            thought: Thought = await self.thought_manager.reason(self.tools, situation, rag_context)
+            timings.think = time.monotonic() - started
+            # ← Может вернуть одно действие или список независимых
+            actions: list[Action] = self.thought_to_actions(thought)  # не action, а actions!
+
+            print(f"{date_time}:Шаг {step} | Мысль: {thought.reasoning} | Действий: {len(actions) if isinstance(actions, list) else 1}")
+            observations: list[Observation] = await self.actions_to_observations(actions)
+        timings.tools = self._tools_seconds - tools_before
         self.context.update(observations)
+        if self.thought_manager.model_router is not None:
+            self.thought_manager.model_router.record_outcome(observations)
 
         # === Сохранение в долгосрочную память ===
-        await self.thought_manager.rag_thought_manager.save_to_rag(thought)
+        if self.pipelined:
+            # поиск для следующего шага стартует сразу, запись этого идёт параллельно с его мышлением
+            self._start_prefetch()
+            await self._schedule_persist(thought, retrieval_key, timings)
+        else:
+            started = time.monotonic()
+            await self.thought_manager.rag_thought_manager.save_to_rag(thought, retrieval_key)
+            timings.persist = timings.persist_wait = time.monotonic() - started
+        timings.total = time.monotonic() - step_started
+        print(f"Шаг {step} | {timings}")
+
+    # === Конвейер шагов ===
+
+    async def _timed_retrieve(self, retrieval_key: str) -> Tuple[Optional[str], float]:
+        started = time.monotonic()
+        rag_context = await self.thought_manager.retrieve(retrieval_key)
+        return rag_context, time.monotonic() - started
+
+    def _start_prefetch(self):
+        """Поиск по памяти для следующего шага — его ключ известен, как только наблюдения записаны в контекст"""
+        if self.is_task_complete():
+            return
+        retrieval_key = extract_short_text(self.context)
+        self._prefetch = (retrieval_key, asyncio.create_task(self._timed_retrieve(retrieval_key)))
+
+    async def _pipelined_rag(self, retrieval_key: str, timings: "StepTimings") -> Optional[str]:
+        """
+        Результат заранее запущенного поиска (или нового, если ключ не совпал).
+        Не успел за rag_deadline — LLM думает без памяти, а поиск дорабатывает в фоне и заполняет кэш.
+        """
+        prefetch, self._prefetch = self._prefetch, None
+        if prefetch is not None and prefetch[0] != retrieval_key:
+            prefetch[1].cancel()
+            prefetch = None
+        task = prefetch[1] if prefetch is not None else asyncio.create_task(self._timed_retrieve(retrieval_key))
+        done, _ = await asyncio.wait({task}, timeout=self.rag_deadline)
+        if not done:
+            print(f"Память не найдена за {self.rag_deadline} с — думаем без неё")
+            self._late_retrievals.add(task)
+            task.add_done_callback(self._late_retrieval_done)
+            timings.rag_skipped = True
+            return None
+        try:
+            rag_context, timings.rag = task.result()
+        except Exception as e:
+            print(f"Ошибка поиска по памяти: {e}")
+            return None
+        return rag_context
+
+    def _late_retrieval_done(self, task: asyncio.Task):
+        self._late_retrievals.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Ошибка поиска по памяти: {task.exception()}")
+
+    async def _timed_persist(self, thought: Thought, retrieval_key: str, observation: Observation) -> float:
+        started = time.monotonic()
+        await self.thought_manager.rag_thought_manager.save_to_rag(thought, retrieval_key, observation)
+        return time.monotonic() - started
+
+    async def _schedule_persist(self, thought: Thought, retrieval_key: str, timings: "StepTimings"):
+        """Запись шага — в фоне; запись прошлого шага дожидаемся здесь, чтобы память шла по порядку"""
+        started = time.monotonic()
+        if self._persist_task is not None:
+            try:
+                timings.persist = await self._persist_task
+            except Exception as e:
+                print(f"Ошибка записи памяти: {e}")
+        timings.persist_wait = time.monotonic() - started
+        self._persist_task = asyncio.create_task(
+            self._timed_persist(thought, retrieval_key, self.context.last_observation))
+
+    async def _drain_pipeline(self):
+        """Конец прогона: дописать память последнего шага, ненужные поиски отменить"""
+        if self._prefetch is not None:
+            self._prefetch[1].cancel()
+            self._prefetch = None
+        for task in list(self._late_retrievals):
+            task.cancel()
+        if self._persist_task is not None:
+            try:
+                await self._persist_task
+            except Exception as e:
+                print(f"Ошибка записи памяти: {e}")
+            self._persist_task = None
+
+    async def _think_streaming(self, situation: str, rag_context: Optional[str]) -> Tuple[Thought, list[Observation]]:
+        """
+        Думаем потоком: каждое действие плана ставится в очередь, как только модель закрыла его объект,
+        и выполняется по порядку, пока генерируются следующие. Порядок действий сохраняется —
+        следующее может зависеть от результата предыдущего.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        observations: list[Observation] = []
+
+        async def execute_in_order():
+            while (action := await queue.get()) is not None:
+                observations.append(await self._execute_action(action))
+
+        def on_action(item: dict):
+            if isinstance(item, dict) and "tool" in item:
+                queue.put_nowait(self.plan_item_to_action(item))
+
+        executor = asyncio.create_task(execute_in_order())
+        try:
+            thought: Thought = await self.thought_manager.reason(
+                self.tools, situation, rag_context,
+                on_action=on_action,
+                on_reasoning=lambda text: print(text, end="", flush=True))
+            print()
+        finally:
+            queue.put_nowait(None)
+            await executor
+
+        if not observations:
+            # поток не дал ни одного действия (ошибка LLM, пустой план) — обычная обработка мысли
+            observations = await self.actions_to_observations(self.thought_to_actions(thought))
+        return thought, observations
 
     async def actions_to_observations(self, actions) -> list[Observation]:
         observations: list[Observation] = []
         if isinstance(actions, list):
             for action in actions:
-                if ("submit_task" == action.tool_name
-                        or "think_along" == action.tool_name
-                        or "empty_action" == action.tool_name
-                        or "error_llm" == action.tool_name):
-                    result = action.tool_name
-                else:
-                    result = await action.execute(self.mcp_client)
-
-                observations.append(Observation(
-                    action=action,
-                    output=result,
-                    success=True
-                ))
-                print(result)
+                observations.append(await self._execute_action(action))
         return observations
 
+    async def _execute_action(self, action: Action) -> Observation:
+        started = time.monotonic()
+        try:
+            return await self._call_action(action)
+        finally:
+            self._tools_seconds += time.monotonic() - started
 
-    def build_situation(self) -> str:
-        parts = []
+    async def _call_action(self, action: Action) -> Observation:
+        if ("submit_task" == action.tool_name
+                or "think_along" == action.tool_name
+                or "empty_action" == action.tool_name
+                or "error_llm" == action.tool_name
+                or "json_error_llm" == action.tool_name):
+            result = action.tool_name
+        else:
+            try:
+                result = await action.execute(self.mcp_client)
+            except Exception as e:
+                # ошибка инструмента — наблюдение для следующего шага (и повод думать большой моделью)
+                print(f"Ошибка {action.tool_name}: {e}")
+                return Observation(
+                    action=action,
+                    output=f"Ошибка: {e}",
+                    success=False
+                )
+        print(result)
+        return Observation(
+            action=action,
+            output=result,
+            success=True
+        )
 
-        # 1. Главная цель — всегда наверху
-        if self.context.user_goal:
-            parts.append(f"ЦЕЛЬ: {self.context.user_goal}")
 
-        # 2. Последнее действие и его результат
+    def build_situation(self) -> Tuple[str, str]:
+        """
+        (краткий ключ ситуации, текст текущего шага для промпта).
+        Ключ — цель, последний шаг, пара предыдущих и план (extract_short_text): он эмбеддится
+        и кладётся в память. Текст шага уходит только в LLM; цель и каталог инструментов
+        в него не входят — они в неизменной части промпта (PromptBuilder), история — тоже отдельно.
+        """
+        parts = []
+
+        # 1. Последнее действие и его результат
         if self.context.last_observation:
             obs = self.context.last_observation
             status = "УСПЕХ" if obs.success else "ОШИБКА"
@@ -91,34 +306,15 @@ class Agent:
                 error = obs.output.strip().split('\n')[-1]  # последняя строка ошибки
                 parts.append(f"ОШИБКА: {error}")
 
-        # 3. Краткая история (последние 3–5 шагов)
-        parts.append("История:")
-        parts.append(self.context.format_recent_history())
+        # 2. История шагов добавляет LlmThoughtManager — по бюджету токенов окна модели
 
-        # 4. Текущая среда (очень важно!)
+        # 3. Текущая среда (очень важно!)
         # для специальных задач надо делать специально
 
-        # 5. MCP инструменты
-        parts.append(f"MCP инструменты:\n[")
-        for tool in self.tools:
-            t = self.mcp_client.convert_mcp_tool_to_openai_format(tool)
-            parts.append(f"{t}\n")
-        submit_task = {'type': 'function',
-                      'function': {'name': 'submit_task',
-                                   'parameters': {}
-                                   }}
-        think_along = {'type': 'function',
-                      'function': {'name': 'think_along',
-                                   'parameters': {}
-                                   }}
-        parts.append(f"{submit_task}\n")
-        parts.append(f"{think_along}\n")
-        parts.append("]")
-
         if self.context.get_plan():
             parts.append(f"ПЛАН: {self.context.get_plan()}")
 
-        return "\n".join(parts)
+        return extract_short_text(self.context), "\n".join(parts)
 
     def thought_to_actions(self, thought: Thought) -> list[Action]:
         """
@@ -128,15 +324,7 @@ class Agent:
         action_list: list[Action] = []
         if thought.source == "llm" and thought.action_plan:
             for tool in thought.action_plan:
-                if "parameters" in tool:
-                    action_list.append(Action(
-                        tool_name=tool["tool"],
-                        params=tool["parameters"]
-                    ))
-                else:
-                    action_list.append(Action(
-                        tool_name=tool["tool"]
-                    ))
+                action_list.append(self.plan_item_to_action(tool))
         else:
             action_list.append(Action(
                         tool_name="empty_action",
@@ -150,6 +338,20 @@ class Agent:
         # if thought.source == "rag_adapted" and thought.action_plan:
         #     return self._handle_rag_thought(thought)
 
+    @staticmethod
+    def plan_item_to_action(tool: dict) -> Action:
+        """Пункт action_plan из ответа LLM → Action"""
+        if isinstance(tool, Action):  # служебные мысли (json_error_llm) уже содержат Action
+            return tool
+        if "parameters" in tool:
+            return Action(
+                tool_name=tool["tool"],
+                params=tool["parameters"]
+            )
+        return Action(
+            tool_name=tool["tool"]
+        )
+
     def _handle_template_thought(self, thought: Thought) -> Action | list[Action]:
         """Шаблоны — самые точные, им доверяем полностью"""
         if thought.source == "template_decomposition":
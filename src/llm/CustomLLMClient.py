@@ -9,6 +9,8 @@ from graphiti_core.llm_client.config import DEFAULT_MAX_TOKENS, ModelSize, LLMCo
 from graphiti_core.prompts import Message
 from openai.cli._models import BaseModel
 
+from src.llm.response_cache import shared_response_cache
+
 
 class CustomLLMClient(LLMClient):
     """Адаптер для вашей локальной LLM по адресу http://192.168.1.12:8000"""
@@ -24,6 +26,7 @@ class CustomLLMClient(LLMClient):
             timeout=60
         )
         self.model = config.model
+        self.response_cache = shared_response_cache()  # тот же кэш ответов, что у AgentClient
 
     async def _generate_response(
         self,
@@ -113,10 +116,15 @@ class CustomLLMClient(LLMClient):
             "max_tokens": 2000
         }
 
-        response = await self.client.post(
-            f"{self.config.base_url}/v1/chat/completions",  # или /chat/completions, смотрите ваш API
-            json=payload
-        )
-        #print(response.json())
-        print(response.json()["choices"][0]["message"]["content"])
-        return json.loads(response.json()["choices"][0]["message"]["content"])
+        data = self.response_cache.get(self.config.base_url, payload) if self.response_cache else None
+        if data is None:
+            response = await self.client.post(
+                f"{self.config.base_url}/v1/chat/completions",  # или /chat/completions, смотрите ваш API
+                json=payload
+            )
+            data = response.json()
+            #print(data)
+            if self.response_cache and "choices" in data:
+                self.response_cache.set(self.config.base_url, payload, data)
+        print(data["choices"][0]["message"]["content"])
+        return json.loads(data["choices"][0]["message"]["content"])
@@ -1,24 +1,165 @@
-from typing import Iterable
+import asyncio
+from typing import AsyncIterator, Dict, Iterable, List, Optional
 
-from openai import OpenAI
-from openai.types.chat import ChatCompletionMessageParam
+import httpx
+from openai import OpenAI, AsyncOpenAI
+from openai.types.chat import ChatCompletion, ChatCompletionMessageParam
 
+from src.llm.response_cache import shared_response_cache
 from src.utils.config import get_config_dict
 
+CONNECT_TIMEOUT = 10.0    # секунд на установку соединения
+READ_TIMEOUT = 600.0      # секунд между байтами ответа (длинная генерация)
+MAX_CONCURRENCY = 4       # одновременных запросов к одному endpoint
+MAX_KEEPALIVE = 20        # соединений keep-alive в пуле на endpoint
+MAX_TOKENS = 16382        # лимит ответа, если вызывающий не задал свой
+
+# один пул соединений и один лимит параллельности на base_url на весь процесс:
+# все агенты и оба клиента (llm1/llm2) с одним адресом делят их
+_http_clients: Dict[str, httpx.AsyncClient] = {}
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+
+def shared_http_client(base_url: str, connect_timeout: float, read_timeout: float) -> httpx.AsyncClient:
+    client = _http_clients.get(base_url)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_keepalive_connections=MAX_KEEPALIVE),
+        )
+        _http_clients[base_url] = client
+    return client
+
+
+def endpoint_semaphore(base_url: str, max_concurrency: int) -> asyncio.Semaphore:
+    semaphore = _semaphores.get(base_url)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(max_concurrency)
+        _semaphores[base_url] = semaphore
+    return semaphore
+
+
+async def close_http_clients():
+    """Закрывает общие пулы соединений — в конце работы процесса"""
+    clients = list(_http_clients.values())
+    _http_clients.clear()
+    _semaphores.clear()
+    for client in clients:
+        await client.aclose()
+
+
 class AgentClient:
     def __init__(self, llm: str = "llm1"):
         self.config = get_config_dict()
         self.llm = llm
-        self.client = OpenAI(base_url=self.config[self.llm]["base_url"], api_key="none")
+        llm_config = self.config[self.llm]
+        self.base_url = llm_config["base_url"]
+        self.client = OpenAI(base_url=self.base_url, api_key="none")
+        self.connect_timeout = llm_config.get("connect_timeout", CONNECT_TIMEOUT)
+        self.read_timeout = llm_config.get("read_timeout", READ_TIMEOUT)
+        self.max_concurrency = llm_config.get("max_concurrency", MAX_CONCURRENCY)
+        self._async_client = None
+        self._http_client = None
+        self.response_cache = shared_response_cache()  # None — кэш ответов выключен ([llm_cache] mode)
 
-    def request(self, msgs: Iterable[ChatCompletionMessageParam] = None, prompt: str = None):
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        """AsyncOpenAI поверх общего keep-alive пула для base_url (создаётся внутри event loop)"""
+        http_client = shared_http_client(self.base_url, self.connect_timeout, self.read_timeout)
+        if self._http_client is not http_client:  # пул пересоздан после close_http_clients
+            self._async_client = AsyncOpenAI(base_url=self.base_url, api_key="none", http_client=http_client)
+            self._http_client = http_client
+        return self._async_client
+
+    def _completion_kwargs(self, msgs: Iterable[ChatCompletionMessageParam] = None, prompt: str = None,
+                           tools: List[dict] = None, max_tokens: int = None, extra: dict = None) -> dict:
         if not msgs:
             msgs = [{"role": "user", "content": prompt}]
-        result =  self.client.chat.completions.create(
+        kwargs = dict(
             model=self.config[self.llm]["model"],
             messages=msgs,
             temperature=0.0,
-            max_tokens=16382,
+            max_tokens=max_tokens or MAX_TOKENS,  # TokenBudget подбирает меньший лимит по размеру ответов
             stop=["\n```"]  # обрезаем после первого ```
         )
-        return result
\ No newline at end of file
+        if tools:
+            # нативный tool calling: схемы инструментов идут отдельно от текста промпта
+            kwargs.update(tools=tools, tool_choice="auto")
+        if extra:
+            # response_format / extra_body (guided_json) — генерация по JSON-схеме
+            kwargs.update(extra)
+        return kwargs
+
+    def request(self, msgs: Iterable[ChatCompletionMessageParam] = None, prompt: str = None):
+        kwargs = self._completion_kwargs(msgs, prompt)
+        cached = self._cached(kwargs)
+        if cached is not None:
+            return cached
+        result =  self.client.chat.completions.create(**kwargs)
+        self._store(kwargs, result)
+        return result
+
+    async def arequest(self, msgs: Iterable[ChatCompletionMessageParam] = None, prompt: str = None,
+                       timeout: float = None, tools: List[dict] = None, max_tokens: int = None,
+                       extra: dict = None):
+        """
+        Асинхронный request: event loop не блокируется на время генерации.
+        Не больше max_concurrency одновременных запросов к endpoint — остальные ждут своей очереди.
+        timeout — общий срок на ожидание слота и генерацию; отмена задачи (task.cancel())
+        обрывает HTTP-запрос и освобождает слот.
+        """
+        kwargs = self._completion_kwargs(msgs, prompt, tools, max_tokens, extra)
+        cached = self._cached(kwargs)
+        if cached is not None:
+            return cached
+        semaphore = endpoint_semaphore(self.base_url, self.max_concurrency)
+        async with asyncio.timeout(timeout):
+            async with semaphore:
+                result = await self.async_client.chat.completions.create(**kwargs)
+        self._store(kwargs, result)
+        return result
+
+    async def astream(self, msgs: Iterable[ChatCompletionMessageParam] = None,
+                      prompt: str = None, max_tokens: int = None, extra: dict = None) -> AsyncIterator[str]:
+        """
+        Потоковая генерация: отдаёт куски текста по мере прихода.
+        Слот endpoint занят, пока поток читается; прерванный (или отменённый) поток закрывает соединение.
+        Ответ из кэша отдаётся одним куском; в кэш попадает только дочитанный до конца поток
+        со своим finish_reason (обрезанный по max_tokens — с "length").
+        """
+        kwargs = self._completion_kwargs(msgs, prompt, max_tokens=max_tokens, extra=extra)
+        cached = self._cached(kwargs)
+        if cached is not None:
+            if cached.choices and cached.choices[0].message.content:
+                yield cached.choices[0].message.content
+            return
+        parts = []
+        finish_reason = None
+        semaphore = endpoint_semaphore(self.base_url, self.max_concurrency)
+        async with semaphore:
+            stream = await self.async_client.chat.completions.create(**kwargs, stream=True)
+            async with stream:
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    finish_reason = chunk.choices[0].finish_reason or finish_reason
+                    if chunk.choices[0].delta.content:
+                        parts.append(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
+        # поток без finish_reason оборвался на стороне сервера — такой ответ не кэшируем
+        if self.response_cache is not None and finish_reason is not None:
+            self.response_cache.set(self.base_url, kwargs, {
+                "id": "stream", "object": "chat.completion", "created": 0, "model": kwargs["model"],
+                "choices": [{"index": 0, "finish_reason": finish_reason,
+                             "message": {"role": "assistant", "content": "".join(parts)}}],
+            })
+
+    def _cached(self, kwargs: dict) -> Optional[ChatCompletion]:
+        if self.response_cache is None:
+            return None
+        cached = self.response_cache.get(self.base_url, kwargs)
+        return ChatCompletion.model_validate(cached) if cached is not None else None
+
+    def _store(self, kwargs: dict, result: ChatCompletion):
+        if self.response_cache is not None:
+            self.response_cache.set(self.base_url, kwargs, result.model_dump(mode="json"))
@@ -0,0 +1,120 @@
+# response_cache.py
+import hashlib
+import json
+import pathlib
+from typing import Any, Dict, Optional
+
+from diskcache import Cache
+
+from src.utils.config import get_config_dict
+
+DEFAULT_CACHE_DIR = ".cache/llm_responses"
+DEFAULT_SIZE_LIMIT_MB = 512
+CACHE_MODES = ("off", "read_through", "refresh", "offline")
+# параметры запроса, от которых зависит ответ; timeout, stream и т.п. в ключ не входят
+KEY_FIELDS = ("model", "messages", "temperature", "top_p", "max_tokens", "stop", "seed",
+              "tools", "tool_choice", "response_format", "extra_body")
+
+_shared_cache: Dict[str, "ResponseCache"] = {}
+
+
+class ResponseCacheMiss(LookupError):
+    """Режим offline: ответа на такой запрос в кэше нет, а к LLM ходить нельзя"""
+
+
+class ResponseCache:
+    """
+    Дисковый кэш ответов LLM. Ключ — sha256 от endpoint и параметров запроса
+    (модель, сообщения, сэмплинг, stop, инструменты), поэтому повторный прогон той же задачи,
+    перезапуск после падения и CI не платят за уже сделанную генерацию.
+    Кэшируются только детерминированные запросы (temperature == 0).
+    Режимы:
+      read_through — берём из кэша, промах идёт в LLM и сохраняется;
+      refresh      — всегда идём в LLM и перезаписываем кэш;
+      offline      — только кэш: промах и любой некэшируемый запрос — ResponseCacheMiss.
+    """
+
+    def __init__(self, mode: str = "read_through",
+                 directory: str = DEFAULT_CACHE_DIR,
+                 size_limit_mb: int = DEFAULT_SIZE_LIMIT_MB):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Неизвестный режим кэша LLM: {mode} (допустимы {', '.join(CACHE_MODES)})")
+        self.mode = mode
+        self.directory = pathlib.Path(directory)
+        if not self.directory.is_absolute():
+            self.directory = pathlib.Path(__file__).resolve().parents[2] / self.directory
+        self.cache = Cache(
+            str(self.directory),
+            size_limit=size_limit_mb * 1024 * 1024,
+            eviction_policy="least-recently-used",
+        )
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_config(cls, config: dict) -> Optional["ResponseCache"]:
+        cache_config = config.get("llm_cache", {})
+        mode = cache_config.get("mode", "off")
+        if mode == "off":
+            return None
+        return cls(
+            mode=mode,
+            directory=cache_config.get("directory", DEFAULT_CACHE_DIR),
+            size_limit_mb=cache_config.get("size_limit_mb", DEFAULT_SIZE_LIMIT_MB),
+        )
+
+    @staticmethod
+    def cacheable(request: Dict[str, Any]) -> bool:
+        return not request.get("temperature")
+
+    @staticmethod
+    def key(endpoint: str, request: Dict[str, Any]) -> str:
+        fields = {name: request[name] for name in KEY_FIELDS if request.get(name) is not None}
+        raw = json.dumps([endpoint, fields], ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, endpoint: str, request: Dict[str, Any]) -> Optional[Any]:
+        """Сохранённый ответ или None, если надо идти в LLM"""
+        if self.mode == "refresh":
+            return None
+        if not self.cacheable(request):
+            if self.mode == "offline":
+                raise ResponseCacheMiss(f"Режим offline: запрос к {request.get('model')} ({endpoint}) "
+                                        f"с temperature={request.get('temperature')} не кэшируется")
+            return None
+        response = self.cache.get(self.key(endpoint, request))
+        if response is None:
+            self.misses += 1
+            if self.mode == "offline":
+                raise ResponseCacheMiss(f"Нет ответа в кэше LLM для {request.get('model')} ({endpoint})")
+            return None
+        self.hits += 1
+        return response
+
+    def set(self, endpoint: str, request: Dict[str, Any], response: Any):
+        """response — JSON-совместимый ответ (dict), без объектов клиента"""
+        if self.cacheable(request):
+            self.cache.set(self.key(endpoint, request), response)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "mode": self.mode,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self.cache),
+            "size_bytes": self.cache.volume(),
+        }
+
+    def close(self):
+        self.cache.close()
+
+
+def shared_response_cache() -> Optional[ResponseCache]:
+    """Один кэш ответов на процесс для всех клиентов LLM (AgentClient, CustomLLMClient)"""
+    config = get_config_dict()
+    mode = config.get("llm_cache", {}).get("mode", "off")
+    if mode not in _shared_cache:
+        _shared_cache[mode] = ResponseCache.from_config(config)
+    return _shared_cache[mode]
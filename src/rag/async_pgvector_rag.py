@@ -0,0 +1,111 @@
+# async_pgvector_rag.py
+from typing import List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.rag.db_engine import get_async_engine
+from src.rag.models import Base, Chunk, MemoryChunk
+from src.rag.pgvector_rag import PgVectorQueries, CHUNK_COLUMNS, MEMORY_COLUMNS
+from src.rag.vector_storage import StorageMode
+
+
+class AsyncPgVectorRAG(PgVectorQueries):
+    """
+    Асинхронный вариант PgVectorRAG на asyncpg: поиск и запись памяти агента
+    без asyncio.to_thread — все агенты работают в одном event loop, не занимая потоки.
+    Запросы те же, что у PgVectorRAG (общие построители из PgVectorQueries).
+    Схему code_chunks создаёт синхронный PgVectorRAG.init_db, memory_chunks — memory_init_db.
+    """
+
+    def __init__(self, db_url: str = None, storage_mode: StorageMode = None):
+        super().__init__(storage_mode)
+        self.engine = get_async_engine(db_url)  # общий пул на URL, см. db_engine
+
+    async def memory_init_db(self):
+        """Таблица памяти, миграции её столбцов и индексы — один раз при старте агента"""
+        async with self.engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            for sql in self._memory_schema_sql():
+                await conn.execute(text(sql))
+
+    async def search(self, query_embedding: List[float], top_k: int = 10, max_distance: float = 0.1,
+                     columns: List[str] = None, ef_search: int = None,
+                     iterative_scan: str = None) -> List[Chunk]:
+        return (await self.search_many([query_embedding], top_k, max_distance,
+                                       columns, ef_search, iterative_scan))[0]
+
+    async def search_memory(self, query_embedding: List[float], top_k: int = 10, max_distance: float = 0.1,
+                            columns: List[str] = None, ef_search: int = None,
+                            iterative_scan: str = None) -> List[MemoryChunk]:
+        return (await self.search_memory_many([query_embedding], top_k, max_distance,
+                                              columns, ef_search, iterative_scan))[0]
+
+    async def search_many(self, query_embeddings: List[List[float]], top_k: int = 10,
+                          max_distance: float = 0.1, columns: List[str] = None, ef_search: int = None,
+                          iterative_scan: str = None) -> List[List[Chunk]]:
+        return await self._search(Chunk, columns or CHUNK_COLUMNS, query_embeddings,
+                                  top_k, max_distance, ef_search, iterative_scan)
+
+    async def search_memory_many(self, query_embeddings: List[List[float]], top_k: int = 10,
+                                 max_distance: float = 0.1, columns: List[str] = None, ef_search: int = None,
+                                 iterative_scan: str = None) -> List[List[MemoryChunk]]:
+        return await self._search(MemoryChunk, columns or MEMORY_COLUMNS, query_embeddings,
+                                  top_k, max_distance, ef_search, iterative_scan)
+
+    async def _search(self, model, columns: List[str], query_embeddings: List[List[float]],
+                      top_k: int, max_distance: Optional[float],
+                      ef_search: Optional[int], iterative_scan: Optional[str]) -> List[list]:
+        if not query_embeddings:
+            return []
+        async with AsyncSession(self.engine) as session:
+            async with session.begin():  # set_config(..., true) действует до конца этой транзакции
+                for stmt, params in self._search_settings(ef_search, iterative_scan):
+                    await session.execute(stmt, params)
+                stmt = self._search_many_stmt(model, columns, query_embeddings, top_k, max_distance)
+                rows = (await session.execute(stmt)).all()
+        return self._rows_to_models(model, columns, rows, len(query_embeddings))
+
+    async def lexical_search(self, query_text: str, top_k: int = 10, columns: List[str] = None) -> List[Chunk]:
+        return await self._lexical_search(Chunk, self._chunk_tsvector(), columns or CHUNK_COLUMNS,
+                                          query_text, top_k)
+
+    async def lexical_search_memory(self, query_text: str, top_k: int = 10,
+                                    columns: List[str] = None, exclude: str = None) -> List[MemoryChunk]:
+        return await self._lexical_search(MemoryChunk, self._memory_tsvector(), columns or MEMORY_COLUMNS,
+                                          query_text, top_k, exclude, self.memory_min_rank)
+
+    async def _lexical_search(self, model, tsvector, columns: List[str], query_text: str, top_k: int,
+                              exclude: str = None, min_rank: float = None) -> list:
+        stmt = self._lexical_stmt(model, tsvector, columns, query_text, top_k, exclude, min_rank)
+        if stmt is None:
+            return []
+        async with AsyncSession(self.engine) as session:
+            rows = (await session.execute(stmt)).all()
+        return [model(**{name: getattr(row, name) for name in columns}) for row in rows]
+
+    async def save_memory_chunk(self, chunk: MemoryChunk):
+        await self.save_memory_chunks([chunk])
+
+    async def save_memory_chunks(self, chunks: List[MemoryChunk]):
+        """Несколько записей памяти — одна транзакция; повтор ситуации сливается с существующей записью"""
+        if not chunks:
+            return
+        async with AsyncSession(self.engine) as session:
+            async with session.begin():
+                for chunk in chunks:
+                    stmt = self._duplicate_memory_stmt(chunk)
+                    memory_id = (await session.execute(stmt)).scalar() if stmt is not None else None
+                    await session.execute(self._merge_memory_stmt(memory_id, chunk) if memory_id
+                                          else self._insert_memory_stmt(chunk))
+
+    async def bulk_upsert_chunks(self, chunks: List[Chunk]):
+        """INSERT ... ON CONFLICT пачками, как PgVectorRAG.bulk_upsert_chunks, но с коммитом в конце"""
+        async with AsyncSession(self.engine) as session:
+            async with session.begin():
+                for stmt in self._upsert_stmts(chunks):
+                    await session.execute(stmt)
+
+    async def close(self):
+        """Пул общий для процесса (db_engine.dispose_async_engines) — здесь закрывать нечего"""
+        pass
@@ -0,0 +1,170 @@
+# chunker.py
+import ast
+import os
+from typing import List, Optional
+
+CHUNK_SIZE = 1000      # символов
+CHUNK_OVERLAP = 200    # символов
+CHUNK_TOKENS = 512         # бюджет чанка для структурного чанкера
+CHUNK_OVERLAP_TOKENS = 64  # перекрытие — только когда единицу приходится резать
+CHARS_PER_TOKEN = 4        # грубая оценка для кода и английского текста
+
+
+def text_to_chunk(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> list[str]:
+    """Окна фиксированной длины с перекрытием (функция модуля — годится для ProcessPool)"""
+    validate_chunk_settings(chunk_size, overlap)
+    chunks = []
+    i = 0
+    while i < len(text):
+        j = i + chunk_size
+        chunks.append(text[i:j])
+        i = j - overlap
+        if j >= len(text): break
+    return chunks
+
+
+def validate_chunk_settings(size: int, overlap: int):
+    """overlap >= size зациклил бы нарезку: окно никогда не сдвигается вперёд"""
+    if size <= 0 or not 0 <= overlap < size:
+        raise ValueError(f"Нужно 0 <= перекрытие < размер чанка, а задано {overlap} и {size}")
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class Chunker:
+    """
+    Базовый чанкер: режет текст на абзацы и упаковывает их в чанки до max_tokens.
+    Перекрытие добавляется только при разрезании единицы, которая сама не влезает в бюджет.
+    """
+
+    def __init__(self, max_tokens: int = CHUNK_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS):
+        validate_chunk_settings(max_tokens, overlap_tokens)
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+
+    def split(self, text: str) -> List[str]:
+        return self._pack(self._paragraphs(text.splitlines(keepends=True)))
+
+    def _paragraphs(self, lines: List[str]) -> List[str]:
+        units, current = [], []
+        for line in lines:
+            # пустая строка после непустых закрывает абзац (и остаётся в нём)
+            if not line.strip() and current and current[-1].strip():
+                current.append(line)
+                units.append("".join(current))
+                current = []
+            else:
+                current.append(line)
+        if current:
+            units.append("".join(current))
+        return units
+
+    def _pack(self, units: List[str]) -> List[str]:
+        chunks, current, tokens = [], [], 0
+        for unit in units:
+            unit_tokens = estimate_tokens(unit)
+            if unit_tokens > self.max_tokens:
+                if current:
+                    chunks.append("".join(current))
+                    current, tokens = [], 0
+                chunks.extend(self._split_lines(unit.splitlines(keepends=True)))
+                continue
+            if current and tokens + unit_tokens > self.max_tokens:
+                chunks.append("".join(current))
+                current, tokens = [], 0
+            current.append(unit)
+            tokens += unit_tokens
+        if current:
+            chunks.append("".join(current))
+        return chunks
+
+    def _split_lines(self, lines: List[str]) -> List[str]:
+        """Режет слишком большую единицу по строкам, с перекрытием в overlap_tokens"""
+        chunks, current, tokens = [], [], 0
+        for line in lines:
+            line_tokens = estimate_tokens(line)
+            if line_tokens > self.max_tokens:
+                if current:
+                    chunks.append("".join(current))
+                    current, tokens = [], 0
+                size = self.max_tokens * CHARS_PER_TOKEN
+                chunks.extend(text_to_chunk(line, size, self.overlap_tokens * CHARS_PER_TOKEN))
+                continue
+            if current and tokens + line_tokens > self.max_tokens:
+                chunks.append("".join(current))
+                current, tokens = self._overlap_tail(current)
+            current.append(line)
+            tokens += line_tokens
+        if current:
+            chunks.append("".join(current))
+        return chunks
+
+    def _overlap_tail(self, lines: List[str]) -> tuple[List[str], int]:
+        tail, tokens = [], 0
+        for line in reversed(lines):
+            line_tokens = estimate_tokens(line)
+            if tokens + line_tokens > self.overlap_tokens:
+                break
+            tail.insert(0, line)
+            tokens += line_tokens
+        return tail, tokens
+
+
+class PythonChunker(Chunker):
+    """Python режется по границам AST: функции и классы; большой класс — по методам"""
+
+    def split(self, text: str) -> List[str]:
+        try:
+            tree = ast.parse(text)
+        except (SyntaxError, ValueError):
+            return super().split(text)
+        lines = text.splitlines(keepends=True)
+        if not tree.body:
+            return super().split(text)
+        return self._pack(self._units(lines, tree.body, 0, len(lines)))
+
+    def _units(self, lines: List[str], nodes: List[ast.stmt], lo: int, hi: int) -> List[str]:
+        """Одна единица на узел; шапка до первого узла (импорты, docstring) идёт с ним"""
+        bounds = [lo] + [self._start(lines, node, lo) for node in nodes[1:]] + [hi]
+        units = []
+        for node, start, end in zip(nodes, bounds, bounds[1:]):
+            unit_lines = lines[start:end]
+            unit = "".join(unit_lines)
+            body = getattr(node, "body", None)
+            if (estimate_tokens(unit) > self.max_tokens
+                    and isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef))
+                    and len(body) > 1):
+                units.extend(self._units(lines, body, start, end))
+            else:
+                units.append(unit)
+        return units
+
+    @staticmethod
+    def _start(lines: List[str], node: ast.stmt, lo: int) -> int:
+        start = min([node.lineno] + [d.lineno for d in getattr(node, "decorator_list", [])]) - 1
+        # комментарии прямо над определением относятся к нему
+        while start - 1 > lo and lines[start - 1].lstrip().startswith("#"):
+            start -= 1
+        return start
+
+
+CHUNKERS = {
+    ".py": PythonChunker,
+    ".pyi": PythonChunker,
+}
+
+
+def get_chunker(file_path: Optional[str] = None,
+                max_tokens: int = CHUNK_TOKENS,
+                overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> Chunker:
+    suffix = os.path.splitext(file_path)[1].lower() if file_path else ""
+    return CHUNKERS.get(suffix, Chunker)(max_tokens, overlap_tokens)
+
+
+def chunk_text(text: str, file_path: Optional[str] = None,
+               max_tokens: int = CHUNK_TOKENS,
+               overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> List[str]:
+    """Структурные чанки для файла: чанкер выбирается по расширению"""
+    return get_chunker(file_path, max_tokens, overlap_tokens).split(text)
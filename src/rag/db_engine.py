@@ -0,0 +1,141 @@
+# db_engine.py
+import threading
+import time
+from typing import Dict
+
+from pgvector.asyncpg import register_vector
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+from src.utils.config import get_config_dict
+
+DATABASE_DEFAULTS = {
+    "pool_size": 5,          # постоянных соединений на URL
+    "max_overflow": 10,      # временных сверх pool_size
+    "pool_pre_ping": True,   # проверять соединение перед выдачей (после рестарта Postgres)
+    "pool_recycle": 1800,    # секунд: пересоздавать старые соединения
+    "pool_timeout": 30,      # секунд ждать свободное соединение, потом ошибка
+}
+
+# один Engine (и один пул соединений) на URL на весь процесс
+_engines: Dict[str, Engine] = {}
+_async_engines: Dict[str, AsyncEngine] = {}
+_lock = threading.Lock()
+
+
+class _TimedPoolMixin:
+    """Считает, сколько раз и как долго ждали соединение из пула"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # соединения берут из многих потоков (эмбеддинг-воркеры, писатель) — счётчики под замком
+        self._wait_lock = threading.Lock()
+        self.wait_stats = {"checkouts": 0, "wait_total": 0.0, "wait_max": 0.0}
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            with self._wait_lock:
+                stats = self.wait_stats
+                stats["checkouts"] += 1
+                stats["wait_total"] += waited
+                stats["wait_max"] = max(stats["wait_max"], waited)
+
+    def wait_snapshot(self) -> dict:
+        with self._wait_lock:
+            return dict(self.wait_stats)
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def database_config() -> dict:
+    return {**DATABASE_DEFAULTS, **get_config_dict().get("database", {})}
+
+
+def default_db_url() -> str:
+    return get_config_dict()["memory"]["embedding_db_url"]  # "postgresql+psycopg2://..."
+
+
+def async_db_url(db_url: str) -> str:
+    """postgresql+psycopg2://... -> postgresql+asyncpg://... (та же база, асинхронный драйвер)"""
+    scheme, sep, rest = db_url.partition("://")
+    return f"postgresql+asyncpg{sep}{rest}" if scheme.startswith("postgresql") else db_url
+
+
+def get_engine(db_url: str = None) -> Engine:
+    """Общий синхронный Engine для URL: все PgVectorRAG процесса делят один пул"""
+    db_url = db_url or default_db_url()
+    with _lock:
+        engine = _engines.get(db_url)
+        if engine is None:
+            engine = create_engine(db_url, future=True, poolclass=TimedQueuePool, **database_config())
+            _engines[db_url] = engine
+        return engine
+
+
+def get_async_engine(db_url: str = None) -> AsyncEngine:
+    """Общий AsyncEngine (asyncpg) для URL, с кодеком vector на каждом соединении"""
+    if not db_url:
+        memory_config = get_config_dict()["memory"]
+        db_url = memory_config.get("async_embedding_db_url") or memory_config["embedding_db_url"]
+    db_url = async_db_url(db_url)
+    with _lock:
+        engine = _async_engines.get(db_url)
+        if engine is None:
+            engine = create_async_engine(db_url, poolclass=TimedAsyncQueuePool, **database_config())
+
+            @event.listens_for(engine.sync_engine, "connect")
+            def register_vector_codec(dbapi_connection, connection_record):
+                dbapi_connection.run_async(register_vector)
+
+            _async_engines[db_url] = engine
+        return engine
+
+
+def pool_stats() -> Dict[str, dict]:
+    """Состояние всех пулов: занято / свободно / сверх лимита и ожидание соединения"""
+    with _lock:
+        engines = [(url, engine.pool) for url, engine in _engines.items()]
+        engines += [(url, engine.sync_engine.pool) for url, engine in _async_engines.items()]
+    result = {}
+    for url, pool in engines:
+        wait = (pool.wait_snapshot() if isinstance(pool, _TimedPoolMixin)
+                else {"checkouts": 0, "wait_total": 0.0, "wait_max": 0.0})
+        name = url.split("://")[0] + "://" + url.split("@")[-1]  # без логина и пароля
+        result[name] = {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "checkouts": wait["checkouts"],
+            "wait_avg_ms": round(1000 * wait["wait_total"] / wait["checkouts"], 2) if wait["checkouts"] else 0.0,
+            "wait_max_ms": round(1000 * wait["wait_max"], 2),
+        }
+    return result
+
+
+def dispose_engines():
+    """Закрывает синхронные пулы (асинхронные — dispose_async_engines)"""
+    with _lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+
+
+async def dispose_async_engines():
+    with _lock:
+        engines = list(_async_engines.values())
+        _async_engines.clear()
+    for engine in engines:
+        await engine.dispose()
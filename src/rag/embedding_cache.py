@@ -0,0 +1,90 @@
+# embedding_cache.py
+import hashlib
+import pathlib
+import unicodedata
+from array import array
+from typing import List, Optional, Dict
+
+from diskcache import Cache
+
+DEFAULT_CACHE_DIR = ".cache/embeddings"
+DEFAULT_SIZE_LIMIT_MB = 1024
+
+
+class EmbeddingCache:
+    """
+    Дисковый кэш эмбеддингов перед сервером эмбеддингов.
+    Ключ — имя модели + sha256 нормализованного текста, поэтому одинаковые чанки
+    из разных файлов и повторяющиеся situation считаются один раз.
+    Каталог общий для всех моделей: векторы прежней модели не сбрасываются, а вытесняются по LRU.
+    Размер ограничен, при переполнении вытесняются давно не читанные записи (LRU).
+    """
+
+    def __init__(self, model_name: str,
+                 directory: str = DEFAULT_CACHE_DIR,
+                 size_limit_mb: int = DEFAULT_SIZE_LIMIT_MB):
+        self.model_name = model_name
+        self.directory = pathlib.Path(directory)
+        if not self.directory.is_absolute():
+            self.directory = pathlib.Path(__file__).resolve().parents[2] / self.directory
+        self.cache = Cache(
+            str(self.directory),
+            size_limit=size_limit_mb * 1024 * 1024,
+            eviction_policy="least-recently-used",
+        )
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_config(cls, config: dict, model: str) -> Optional["EmbeddingCache"]:
+        cache_config = config.get("embedding_cache", {})
+        if not cache_config.get("enabled", True):
+            return None
+        return cls(
+            model_name=config[model]["model"],
+            directory=cache_config.get("directory", DEFAULT_CACHE_DIR),
+            size_limit_mb=cache_config.get("size_limit_mb", DEFAULT_SIZE_LIMIT_MB),
+        )
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return unicodedata.normalize("NFC", text).replace("\r\n", "\n").strip()
+
+    def key(self, text: str) -> str:
+        digest = hashlib.sha256(self.normalize(text).encode("utf-8")).hexdigest()
+        return f"{self.model_name}:{digest}"
+
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        result = []
+        for text in texts:
+            raw = self.cache.get(self.key(text))
+            if raw is None:
+                self.misses += 1
+                result.append(None)
+            else:
+                self.hits += 1
+                result.append(array("f", raw).tolist())
+        return result
+
+    def set_many(self, texts: List[str], embeddings: List[Optional[List[float]]]):
+        for text, emb in zip(texts, embeddings):
+            if emb:
+                # float32, как и в pgvector — вдвое компактнее pickle списка float
+                self.cache.set(self.key(text), array("f", emb).tobytes())
+
+    def invalidate(self):
+        """Сбросить весь кэш (всех моделей)"""
+        self.cache.clear()
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self.cache),
+            "size_bytes": self.cache.volume(),
+        }
+
+    def close(self):
+        self.cache.close()
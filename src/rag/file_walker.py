@@ -0,0 +1,175 @@
+# file_walker.py
+import hashlib
+import mmap
+import os
+import re
+from typing import Iterator, List, Optional, Tuple
+
+BINARY_SNIFF_BYTES = 8192           # по стольким первым байтам решаем, бинарный ли файл
+MAX_FILE_SIZE = 2 * 1024 * 1024     # файлы больше не индексируем
+MMAP_THRESHOLD = 1024 * 1024        # файлы больше читаем через mmap
+BINARY_HASH = "binary"              # метка в манифесте вместо хэша для бинарных файлов
+
+
+def translate_gitignore(pattern: str) -> str:
+    """
+    Шаблон .gitignore → регулярное выражение по пути от каталога .gitignore.
+    В отличие от fnmatch, * и ? не переходят через /, а ** — любое число каталогов:
+    «**/x» — x на любой глубине, «x/**» — всё внутри x, «a/**/b» — b в a или глубже.
+    """
+    out, i, n = [], 0, len(pattern)
+    while i < n:
+        if pattern.startswith("**/", i) and (i == 0 or pattern[i - 1] == "/"):
+            out.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("**", i) and i + 2 == n and (i == 0 or pattern[i - 1] == "/"):
+            out.append(".*")
+            i += 2
+            continue
+        ch = pattern[i]
+        if ch == "*":
+            out.append("[^/]*")
+        elif ch == "?":
+            out.append("[^/]")
+        elif ch == "\\" and i + 1 < n:
+            i += 1
+            out.append(re.escape(pattern[i]))
+        elif ch == "[" and pattern.find("]", i + 2) > 0:
+            end = pattern.find("]", i + 2)  # ] сразу после [ — символ класса
+            body = pattern[i + 1:end].replace("\\", "\\\\")
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            out.append(f"[{body}]")
+            i = end
+        else:
+            out.append(re.escape(ch))
+        i += 1
+    return "".join(out)
+
+
+class GitIgnoreRule:
+    def __init__(self, pattern: str):
+        self.negate = pattern.startswith("!")
+        if self.negate:
+            pattern = pattern[1:]
+        self.dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        # шаблон со слэшем привязан к каталогу .gitignore, без слэша — к имени на любой глубине
+        anchored = "/" in pattern
+        regex = translate_gitignore(pattern.lstrip("/"))
+        self.regex = re.compile(regex if anchored else f"(?:.*/)?{regex}", re.DOTALL)
+
+    def matches(self, rel_path: str, is_dir: bool) -> bool:
+        if self.dir_only and not is_dir:
+            return False
+        return self.regex.fullmatch(rel_path) is not None
+
+
+class GitIgnore:
+    """Минимальная поддержка .gitignore одного каталога: шаблоны с **, !отрицание, / в начале и в конце"""
+
+    def __init__(self, base: str, lines: List[str]):
+        self.base = base
+        self.rules = [
+            GitIgnoreRule(line.strip())
+            for line in lines
+            if line.strip() and not line.startswith("#")
+        ]
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["GitIgnore"]:
+        path = os.path.join(directory, ".gitignore")
+        try:
+            with open(path, encoding="utf-8", errors="ignore") as f:
+                return cls(directory, f.read().splitlines())
+        except OSError:
+            return None
+
+    def match(self, path: str, is_dir: bool) -> Optional[bool]:
+        """True/False — решение последнего сработавшего правила, None — ни одно не сработало"""
+        rel_path = os.path.relpath(path, self.base).replace(os.sep, "/")
+        result = None
+        for rule in self.rules:
+            if rule.matches(rel_path, is_dir):
+                result = not rule.negate
+        return result
+
+
+def is_ignored(gitignores: List[GitIgnore], path: str, is_dir: bool) -> bool:
+    ignored = False
+    for gitignore in gitignores:  # от корня к глубине — более глубокий .gitignore главнее
+        decision = gitignore.match(path, is_dir)
+        if decision is not None:
+            ignored = decision
+    return ignored
+
+
+def walk_files(root: str,
+               ignore_dirs: set,
+               ignore_ext: set,
+               max_file_size: int = MAX_FILE_SIZE,
+               respect_gitignore: bool = True) -> Iterator[Tuple[str, os.stat_result]]:
+    """
+    Потоковый обход на os.scandir: отдаёт (путь, stat) по одному файлу.
+    Игнорируемые и скрытые каталоги отсекаются до спуска в них, так что
+    node_modules, .git и build не обходятся вовсе и список файлов не копится в памяти.
+    """
+    stack: List[Tuple[str, List[GitIgnore]]] = [(root, [])]
+    while stack:
+        directory, gitignores = stack.pop()
+        if respect_gitignore:
+            gitignore = GitIgnore.load(directory)
+            if gitignore:
+                gitignores = gitignores + [gitignore]
+        try:
+            entries = os.scandir(directory)
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        # скрытые каталоги (.git, .venv, .idea) не обходятся; скрытые файлы решают шаблоны
+                        if (entry.name.startswith(".") or entry.name in ignore_dirs
+                                or is_ignored(gitignores, entry.path, True)):
+                            continue
+                        stack.append((entry.path, gitignores))
+                    elif entry.is_file(follow_symlinks=False):
+                        if os.path.splitext(entry.name)[1].lower() in ignore_ext:
+                            continue
+                        if is_ignored(gitignores, entry.path, False):
+                            continue
+                        stat = entry.stat()
+                        if stat.st_size > max_file_size:
+                            continue
+                        yield entry.path, stat
+                except OSError:
+                    continue
+
+
+def is_binary(head: bytes) -> bool:
+    """Нулевой байт в начале файла — почти наверняка не текст"""
+    return b"\0" in head
+
+
+def read_text_file(file_path: str, size: int) -> Tuple[Optional[str], str]:
+    """
+    Читает текстовый файл для индексации.
+    Возвращает (текст, хэш) или (None, BINARY_HASH) для бинарных файлов.
+    Хэш — md5(путь + содержимое), как Embedder.file_id. Большие файлы читаются через mmap:
+    хэш и декодирование идут прямо по отображению, без промежуточной копии байтов.
+    """
+    hasher = hashlib.md5()
+    hasher.update(file_path.encode("utf-8"))
+    with open(file_path, "rb") as f:
+        head = f.read(BINARY_SNIFF_BYTES)
+        if is_binary(head):
+            return None, BINARY_HASH
+        if size < MMAP_THRESHOLD or len(head) < BINARY_SNIFF_BYTES:
+            data = head + f.read()
+            hasher.update(data)
+            return data.decode("utf-8", errors="ignore"), hasher.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            hasher.update(mm)
+            return str(mm, "utf-8", "ignore"), hasher.hexdigest()
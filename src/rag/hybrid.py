@@ -0,0 +1,112 @@
+# hybrid.py
+import heapq
+import math
+import re
+from collections import Counter
+from typing import Callable, Dict, Hashable, List, Tuple
+
+RRF_K = 60               # сглаживание в reciprocal rank fusion (значение из статьи Cormack et al.)
+MAX_LEXICAL_TERMS = 32   # столько самых «говорящих» слов запроса идёт в лексический поиск
+MEMORY_MIN_RANK = 0.2    # порог ts_rank_cd для лексических находок в памяти (одно совпадение даёт 0.1)
+MEMORY_MIN_BM25 = 3.0    # то же для BM25 (numpy)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_WORD_RE = re.compile(r"\w+(?:[./\-]\w+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Слова в нижнем регистре; идентификаторы и имена файлов дают и целое слово, и его части"""
+    tokens = []
+    for word in _WORD_RE.findall(text.lower()):
+        tokens.append(word)
+        parts = re.split(r"[_./\-]", word)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part)
+    return tokens
+
+
+def lexical_terms(text: str, limit: int = MAX_LEXICAL_TERMS, exclude: str = None) -> List[str]:
+    """
+    Термы для лексического запроса: сначала идентификаторы, пути и строки с цифрами
+    (ровно то, что эмбеддинги теряют), потом длинные слова.
+    exclude — текст, слова которого в запрос не берутся (цель задачи: она есть в каждой записи памяти).
+    """
+    words = dict.fromkeys(_WORD_RE.findall(text))  # уникальные, в порядке появления
+    skip = {word.lower() for word in _WORD_RE.findall(exclude)} if exclude else set()
+    ranked = sorted(
+        (word for word in words if len(word) > 2 and word.lower() not in skip),
+        key=lambda word: (bool(re.search(r"[_./\-\d]|[a-z][A-Z]", word)), len(word)),
+        reverse=True,
+    )
+    return ranked[:limit]
+
+
+def rrf_fuse(ranked_lists: List[list], key: Callable[[object], Hashable],
+             k: int = RRF_K, top_k: int = None) -> list:
+    """
+    Reciprocal rank fusion: score = сумма 1 / (k + ранг) по всем спискам.
+    Возвращает объединённый список (первое вхождение каждого объекта), score кладётся в item.score.
+    """
+    scores: Dict[Hashable, float] = {}
+    items: Dict[Hashable, object] = {}
+    for ranked in ranked_lists:
+        for rank, item in enumerate(ranked, start=1):
+            item_key = key(item)
+            scores[item_key] = scores.get(item_key, 0.0) + 1.0 / (k + rank)
+            items.setdefault(item_key, item)
+    fused = sorted(items, key=lambda item_key: scores[item_key], reverse=True)
+    if top_k is not None:
+        fused = fused[:top_k]
+    result = []
+    for item_key in fused:
+        item = items[item_key]
+        item.score = scores[item_key]
+        result.append(item)
+    return result
+
+
+class BM25Index:
+    """Инкрементальный BM25 в памяти — лексический поиск для NumpyVectorRAG"""
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[Hashable, int]] = {}
+        self.doc_len: Dict[Hashable, int] = {}
+        self.total_len = 0
+
+    def add(self, doc_id: Hashable, text: str):
+        counts = Counter(tokenize(text))
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+        length = sum(counts.values())
+        self.doc_len[doc_id] = length
+        self.total_len += length
+
+    def remove(self, doc_id: Hashable, text: str):
+        if doc_id not in self.doc_len:
+            return
+        for term in set(tokenize(text)):
+            docs = self.postings.get(term)
+            if docs:
+                docs.pop(doc_id, None)
+                if not docs:
+                    del self.postings[term]
+        self.total_len -= self.doc_len.pop(doc_id)
+
+    def search(self, query: str, top_k: int, min_score: float = None) -> List[Tuple[Hashable, float]]:
+        n_docs = len(self.doc_len)
+        if not n_docs:
+            return []
+        avg_len = self.total_len / n_docs
+        scores: Dict[Hashable, float] = {}
+        for term in set(tokenize(" ".join(lexical_terms(query)))):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf in docs.items():
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len[doc_id] / avg_len)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+        if min_score is not None:
+            scores = {doc_id: score for doc_id, score in scores.items() if score >= min_score}
+        return heapq.nlargest(top_k, scores.items(), key=lambda pair: pair[1])
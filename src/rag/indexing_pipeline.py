@@ -0,0 +1,328 @@
+# indexing_pipeline.py
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, Future
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional, Dict, List
+
+from src.rag.chunker import text_to_chunk, chunk_text, validate_chunk_settings, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS
+from src.rag.file_walker import walk_files, read_text_file, MAX_FILE_SIZE
+from src.rag.models import Chunk, FileManifest
+
+MIN_CHUNK_CHARS = 50   # более короткие чанки не индексируем
+_STOP = object()       # сигнал завершения для очередей
+
+
+@dataclass
+class FileJob:
+    """Результат стадии чтения/чанкинга одного файла"""
+    file_path: str
+    source: str
+    mtime: float
+    size: int
+    content_hash: Optional[str] = None
+    chunks: List[tuple[int, str]] = field(default_factory=list)  # (chunk_index, текст)
+    unchanged: bool = False  # хэш совпал с манифестом — эмбеддить нечего
+    error: Optional[str] = None
+
+
+@dataclass
+class EmbeddedFile:
+    """Файл после стадии эмбеддингов — готов к записи в БД"""
+    manifest: FileManifest
+    chunks: List[Chunk]
+    indices: Optional[List[int]]  # None — содержимое не менялось, чанки не трогаем
+    failed: bool  # часть чанков без эмбеддинга — манифест не фиксируем
+
+
+def read_and_chunk(file_path: str, source: str, mtime: float, size: int,
+                   known_hash: Optional[str] = None,
+                   chunker: str = "structure",
+                   max_tokens: int = CHUNK_TOKENS,
+                   overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> FileJob:
+    """
+    Стадия чтения: читает файл, считает хэш (как Embedder.file_id) и режет на чанки.
+    Бинарные файлы распознаются по первым байтам и дают пустой список чанков.
+    Функция модуля, чтобы её можно было отдавать в ProcessPoolExecutor.
+    """
+    job = FileJob(file_path=file_path, source=source, mtime=mtime, size=size)
+    try:
+        content, job.content_hash = read_text_file(file_path, size)
+    except Exception as e:
+        job.error = str(e)
+        return job
+
+    if job.content_hash == known_hash:
+        job.unchanged = True
+        return job
+    if content is None:
+        return job
+
+    if chunker == "fixed":
+        texts = text_to_chunk(content)
+    else:
+        texts = chunk_text(content, file_path, max_tokens, overlap_tokens)
+    job.chunks = [
+        (idx, text)
+        for idx, text in enumerate(texts)
+        if len(text.strip()) >= MIN_CHUNK_CHARS
+    ]
+    return job
+
+
+class IndexingStats:
+    """Счётчики прогресса, общие для всех стадий"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.counters: Dict[str, int] = {
+            "files_seen": 0, "files_skipped": 0, "files_read": 0, "files_failed": 0,
+            "chunks_embedded": 0, "chunks_written": 0, "files_written": 0, "files_removed": 0,
+        }
+
+    def add(self, name: str, value: int = 1):
+        with self.lock:
+            self.counters[name] += value
+
+    def report(self, queues: Dict[str, queue.Queue] = None) -> str:
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        with self.lock:
+            c = dict(self.counters)
+        line = (f"[{elapsed:7.1f}s] файлов: {c['files_seen']} "
+                f"(пропущено {c['files_skipped']}, записано {c['files_written']}, ошибок {c['files_failed']}) | "
+                f"чанков: эмбеддинг {c['chunks_embedded']} ({c['chunks_embedded'] / elapsed:.1f}/с), "
+                f"запись {c['chunks_written']} ({c['chunks_written'] / elapsed:.1f}/с)")
+        if queues:
+            line += " | очереди: " + ", ".join(f"{name}={q.qsize()}" for name, q in queues.items())
+        return line
+
+
+class IndexingPipeline:
+    """
+    Конвейер индексации для Embedder.scan_directory:
+    обход -> чтение/чанкинг (пул процессов или потоков) -> N потоков эмбеддингов -> один писатель в БД.
+    Стадии связаны ограниченными очередями: если БД или сервер эмбеддингов не успевают,
+    обход останавливается, и память не растёт на больших репозиториях.
+    """
+
+    def __init__(self, embedder, rag, config: dict = None,
+                 ignore_dirs: set = frozenset(), ignore_ext: set = frozenset()):
+        config = config or {}
+        self.ignore_dirs = ignore_dirs
+        self.ignore_ext = ignore_ext
+        self.max_file_size = config.get("max_file_size_kb", MAX_FILE_SIZE // 1024) * 1024
+        self.respect_gitignore = config.get("respect_gitignore", True)
+        self.chunker = config.get("chunker", "structure")
+        self.chunk_tokens = config.get("chunk_tokens", CHUNK_TOKENS)
+        self.chunk_overlap_tokens = config.get("chunk_overlap_tokens", CHUNK_OVERLAP_TOKENS)
+        # ошибку в [indexing] показываем сразу, а не как «не удалось прочитать» каждого файла
+        validate_chunk_settings(self.chunk_tokens, self.chunk_overlap_tokens)
+        self.embedder = embedder
+        self.rag = rag
+        self.reader_workers = config.get("reader_workers", 4)
+        self.use_processes = config.get("use_processes", True)
+        self.embed_workers = config.get("embed_workers", 4)
+        self.queue_size = config.get("queue_size", 64)
+        self.write_batch_size = config.get("write_batch_size", 500)
+        self.report_interval = config.get("report_interval", 5.0)
+        self.embed_batch_size = embedder.config[embedder.model].get("batch_size", 64)
+
+        self.root: Optional[Path] = None
+        self.stats = IndexingStats()
+        self.embed_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        self.write_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        self._done = threading.Event()
+        self._writer_error: Optional[BaseException] = None  # поток записи упал — индексация останавливается
+
+    def run(self, root: Path) -> IndexingStats:
+        self.root = root
+        manifest = self.rag.load_manifest(str(root))
+        seen: set[str] = set()
+
+        embedders = [threading.Thread(target=self._embed_worker, name=f"embed-{i}", daemon=True)
+                     for i in range(self.embed_workers)]
+        writer = threading.Thread(target=self._writer, name="db-writer", daemon=True)
+        reporter = threading.Thread(target=self._reporter, name="progress", daemon=True)
+        for thread in embedders + [writer, reporter]:
+            thread.start()
+
+        pool_cls = ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+        try:
+            with pool_cls(max_workers=self.reader_workers) as pool:
+                self._produce(root, manifest, seen, pool)
+        finally:
+            for _ in embedders:
+                self.embed_queue.put(_STOP)
+            for thread in embedders:
+                thread.join()
+            self.write_queue.put(_STOP)
+            writer.join()
+            self._done.set()
+            reporter.join()
+        self._raise_writer_error()
+
+        # Файлы, которые пропали с диска (или стали игнорироваться)
+        for key in manifest.keys() - seen:
+            self.rag.delete_file(key)
+            self.stats.add("files_removed")
+        self.rag.commit()
+        print(self.stats.report())
+        return self.stats
+
+    # --- Стадия 1: обход и чтение ---
+
+    def _produce(self, root: Path, manifest: Dict[str, FileManifest], seen: set, pool):
+        inflight: deque[Future] = deque()  # не больше queue_size файлов в работе у пула
+        files = walk_files(str(root), self.ignore_dirs, self.ignore_ext,
+                           max_file_size=self.max_file_size,
+                           respect_gitignore=self.respect_gitignore)
+        for key, stat in files:
+            self._raise_writer_error()  # писать некуда — дальше не читаем
+            seen.add(key)
+            self.stats.add("files_seen")
+            entry = manifest.get(key)
+            if entry and entry.mtime == stat.st_mtime and entry.size == stat.st_size:
+                self.stats.add("files_skipped")
+                continue
+
+            inflight.append(pool.submit(
+                read_and_chunk, key, os.path.relpath(key, root),
+                stat.st_mtime, stat.st_size, entry.content_hash if entry else None,
+                self.chunker, self.chunk_tokens, self.chunk_overlap_tokens,
+            ))
+            while len(inflight) >= self.queue_size:
+                self._dispatch(inflight.popleft().result(), manifest)
+        while inflight:
+            self._dispatch(inflight.popleft().result(), manifest)
+
+    def _dispatch(self, job: FileJob, manifest: Dict[str, FileManifest]):
+        if job.error:
+            print(f"Не удалось прочитать {job.file_path}: {job.error}")
+            self.stats.add("files_failed")
+            return
+        self.stats.add("files_read")
+        if job.unchanged:
+            # содержимое то же (например, touch) — обновляем только mtime
+            entry = manifest[job.file_path]
+            entry.mtime, entry.size = job.mtime, job.size
+            self.write_queue.put(EmbeddedFile(manifest=entry, chunks=[], indices=None, failed=False))
+            self.stats.add("files_skipped")
+            return
+        self.embed_queue.put(job)  # блокируется, если эмбеддеры не успевают
+
+    # --- Стадия 2: эмбеддинги ---
+
+    def _embed_worker(self):
+        stop = False
+        while not stop:
+            jobs = [self.embed_queue.get()]
+            if jobs[0] is _STOP:
+                return
+            # добираем мелкие файлы до размера пачки, чтобы не слать по запросу на файл
+            while sum(len(job.chunks) for job in jobs) < self.embed_batch_size:
+                try:
+                    job = self.embed_queue.get_nowait()
+                except queue.Empty:
+                    break
+                if job is _STOP:
+                    stop = True
+                    break
+                jobs.append(job)
+
+            texts = [text for job in jobs for _, text in job.chunks]
+            try:
+                embeddings = self.embedder.get_embeddings(texts)
+            except Exception as e:
+                print(f"Ошибка эмбеддинга пачки: {e}")
+                embeddings = [None] * len(texts)
+            self.stats.add("chunks_embedded", sum(1 for emb in embeddings if emb))
+
+            offset = 0
+            for job in jobs:
+                job_embeddings = embeddings[offset:offset + len(job.chunks)]
+                offset += len(job.chunks)
+                self.write_queue.put(self._to_embedded_file(job, job_embeddings))
+
+    def _to_embedded_file(self, job: FileJob, embeddings: list) -> EmbeddedFile:
+        chunks = [
+            Chunk(file_path=job.file_path, source=job.source, chunk_index=idx,
+                  content=chunk_text, embedding=emb)
+            for (idx, chunk_text), emb in zip(job.chunks, embeddings)
+            if emb
+        ]
+        return EmbeddedFile(
+            manifest=FileManifest(
+                file_path=job.file_path,
+                root=str(self.root),
+                content_hash=job.content_hash,
+                mtime=job.mtime,
+                size=job.size,
+                chunk_count=len(job.chunks),
+            ),
+            chunks=chunks,
+            indices=[idx for idx, _ in job.chunks],
+            failed=len(chunks) != len(job.chunks),
+        )
+
+    # --- Стадия 3: запись в БД (один поток — одна сессия) ---
+
+    def _writer(self):
+        item = None
+        try:
+            batch: List[EmbeddedFile] = []
+            pending_chunks = 0
+            while True:
+                item = self.write_queue.get()
+                if item is _STOP:
+                    break
+                batch.append(item)
+                pending_chunks += len(item.chunks)
+                if pending_chunks >= self.write_batch_size:
+                    self._write(batch)
+                    batch, pending_chunks = [], 0
+            if batch:
+                self._write(batch)
+        except BaseException as e:
+            # упал и rollback (или что-то вне _write): ошибку забирает run, а очередь разбирается до _STOP,
+            # чтобы эмбеддеры не встали навсегда на полной write_queue
+            self._writer_error = e
+            print(f"Поток записи остановлен: {e}")
+            while item is not _STOP:
+                item = self.write_queue.get()
+
+    def _raise_writer_error(self):
+        if self._writer_error is not None:
+            raise self._writer_error
+
+    def _write(self, batch: List[EmbeddedFile]):
+        try:
+            self.rag.bulk_upsert_chunks([chunk for item in batch for chunk in item.chunks])
+            for item in batch:
+                # indices is None — touch без изменений: чанки не трогаем, в манифест идёт только mtime
+                if item.indices:
+                    # индексы неудавшихся чанков тоже в indices — их старые строки остаются
+                    self.rag.delete_stale_chunks(item.manifest.file_path, item.indices)
+                elif item.indices is not None:
+                    # файл изменился и чанков не осталось (опустел, стал бинарным)
+                    self.rag.delete_file_chunks(item.manifest.file_path)
+                # файл с неудачными эмбеддингами не фиксируем — он переиндексируется в следующий раз
+                if not item.failed:
+                    self.rag.save_manifest(item.manifest)
+            self.rag.commit()
+        except Exception as e:
+            print(f"Ошибка записи в БД: {e}")
+            self.rag.rollback()
+            self.stats.add("files_failed", len(batch))
+            return
+        self.stats.add("files_written", len(batch))
+        self.stats.add("chunks_written", sum(len(item.chunks) for item in batch))
+
+    def _reporter(self):
+        queues = {"embed": self.embed_queue, "write": self.write_queue}
+        while not self._done.wait(self.report_interval):
+            print(self.stats.report(queues))
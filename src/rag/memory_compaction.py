@@ -0,0 +1,71 @@
+# memory_compaction.py
+from typing import Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_NAMESPACE = "default"
+DEDUP_DISTANCE = 0.03           # косинусное расстояние, ближе которого ситуации считаются одной
+DEDUP_NEIGHBORS = 10            # сколько ближайших соседей каждой записи проверяется на дубль (pgvector)
+HALF_LIFE_DAYS = 14.0           # за столько дней без использования ценность памяти падает вдвое
+MIN_SCORE = 0.25                # память с меньшей ценностью удаляется компакцией
+MAX_ROWS_PER_NAMESPACE = 5000   # потолок строк памяти в одном namespace
+
+
+class CompactionPolicy:
+    """
+    Политика компакции памяти агента (memory_chunks), общая для PgVectorRAG и NumpyVectorRAG:
+      - при записи: та же ситуация (ближе dedup_distance) с тем же действием — не новая строка,
+        а hit_count + 1 и success_count + успех у существующей;
+      - compact_memory: слияние накопившихся дублей, удаление памяти с низкой ценностью,
+        потолок строк на namespace.
+    Ценность = (hit_count + success_count) * 0.5 ^ (дней с последнего использования / half_life_days).
+    """
+
+    def __init__(self,
+                 dedup_distance: Optional[float] = DEDUP_DISTANCE,
+                 half_life_days: float = HALF_LIFE_DAYS,
+                 min_score: float = MIN_SCORE,
+                 max_rows_per_namespace: Optional[int] = MAX_ROWS_PER_NAMESPACE,
+                 dedup_neighbors: int = DEDUP_NEIGHBORS):
+        self.dedup_distance = dedup_distance
+        self.half_life_days = half_life_days
+        self.min_score = min_score
+        self.max_rows_per_namespace = max_rows_per_namespace
+        self.dedup_neighbors = dedup_neighbors
+
+    @classmethod
+    def from_config(cls, config: dict) -> "CompactionPolicy":
+        compaction_config = config.get("memory_compaction", {})
+        return cls(compaction_config.get("dedup_distance", DEDUP_DISTANCE),
+                   compaction_config.get("half_life_days", HALF_LIFE_DAYS),
+                   compaction_config.get("min_score", MIN_SCORE),
+                   compaction_config.get("max_rows_per_namespace", MAX_ROWS_PER_NAMESPACE),
+                   compaction_config.get("dedup_neighbors", DEDUP_NEIGHBORS))
+
+    def score(self, hit_count: int, success_count: int, age_days: float) -> float:
+        return (hit_count + success_count) * 0.5 ** (max(age_days, 0.0) / self.half_life_days)
+
+
+def group_duplicates(pairs: Iterable[Tuple[int, int]]) -> Dict[int, List[int]]:
+    """
+    Пары (id, id) близких записей -> {оставляемый id: [id дублей]}.
+    Цепочки a~b~c сливаются в одну группу, остаётся самый старый (меньший) id.
+    """
+    parent: Dict[int, int] = {}
+
+    def find(x: int) -> int:
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b in pairs:
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[max(ra, rb)] = min(ra, rb)
+
+    groups: Dict[int, List[int]] = {}
+    for x in parent:
+        root = find(x)
+        if root != x:
+            groups.setdefault(root, []).append(x)
+    return groups
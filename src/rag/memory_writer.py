@@ -0,0 +1,121 @@
+# memory_writer.py
+import asyncio
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+MEMORY_BATCH_SIZE = 16        # записей в одной транзакции
+MEMORY_FLUSH_INTERVAL = 2.0   # секунд: неполная пачка пишется не позже этого
+MEMORY_QUEUE_SIZE = 256       # при полной очереди put() ждёт — агент не убегает вперёд записи
+
+_STOP = object()
+
+
+class MemoryWriteQueue:
+    """
+    Отложенная запись памяти агента (write-behind).
+    Записи копятся в ограниченной asyncio.Queue и уходят пачками — по количеству или по времени:
+    эмбеддинги всей пачки одним запросом (кроме уже посчитанных при поиске), вставка одной транзакцией.
+    close() дописывает всё, что осталось в очереди.
+    on_written(chunks) вызывается после коммита каждой пачки — память уже видна поиску.
+    """
+
+    def __init__(self, embedder,
+                 batch_size: int = MEMORY_BATCH_SIZE,
+                 flush_interval: float = MEMORY_FLUSH_INTERVAL,
+                 queue_size: int = MEMORY_QUEUE_SIZE,
+                 on_written: Callable[[list], None] = None):
+        self.embedder = embedder
+        self.on_written = on_written
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+        self.stats = {"queued": 0, "written": 0, "failed": 0, "batches": 0, "embeddings_reused": 0}
+
+    @classmethod
+    def from_config(cls, embedder, config: dict, on_written: Callable[[list], None] = None) -> "MemoryWriteQueue":
+        writer_config = config.get("memory_writer", {})
+        return cls(embedder,
+                   writer_config.get("batch_size", MEMORY_BATCH_SIZE),
+                   writer_config.get("flush_interval", MEMORY_FLUSH_INTERVAL),
+                   writer_config.get("queue_size", MEMORY_QUEUE_SIZE),
+                   on_written)
+
+    def _ensure_started(self):
+        # очередь и задача создаются внутри работающего event loop
+        if self.task is None:
+            self.queue = asyncio.Queue(self.queue_size)
+            self.task = asyncio.create_task(self._run())
+
+    async def put(self, item: Dict, embedding: Optional[List[float]] = None):
+        """item — аргументы Embedder.save_memory_chunk; embedding — если situation уже эмбеддили"""
+        self._ensure_started()
+        await self.queue.put((item, embedding))
+        self.stats["queued"] += 1
+
+    async def flush(self):
+        """Ждёт, пока записано всё, что уже поставлено в очередь"""
+        if self.task is not None:
+            await self.queue.join()
+
+    async def close(self):
+        if self.task is None:
+            return
+        await self.queue.put(_STOP)
+        await self.task
+        self.task = None
+        print(f"Память агента: {self.stats}")
+
+    async def _run(self):
+        while True:
+            batch: List[Tuple[Dict, Optional[List[float]]]] = []
+            entry = await self.queue.get()
+            stop = entry is _STOP
+            if not stop:
+                batch.append(entry)
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        entry = await asyncio.wait_for(self.queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                    if entry is _STOP:
+                        stop = True
+                        break
+                    batch.append(entry)
+            if batch:
+                await self._write(batch)
+            for _ in range(len(batch) + stop):
+                self.queue.task_done()
+            if stop:
+                return
+
+    async def _write(self, batch: List[Tuple[Dict, Optional[List[float]]]]):
+        try:
+            missing = [i for i, (_, emb) in enumerate(batch) if emb is None]
+            embeddings = [emb for _, emb in batch]
+            self.stats["embeddings_reused"] += len(batch) - len(missing)
+            if missing:
+                computed = await self.embedder.aget_embeddings([batch[i][0]["situation"] for i in missing])
+                for i, emb in zip(missing, computed):
+                    embeddings[i] = emb
+            chunks = []
+            for (item, _), emb in zip(batch, embeddings):
+                if not emb:
+                    print("Не удалось получить эмбеддинг для памяти")
+                    self.stats["failed"] += 1
+                    continue
+                chunks.append(self.embedder.memory_chunk(item, emb))
+            await self.embedder.async_rag.save_memory_chunks(chunks)
+            self.stats["written"] += len(chunks)
+            self.stats["batches"] += 1
+            if self.on_written is not None and chunks:
+                self.on_written(chunks)
+        except Exception as e:
+            # ошибка записи не должна останавливать очередь (и агента, который ждёт в put)
+            print(f"Ошибка записи памяти ({len(batch)} записей): {e}")
+            self.stats["failed"] += len(batch)
@@ -1,10 +1,13 @@
 # models.py
-from sqlalchemy import Column, Integer, String, Text, DateTime, Index, Boolean
+from sqlalchemy import Column, Integer, String, Text, DateTime, Index, Boolean, Float, BigInteger
 from sqlalchemy.sql import func
 from pgvector.sqlalchemy import Vector
 from sqlalchemy.orm import DeclarativeBase
 
 
+EMBEDDING_DIM = 768  # nomic-embed-text-v1.5
+
+
 class Base(DeclarativeBase):
     pass
 
@@ -16,7 +19,7 @@ class Chunk(Base):
     source = Column(String, index=True)  # относительный путь
     chunk_index = Column(Integer, nullable=False)
     content = Column(Text, nullable=False)
-    embedding = Column(Vector(768))  # nomic-embed-text-v1.5
+    embedding = Column(Vector(EMBEDDING_DIM))  # nomic-embed-text-v1.5
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -25,6 +28,21 @@ class Chunk(Base):
         Index('ix_unique_chunk', 'file_path', 'chunk_index', unique=True),
     )
 
+    distance = None  # косинусное расстояние до запроса — заполняет поиск, в базе не хранится
+    score = None  # RRF-оценка гибридного поиска — тоже только в памяти
+
+class FileManifest(Base):
+    """Манифест проиндексированных файлов — чтобы при пересканировании пропускать неизменённые"""
+    __tablename__ = "code_files"
+    file_path = Column(String, primary_key=True)  # абсолютный путь, как в Chunk.file_path
+    root = Column(String, index=True, nullable=False)  # корень сканирования
+    content_hash = Column(String(32), nullable=False)  # Embedder.file_id: md5(путь + содержимое)
+    mtime = Column(Float, nullable=False)
+    size = Column(BigInteger, nullable=False)
+    chunk_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
 class MemoryChunk(Base):
     __tablename__ = "memory_chunks"
 
@@ -46,8 +64,21 @@ class MemoryChunk(Base):
     action_plan = Column(Text)
 
     # Чанк для поиска похожих рассуждений
-    embedding = Column(Vector(768))
+    embedding = Column(Vector(EMBEDDING_DIM))
 
     # Метаданные
-    success = Column(Boolean, default=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    success = Column(Boolean, default=True)  # исход последнего раза
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # Компакция: почти одинаковые ситуации сливаются в одну строку со счётчиками
+    namespace = Column(String, nullable=False, default="default", server_default="default")
+    hit_count = Column(Integer, nullable=False, default=1, server_default="1")  # сколько раз встречалась
+    success_count = Column(Integer, nullable=False, default=0, server_default="0")  # из них успешно
+    last_used_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index('ix_memory_chunks_namespace', 'namespace', 'action_description'),
+    )
+
+    distance = None  # косинусное расстояние до запроса — заполняет поиск, в базе не хранится
+    score = None  # RRF-оценка гибридного поиска — тоже только в памяти
\ No newline at end of file
@@ -0,0 +1,535 @@
+# numpy_vector_store.py
+import json
+import os
+import pathlib
+import threading
+from datetime import datetime, timezone
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
+
+from src.rag.hybrid import BM25Index, MEMORY_MIN_BM25, lexical_terms
+from src.rag.memory_compaction import CompactionPolicy, group_duplicates, DEFAULT_NAMESPACE
+from src.rag.models import Chunk, MemoryChunk, FileManifest
+from src.utils.config import get_config_dict
+
+DEFAULT_STORE_DIR = ".cache/vector_store"
+TABLE_NAME = "code_chunks"
+MEMORY_TABLE_NAME = "memory_chunks"
+MANIFEST_FILE = "code_files.json"
+
+CHUNK_FIELDS = ("id", "file_path", "source", "chunk_index", "content")
+MEMORY_FIELDS = ("id", "situation", "action_description", "result_summary",
+                 "reasoning", "action_plan", "success", "created_at",
+                 "namespace", "hit_count", "success_count", "last_used_at")
+DEDUP_CANDIDATES = 16  # ближайших записей, среди которых ищется дубль с тем же действием
+CHECKPOINT_MIN_OPS = 1000  # журнал сворачивается в снимок, когда в нём больше max(этого, числа строк) операций
+
+
+class VectorTable:
+    """
+    Одна «таблица» векторов: float32-матрица в memory-mapped файле {name}.f32
+    и метаданные строк: снимок {name}.json и журнал изменений после него {name}.journal (JSON lines).
+    Векторы хранятся нормированными, поэтому косинусное расстояние — это 1 - скалярное произведение.
+    Удаление — пометка строки (meta = None), место освобождает compact().
+    commit() дописывает в журнал только изменения с прошлого commit; снимок переписывается,
+    когда журнал разрастается, и в compact()/checkpoint(). rollback() возвращает состояние с диска.
+    """
+
+    def __init__(self, directory: pathlib.Path, name: str, text_fields: Tuple[str, ...] = ()):
+        self.vectors_path = directory / f"{name}.f32"
+        self.meta_path = directory / f"{name}.json"
+        self.journal_path = directory / f"{name}.journal"
+        self.text_fields = text_fields  # поля для лексического (BM25) поиска
+        self.lexical = BM25Index()
+        self.dim: Optional[int] = None
+        self.next_id = 1
+        self.rows: List[Optional[dict]] = []
+        self.matrix = np.empty((0, 0), dtype=np.float32)
+        self.alive = np.zeros(0, dtype=bool)
+        self.pending: List[dict] = []  # изменения после последнего commit — строки журнала
+        self.journal_ops = 0
+        self._load()
+
+    def _load(self):
+        self.dim, self.next_id, self.rows = None, 1, []
+        self.pending, self.journal_ops = [], 0
+        if self.meta_path.exists():
+            data = json.loads(self.meta_path.read_text(encoding="utf-8"))
+            self.dim = data["dim"]
+            self.next_id = data["next_id"]
+            self.rows = data["rows"]
+        if self.journal_path.exists():
+            with open(self.journal_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        op = json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # недописанная последняя строка (падение во время commit)
+                    self._replay(op)
+                    self.journal_ops += 1
+        self.alive = np.array([row is not None for row in self.rows], dtype=bool)
+        self._remap()
+        self._index_text()
+
+    def _index_text(self):
+        self.lexical = BM25Index()
+        for pos, row in enumerate(self.rows):
+            if row is not None:
+                self.lexical.add(pos, self.text_of(row))
+
+    def _replay(self, op: dict):
+        """Операции идемпотентны: журнал, уже вошедший в снимок (падение в checkpoint), ничего не ломает"""
+        if op["op"] == "append":
+            if op["pos"] == len(self.rows):
+                self.dim = self.dim or op["dim"]
+                self.rows.append(op["row"])
+                self.next_id = max(self.next_id, op["row"]["id"] + 1)
+        elif op["op"] == "update":
+            if op["pos"] < len(self.rows) and self.rows[op["pos"]] is not None:
+                self.rows[op["pos"]].update(op["fields"])
+        elif op["op"] == "delete":
+            for pos in op["positions"]:
+                if pos < len(self.rows):
+                    self.rows[pos] = None
+
+    def text_of(self, row: dict) -> str:
+        return " ".join(str(row.get(field) or "") for field in self.text_fields)
+
+    def _remap(self):
+        # векторы, дописанные после последнего commit, отбрасываются: строк столько, сколько в метаданных
+        if not self.rows or self.dim is None:
+            self.matrix = np.empty((0, self.dim or 0), dtype=np.float32)
+            return
+        self.matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r",
+                                shape=(len(self.rows), self.dim))
+
+    def append(self, rows: List[dict], embeddings: List[List[float]]) -> List[int]:
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.maximum(norms, 1e-12)
+
+        self.matrix = np.empty((0, self.dim), dtype=np.float32)  # отпускаем memmap (Windows не даёт писать в отображённый файл)
+        mode = "r+b" if self.vectors_path.exists() else "wb"
+        with open(self.vectors_path, mode) as f:
+            f.seek(len(self.rows) * self.dim * 4)
+            f.write(vectors.tobytes())
+            f.truncate()
+
+        ids = []
+        for row in rows:
+            if row.get("id") is None:
+                row["id"] = self.next_id
+            self.next_id = max(self.next_id, row["id"] + 1)
+            ids.append(len(self.rows))
+            self.lexical.add(len(self.rows), self.text_of(row))
+            self.pending.append({"op": "append", "pos": len(self.rows), "row": row, "dim": self.dim})
+            self.rows.append(row)
+        self.alive = np.concatenate([self.alive, np.ones(len(rows), dtype=bool)])
+        self._remap()
+        return ids
+
+    def update(self, pos: int, fields: dict):
+        """Меняет метаданные строки (вектор тот же), лексический индекс — вслед за текстом"""
+        row = self.rows[pos]
+        self.lexical.remove(pos, self.text_of(row))
+        row.update(fields)
+        self.lexical.add(pos, self.text_of(row))
+        self.pending.append({"op": "update", "pos": pos, "fields": fields})
+
+    def delete(self, positions: List[int]):
+        positions = [int(pos) for pos in positions]
+        if positions:
+            self.pending.append({"op": "delete", "positions": positions})
+        for pos in positions:
+            if self.rows[pos] is not None:
+                self.lexical.remove(pos, self.text_of(self.rows[pos]))
+            self.rows[pos] = None
+        self.alive[positions] = False
+
+    def search(self, query: List[float], top_k: int, max_distance: Optional[float]) -> List[Tuple[int, float]]:
+        return self.search_many([query], top_k, max_distance)[0]
+
+    def search_many(self, queries: List[List[float]], top_k: int,
+                    max_distance: Optional[float]) -> List[List[Tuple[int, float]]]:
+        """Точный top-k по косинусу: одно матричное умножение на все запросы + argpartition"""
+        n_alive = int(self.alive.sum())
+        if not n_alive or top_k <= 0:
+            return [[] for _ in queries]
+        q = np.asarray(queries, dtype=np.float32)
+        q = q / np.maximum(np.linalg.norm(q, axis=1, keepdims=True), 1e-12)
+        similarity = q @ self.matrix.T
+        similarity[:, ~self.alive] = -np.inf
+        k = min(top_k, n_alive)
+        top = np.argpartition(-similarity, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in zip(similarity, top):
+            candidates = candidates[np.argsort(-row[candidates])]
+            hits = []
+            for pos in candidates:
+                distance = 1.0 - float(row[pos])
+                if max_distance is not None and distance > max_distance:
+                    break
+                hits.append((int(pos), distance))
+            results.append(hits)
+        return results
+
+    def commit(self):
+        """Дописывает изменения в журнал: O(изменений), а не O(строк)"""
+        if not self.pending:
+            return
+        with open(self.journal_path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(op, ensure_ascii=False, default=str) + "\n" for op in self.pending))
+        self.journal_ops += len(self.pending)
+        self.pending = []
+        if self.journal_ops > max(CHECKPOINT_MIN_OPS, len(self.rows)):
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Снимок всех строк вместо журнала (включая незакоммиченные изменения)"""
+        tmp_path = self.meta_path.with_suffix(".json.tmp")
+        tmp_path.write_text(json.dumps(
+            {"dim": self.dim, "next_id": self.next_id, "rows": self.rows},
+            ensure_ascii=False, default=str,
+        ), encoding="utf-8")
+        os.replace(tmp_path, self.meta_path)
+        self.journal_path.unlink(missing_ok=True)
+        self.pending, self.journal_ops = [], 0
+
+    def rollback(self):
+        """Отбрасывает изменения после последнего commit: строки, векторы и BM25 — как на диске"""
+        if not self.pending:
+            return
+        self.matrix = np.empty((0, 0), dtype=np.float32)
+        self._load()  # дописанные векторы за концом строк затрёт следующий append
+
+    def compact(self):
+        """Переписывает файл векторов без удалённых строк"""
+        keep = np.flatnonzero(self.alive)
+        if len(keep) == len(self.rows):
+            return
+        vectors = np.array(self.matrix[keep]) if len(keep) else np.empty((0, self.dim or 0), np.float32)
+        self.matrix = np.empty((0, 0), dtype=np.float32)  # отпускаем memmap перед перезаписью
+        with open(self.vectors_path, "wb") as f:
+            f.write(vectors.tobytes())
+        self.rows = [self.rows[pos] for pos in keep]
+        self.alive = np.ones(len(self.rows), dtype=bool)
+        self.checkpoint()  # позиции строк сдвинулись — журнал к новому снимку не применим
+        self._remap()
+        self._index_text()
+
+
+class NumpyVectorRAG:
+    """
+    Встраиваемая альтернатива PgVectorRAG с тем же интерфейсом — без Postgres.
+    Подходит для однопользовательского запуска и тестов: память агента
+    на десятки тысяч записей ищется полным перебором за доли миллисекунды.
+    """
+
+    def __init__(self, directory: str = DEFAULT_STORE_DIR):
+        self.directory = pathlib.Path(directory)
+        if not self.directory.is_absolute():
+            self.directory = pathlib.Path(__file__).resolve().parents[2] / self.directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.RLock()
+        self.chunks = VectorTable(self.directory, TABLE_NAME, ("content",))
+        self.memory = VectorTable(self.directory, MEMORY_TABLE_NAME, ("situation", "result_summary"))
+        self.manifest: Dict[str, dict] = self._load_manifest_file()
+        self.manifest_dirty = False
+        # file_path -> {chunk_index: позиция строки}, для upsert и удаления чанков файла
+        self.chunk_positions: Dict[str, Dict[int, int]] = {}
+        self._index_chunk_positions()
+        config = get_config_dict()
+        self.compaction = CompactionPolicy.from_config(config)
+        self.memory_min_score = config.get("hybrid_search", {}).get("memory_min_bm25", MEMORY_MIN_BM25)
+
+    # --- Совместимость с PgVectorRAG: схема и индексы не нужны ---
+
+    def init_db(self, bulk_load: bool = False) -> bool:
+        return False
+
+    def build_index(self, maintenance_work_mem: str = None, parallel_workers: int = None):
+        pass
+
+    def memory_init_db(self):
+        pass
+
+    # --- Поиск ---
+
+    def search(self, query_embedding: List[float], top_k: int = 10, max_distance: float = 0.1,
+               columns: List[str] = None, ef_search: int = None, iterative_scan: str = None) -> List[Chunk]:
+        return self.search_many([query_embedding], top_k, max_distance, columns)[0]
+
+    def search_memory(self, query_embedding: List[float], top_k: int = 10, max_distance: float = 0.1,
+                      columns: List[str] = None, ef_search: int = None,
+                      iterative_scan: str = None) -> List[MemoryChunk]:
+        return self.search_memory_many([query_embedding], top_k, max_distance, columns)[0]
+
+    def search_many(self, query_embeddings: List[List[float]], top_k: int = 10, max_distance: float = 0.1,
+                    columns: List[str] = None, ef_search: int = None,
+                    iterative_scan: str = None) -> List[List[Chunk]]:
+        """ef_search/iterative_scan — настройки HNSW, здесь поиск точный и они не нужны"""
+        with self.lock:
+            hits = self.chunks.search_many(query_embeddings, top_k, max_distance)
+            return [[self._to_model(Chunk, self.chunks.rows[pos], distance, columns) for pos, distance in query_hits]
+                    for query_hits in hits]
+
+    def search_memory_many(self, query_embeddings: List[List[float]], top_k: int = 10, max_distance: float = 0.1,
+                           columns: List[str] = None, ef_search: int = None,
+                           iterative_scan: str = None) -> List[List[MemoryChunk]]:
+        with self.lock:
+            hits = self.memory.search_many(query_embeddings, top_k, max_distance)
+            return [[self._to_model(MemoryChunk, self.memory.rows[pos], distance, columns) for pos, distance in query_hits]
+                    for query_hits in hits]
+
+    def lexical_search(self, query_text: str, top_k: int = 10, columns: List[str] = None) -> List[Chunk]:
+        """BM25 по content — аналог GIN/tsvector-поиска PgVectorRAG"""
+        with self.lock:
+            hits = self.chunks.lexical.search(query_text, top_k)
+            return [self._to_model(Chunk, self.chunks.rows[pos], None, columns) for pos, _ in hits]
+
+    def lexical_search_memory(self, query_text: str, top_k: int = 10,
+                              columns: List[str] = None, exclude: str = None) -> List[MemoryChunk]:
+        """BM25 по situation + result_summary, только находки со score >= memory_min_bm25"""
+        if exclude:
+            query_text = " ".join(lexical_terms(query_text, exclude=exclude))
+        with self.lock:
+            hits = self.memory.lexical.search(query_text, top_k, self.memory_min_score)
+            return [self._to_model(MemoryChunk, self.memory.rows[pos], None, columns) for pos, _ in hits]
+
+    # --- Запись ---
+
+    def save_memory_chunk(self, chunk: MemoryChunk):
+        self.save_memory_chunks([chunk])
+
+    def save_memory_chunks(self, chunks: List[MemoryChunk]):
+        """Как PgVectorRAG.save_memory_chunks: повтор ситуации увеличивает счётчики существующей записи"""
+        with self.lock:
+            now = datetime.now(timezone.utc).isoformat()
+            for chunk in chunks:
+                success = True if chunk.success is None else bool(chunk.success)
+                namespace = chunk.namespace or DEFAULT_NAMESPACE
+                pos = self._duplicate_memory(chunk, namespace)
+                if pos is not None:
+                    row = self.memory.rows[pos]
+                    self.memory.update(pos, dict(
+                        hit_count=row.get("hit_count", 1) + 1,
+                        success_count=self._success_count(row) + int(success),
+                        last_used_at=now,
+                        success=success,
+                        result_summary=chunk.result_summary,
+                        reasoning=chunk.reasoning if chunk.reasoning is not None else row.get("reasoning"),
+                        action_plan=chunk.action_plan if chunk.action_plan is not None else row.get("action_plan"),
+                    ))
+                    continue
+                row = {field: getattr(chunk, field) for field in MEMORY_FIELDS}
+                row.update(success=success, created_at=now, last_used_at=now, namespace=namespace,
+                           hit_count=1, success_count=int(success))
+                self.memory.append([row], [chunk.embedding])
+            self.memory.commit()  # в журнал — только эта пачка
+
+    def _duplicate_memory(self, chunk: MemoryChunk, namespace: str) -> Optional[int]:
+        if self.compaction.dedup_distance is None:
+            return None
+        for pos, _ in self.memory.search(chunk.embedding, DEDUP_CANDIDATES, self.compaction.dedup_distance):
+            row = self.memory.rows[pos]
+            if (row.get("namespace", DEFAULT_NAMESPACE) == namespace
+                    and row["action_description"] == chunk.action_description):
+                return pos
+        return None
+
+    @staticmethod
+    def _success_count(row: dict) -> int:
+        # записи до появления счётчиков: успех последнего раза и есть весь счёт
+        if "success_count" in row:
+            return row["success_count"]
+        return int(bool(row.get("success", True)))
+
+    def compact_memory(self) -> Dict[str, int]:
+        """Те же три шага, что PgVectorRAG.compact_memory: слияние дублей, старение, потолок на namespace"""
+        policy = self.compaction
+        stats = {"merged": 0, "aged_out": 0, "capped": 0}
+        with self.lock:
+            table = self.memory
+            alive = [pos for pos, row in enumerate(table.rows) if row is not None]
+
+            if policy.dedup_distance is not None:
+                groups: Dict[Tuple[str, str], List[int]] = {}
+                for pos in alive:
+                    row = table.rows[pos]
+                    groups.setdefault((row.get("namespace", DEFAULT_NAMESPACE), row["action_description"]),
+                                      []).append(pos)
+                pairs = []
+                for positions in groups.values():
+                    if len(positions) < 2:
+                        continue
+                    # группы с одним действием маленькие — попарные расстояния одной матрицей
+                    vectors = np.asarray(table.matrix[positions])
+                    close = np.argwhere(np.triu(vectors @ vectors.T >= 1.0 - policy.dedup_distance, k=1))
+                    pairs.extend((positions[i], positions[j]) for i, j in close)
+                for keep, duplicates in group_duplicates(pairs).items():
+                    kept = table.rows[keep]
+                    table.update(keep, dict(
+                        hit_count=kept.get("hit_count", 1) + sum(table.rows[pos].get("hit_count", 1)
+                                                                 for pos in duplicates),
+                        success_count=self._success_count(kept) + sum(self._success_count(table.rows[pos])
+                                                                      for pos in duplicates),
+                        last_used_at=max([self._last_used(kept)] + [self._last_used(table.rows[pos])
+                                                                    for pos in duplicates]),
+                    ))
+                    table.delete(duplicates)
+                    stats["merged"] += len(duplicates)
+                alive = [pos for pos in alive if table.rows[pos] is not None]
+
+            now = datetime.now(timezone.utc)
+            scores = {}
+            for pos in alive:
+                row = table.rows[pos]
+                age_days = (now - datetime.fromisoformat(self._last_used(row))).total_seconds() / 86400
+                scores[pos] = policy.score(row.get("hit_count", 1), self._success_count(row), age_days)
+            aged_out = [pos for pos in alive if scores[pos] < policy.min_score]
+            table.delete(aged_out)
+            stats["aged_out"] = len(aged_out)
+
+            if policy.max_rows_per_namespace:
+                by_namespace: Dict[str, List[int]] = {}
+                for pos in alive:
+                    if table.rows[pos] is not None:
+                        by_namespace.setdefault(table.rows[pos].get("namespace", DEFAULT_NAMESPACE), []).append(pos)
+                for positions in by_namespace.values():
+                    positions.sort(key=lambda pos: (scores[pos], table.rows[pos]["id"]), reverse=True)
+                    capped = positions[policy.max_rows_per_namespace:]
+                    table.delete(capped)
+                    stats["capped"] += len(capped)
+
+            table.compact()
+            table.commit()
+        print(f"Компакция памяти: {stats}")
+        return stats
+
+    @staticmethod
+    def _last_used(row: dict) -> str:
+        return row.get("last_used_at") or row.get("created_at") or datetime.now(timezone.utc).isoformat()
+
+    def merge(self, chunk: Chunk):
+        self.bulk_upsert_chunks([chunk])
+
+    def bulk_upsert_chunks(self, chunks: List[Chunk]):
+        if not chunks:
+            return
+        with self.lock:
+            # как ON CONFLICT (file_path, chunk_index): старая строка помечается удалённой
+            latest = {(chunk.file_path, chunk.chunk_index): chunk for chunk in chunks}
+            old = [
+                self.chunk_positions[file_path][chunk_index]
+                for file_path, chunk_index in latest
+                if chunk_index in self.chunk_positions.get(file_path, {})
+            ]
+            self.chunks.delete(old)
+            rows = [{field: getattr(chunk, field) for field in CHUNK_FIELDS} for chunk in latest.values()]
+            positions = self.chunks.append(rows, [chunk.embedding for chunk in latest.values()])
+            for (file_path, chunk_index), pos in zip(latest, positions):
+                self.chunk_positions.setdefault(file_path, {})[chunk_index] = pos
+
+    def commit(self):
+        with self.lock:
+            self.chunks.commit()
+            self.memory.commit()
+            if self.manifest_dirty:
+                self._save_manifest_file()
+                self.manifest_dirty = False
+
+    def rollback(self):
+        """Как откат транзакции: изменения после последнего commit отбрасываются"""
+        with self.lock:
+            self.chunks.rollback()
+            self.memory.rollback()
+            if self.manifest_dirty:
+                self.manifest = self._load_manifest_file()
+                self.manifest_dirty = False
+            self._index_chunk_positions()
+
+    def close(self):
+        with self.lock:
+            self.commit()
+            self.chunks.checkpoint()
+            self.memory.checkpoint()
+
+    def compact(self):
+        """Освобождает место удалённых строк (после больших пересканирований)"""
+        with self.lock:
+            self.chunks.compact()
+            self.memory.compact()
+            self._index_chunk_positions()
+
+    def _index_chunk_positions(self):
+        self.chunk_positions = {}
+        for pos, row in enumerate(self.chunks.rows):
+            if row is not None:
+                self.chunk_positions.setdefault(row["file_path"], {})[row["chunk_index"]] = pos
+
+    # --- Манифест файлов ---
+
+    def load_manifest(self, root: str) -> Dict[str, FileManifest]:
+        with self.lock:
+            return {
+                file_path: FileManifest(file_path=file_path, **entry)
+                for file_path, entry in self.manifest.items()
+                if entry["root"] == root
+            }
+
+    def save_manifest(self, entry: FileManifest):
+        with self.lock:
+            self.manifest[entry.file_path] = dict(
+                root=entry.root, content_hash=entry.content_hash,
+                mtime=entry.mtime, size=entry.size, chunk_count=entry.chunk_count,
+            )
+            self.manifest_dirty = True
+
+    def delete_stale_chunks(self, file_path: str, keep_indices: List[int]):
+        if not keep_indices:
+            # пустой список удалил бы все чанки файла — для этого есть delete_file_chunks
+            raise ValueError(f"delete_stale_chunks: пустой keep_indices для {file_path}")
+        with self.lock:
+            self._delete_chunks(file_path, set(keep_indices))
+
+    def delete_file_chunks(self, file_path: str):
+        with self.lock:
+            self._delete_chunks(file_path, set())
+
+    def delete_file(self, file_path: str):
+        with self.lock:
+            self._delete_chunks(file_path, set())
+            if self.manifest.pop(file_path, None) is not None:
+                self.manifest_dirty = True
+
+    def _delete_chunks(self, file_path: str, keep: set):
+        positions = self.chunk_positions.get(file_path, {})
+        stale = [chunk_index for chunk_index in positions if chunk_index not in keep]
+        self.chunks.delete([positions.pop(chunk_index) for chunk_index in stale])
+        if not positions:
+            self.chunk_positions.pop(file_path, None)
+
+    def _load_manifest_file(self) -> Dict[str, dict]:
+        path = self.directory / MANIFEST_FILE
+        if not path.exists():
+            return {}
+        return json.loads(path.read_text(encoding="utf-8"))
+
+    def _save_manifest_file(self):
+        path = self.directory / MANIFEST_FILE
+        tmp_path = path.with_suffix(".json.tmp")
+        tmp_path.write_text(json.dumps(self.manifest, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _to_model(model, row: dict, distance: float, columns: List[str] = None):
+        row = {name: value for name, value in row.items() if columns is None or name in columns}
+        for field in ("created_at", "last_used_at"):
+            if row.get(field):
+                row[field] = datetime.fromisoformat(row[field])
+        item = model(**row)
+        item.distance = distance
+        return item
@@ -1,136 +1,466 @@
 # pgvector_rag.py (новая версия)
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 
-from sqlalchemy import create_engine, select, text
+from pgvector.sqlalchemy import Vector
+from sqlalchemy import select, text, delete, update, insert, func, values, column, cast, true, literal_column, \
+    Integer, String, Text
+from sqlalchemy.dialects.postgresql import insert as pg_insert, TSQUERY
 from sqlalchemy.orm import Session
-from src.rag.models import Chunk, Base, MemoryChunk
-import toml
+from src.rag.db_engine import get_engine
+from src.rag.hybrid import lexical_terms, MEMORY_MIN_RANK
+from src.rag.memory_compaction import CompactionPolicy, group_duplicates
+from src.rag.models import Chunk, Base, MemoryChunk, FileManifest, EMBEDDING_DIM
+from src.rag.vector_storage import StorageMode
+from src.utils.config import get_config_dict
 
 TABLE_NAME = "code_chunks"
 MEMORY_TABLE_NAME = "memory_chunks"
+UPSERT_BATCH_ROWS = 1000  # строк в одном INSERT (лимит параметров Postgres — 65535)
+# столбцы, которые поиск возвращает по умолчанию — embedding (768 float) вызывающим не нужен
+CHUNK_COLUMNS = ["id", "file_path", "source", "chunk_index", "content"]
+MEMORY_COLUMNS = ["id", "situation", "action_description", "result_summary",
+                  "reasoning", "action_plan", "success", "created_at",
+                  "namespace", "hit_count", "success_count", "last_used_at"]
+# выражения tsvector для лексического поиска — в индексе и в запросе должны совпадать дословно
+LEXICAL_INDEX_SQL = {
+    TABLE_NAME: "to_tsvector('simple', content)",
+    MEMORY_TABLE_NAME: "to_tsvector('simple', coalesce(situation, '') || ' ' || coalesce(result_summary, ''))",
+}
+# столбцы компакции для баз, созданных до их появления (create_all существующую таблицу не меняет)
+MEMORY_MIGRATIONS = [
+    f"ALTER TABLE {MEMORY_TABLE_NAME} ADD COLUMN IF NOT EXISTS namespace varchar NOT NULL DEFAULT 'default'",
+    f"ALTER TABLE {MEMORY_TABLE_NAME} ADD COLUMN IF NOT EXISTS hit_count integer NOT NULL DEFAULT 1",
+    f"ALTER TABLE {MEMORY_TABLE_NAME} ADD COLUMN IF NOT EXISTS success_count integer NOT NULL DEFAULT 0",
+    f"ALTER TABLE {MEMORY_TABLE_NAME} ADD COLUMN IF NOT EXISTS last_used_at timestamptz",
+    f"UPDATE {MEMORY_TABLE_NAME} SET last_used_at = created_at WHERE last_used_at IS NULL",
+    f"ALTER TABLE {MEMORY_TABLE_NAME} ALTER COLUMN last_used_at SET DEFAULT now()",
+    f"UPDATE {MEMORY_TABLE_NAME} SET success_count = 1 WHERE success AND hit_count = 1 AND success_count = 0",
+    f"CREATE INDEX IF NOT EXISTS ix_{MEMORY_TABLE_NAME}_namespace ON {MEMORY_TABLE_NAME} (namespace, action_description)",
+]
+# ценность памяти для компакции — та же формула, что CompactionPolicy.score
+MEMORY_SCORE_SQL = (
+    "(hit_count + success_count) * power(0.5, "
+    "extract(epoch FROM now() - coalesce(last_used_at, created_at)) / 86400.0 / :half_life)"
+)
 
 from dataclasses import dataclass
 
-class PgVectorRAG:
 
-    def __init__(self, db_url: str = None):
-        if not db_url:
-            config = toml.load("config.toml")
-            db_url = config["memory"]["embedding_db_url"]  # "postgresql+psycopg2://..."
+def lexical_index_sql(table: str) -> str:
+    return f"CREATE INDEX IF NOT EXISTS ix_{table}_tsv ON {table} USING gin ({LEXICAL_INDEX_SQL[table]})"
 
-        self.engine = create_engine(db_url, future=True)
+
+class PgVectorQueries:
+    """
+    Построители запросов, общие для PgVectorRAG (psycopg2) и AsyncPgVectorRAG (asyncpg):
+    сами ничего не выполняют, только собирают выражения SQLAlchemy.
+    """
+
+    def __init__(self, storage_mode: StorageMode = None):
+        config = get_config_dict()
+        self.storage_mode = storage_mode or StorageMode.from_config(config)
+        self.ef_search = config["memory"].get("ef_search")
+        self.iterative_scan = config["memory"].get("iterative_scan")
+        self.compaction = CompactionPolicy.from_config(config)
+        self.memory_min_rank = config.get("hybrid_search", {}).get("memory_min_rank", MEMORY_MIN_RANK)
+
+    def _memory_schema_sql(self) -> List[str]:
+        """Миграции memory_chunks + HNSW и GIN индексы (после Base.metadata.create_all)"""
+        return MEMORY_MIGRATIONS + [
+            self.storage_mode.index_sql(MEMORY_TABLE_NAME),
+            lexical_index_sql(MEMORY_TABLE_NAME),
+        ]
+
+    def _search_stmt(self, model, columns: List[str], query, top_k: int, max_distance: Optional[float]):
+        # 1. Расстояние в форме текущего режима хранения (full/half/truncate/binary)
+        #    Это не raw SQL, а нативная конструкция pgvector.sqlalchemy
+        distance_expr, candidates = self.storage_mode.distance_and_filter(model, query, top_k)
+        stmt = (
+            select(
+                *[getattr(model, name) for name in columns],
+                distance_expr.label("distance")  # Присваиваем имя для доступа к результату
+            )
+            .order_by(distance_expr)  # Сортируем по расстоянию
+            .limit(top_k)
+        )
+        # <-- добавляем фильтр по порогу, если он задан
+        if max_distance is not None:
+            stmt = stmt.where(distance_expr <= max_distance)
+        # <-- binary: только кандидаты, найденные по Хэммингу
+        if candidates is not None:
+            stmt = stmt.where(candidates)
+        return stmt
+
+    def _search_many_stmt(self, model, columns: List[str], query_embeddings: List[List[float]],
+                          top_k: int, max_distance: Optional[float]):
+        """Один запрос — обычный SELECT, несколько — VALUES + LATERAL; в строках есть ord (номер запроса)"""
+        if len(query_embeddings) == 1:
+            return self._search_stmt(model, columns, query_embeddings[0], top_k, max_distance) \
+                .add_columns(literal_column("0").label("ord"))
+        # Запросы приходят строками VALUES, по каждому — LATERAL-подзапрос с ORDER BY ... LIMIT,
+        # так что на каждый запрос всё равно работает HNSW-индекс
+        queries = values(
+            column("ord", Integer), column("query", String), name="q"
+        ).data([(i, str(list(emb))) for i, emb in enumerate(query_embeddings)])
+        query_vector = cast(queries.c.query, Vector(EMBEDDING_DIM))
+        hits = self._search_stmt(model, columns, query_vector, top_k, max_distance).lateral("hit")
+        return (
+            select(queries.c.ord, hits)
+            .select_from(queries)
+            .join(hits, true())
+            .order_by(queries.c.ord, hits.c.distance)
+        )
+
+    @staticmethod
+    def _rows_to_models(model, columns: List[str], rows, n_queries: int) -> List[list]:
+        """Преобразуем строки в объекты модели (без лишних столбцов) + distance"""
+        result = [[] for _ in range(n_queries)]
+        for row in rows:
+            item = model(**{name: getattr(row, name) for name in columns})
+            item.distance = row.distance
+            result[row.ord].append(item)
+        return result
+
+    def _search_settings(self, ef_search: Optional[int], iterative_scan: Optional[str]) -> list:
+        """Параметры HNSW на одну транзакцию (SET LOCAL через set_config): [(запрос, параметры)]"""
+        ef_search = ef_search or self.ef_search
+        iterative_scan = iterative_scan or self.iterative_scan
+        settings = []
+        if ef_search:
+            settings.append((text("SELECT set_config('hnsw.ef_search', :value, true)"),
+                             {"value": str(int(ef_search))}))
+        if iterative_scan:
+            # off | strict_order | relaxed_order (pgvector >= 0.8): добирает строки, отсечённые фильтром
+            settings.append((text("SELECT set_config('hnsw.iterative_scan', :value, true)"),
+                             {"value": iterative_scan}))
+        return settings
+
+    @staticmethod
+    def _chunk_tsvector():
+        return func.to_tsvector(literal_column("'simple'"), Chunk.content)
+
+    @staticmethod
+    def _memory_tsvector():
+        return func.to_tsvector(
+            literal_column("'simple'"),
+            func.coalesce(MemoryChunk.situation, literal_column("''"))
+            .op("||")(literal_column("' '"))
+            .op("||")(func.coalesce(MemoryChunk.result_summary, literal_column("''")))
+        )
+
+    @staticmethod
+    def _lexical_stmt(model, tsvector, columns: List[str], query_text: str, top_k: int,
+                      exclude: str = None, min_rank: float = None):
+        """None, если в запросе нет ни одного годного слова; min_rank — порог ts_rank_cd"""
+        terms = lexical_terms(query_text, exclude=exclude)
+        if not terms:
+            return None
+        # plainto_tsquery нормализует слова, а замена & на | даёт поиск по любому из них
+        tsquery = cast(
+            func.replace(
+                cast(func.plainto_tsquery(literal_column("'simple'"), " ".join(terms)), Text),
+                " & ", " | "),
+            TSQUERY)
+        rank = func.ts_rank_cd(tsvector, tsquery)
+        stmt = (
+            select(*[getattr(model, name) for name in columns], rank.label("rank"))
+            .where(tsvector.op("@@")(tsquery))
+            .order_by(rank.desc())
+            .limit(top_k)
+        )
+        if min_rank is not None:
+            stmt = stmt.where(rank >= min_rank)
+        return stmt
+
+    # --- Запись памяти со слиянием дублей ---
+
+    def _duplicate_memory_stmt(self, chunk: MemoryChunk):
+        """id ближайшей записи с той же ситуацией и тем же действием или None, если слияние выключено"""
+        if self.compaction.dedup_distance is None:
+            return None
+        return (
+            self._search_stmt(MemoryChunk, ["id"], chunk.embedding, 1, self.compaction.dedup_distance)
+            .where(MemoryChunk.namespace == (chunk.namespace or "default"))
+            .where(MemoryChunk.action_description == chunk.action_description)
+        )
+
+    @staticmethod
+    def _merge_memory_stmt(memory_id: int, chunk: MemoryChunk):
+        """Повтор ситуации: счётчики + 1, текст результата — последний"""
+        success = True if chunk.success is None else bool(chunk.success)
+        return (
+            update(MemoryChunk)
+            .where(MemoryChunk.id == memory_id)
+            .values(
+                hit_count=MemoryChunk.hit_count + 1,
+                success_count=MemoryChunk.success_count + int(success),
+                last_used_at=func.now(),
+                success=success,
+                result_summary=chunk.result_summary,
+                reasoning=chunk.reasoning if chunk.reasoning is not None else MemoryChunk.reasoning,
+                action_plan=chunk.action_plan if chunk.action_plan is not None else MemoryChunk.action_plan,
+            )
+        )
+
+    @staticmethod
+    def _insert_memory_stmt(chunk: MemoryChunk):
+        success = True if chunk.success is None else bool(chunk.success)
+        return insert(MemoryChunk).values(
+            situation=chunk.situation,
+            action_description=chunk.action_description,
+            result_summary=chunk.result_summary,
+            reasoning=chunk.reasoning,
+            action_plan=chunk.action_plan,
+            embedding=chunk.embedding,
+            success=success,
+            namespace=chunk.namespace or "default",
+            hit_count=1,
+            success_count=int(success),
+        )
+
+    @staticmethod
+    def _upsert_stmts(chunks: List[Chunk]):
+        """
+        Многострочные INSERT ... ON CONFLICT (file_path, chunk_index) DO UPDATE
+        по UPSERT_BATCH_ROWS строк в каждом.
+        """
+        # внутри одного INSERT ключ не может повторяться — оставляем последний вариант
+        rows = {
+            (chunk.file_path, chunk.chunk_index): dict(
+                file_path=chunk.file_path,
+                source=chunk.source,
+                chunk_index=chunk.chunk_index,
+                content=chunk.content,
+                embedding=chunk.embedding,
+            )
+            for chunk in chunks
+        }
+        rows = list(rows.values())
+        for i in range(0, len(rows), UPSERT_BATCH_ROWS):
+            stmt = pg_insert(Chunk).values(rows[i:i + UPSERT_BATCH_ROWS])
+            yield stmt.on_conflict_do_update(
+                index_elements=[Chunk.file_path, Chunk.chunk_index],
+                set_={
+                    "source": stmt.excluded.source,
+                    "content": stmt.excluded.content,
+                    "embedding": stmt.excluded.embedding,
+                    "updated_at": func.now(),
+                },
+            )
+
+
+class PgVectorRAG(PgVectorQueries):
+
+    def __init__(self, db_url: str = None, storage_mode: StorageMode = None):
+        super().__init__(storage_mode)
+        # Engine общий для всех PgVectorRAG с этим URL (пул из [database] в config.toml);
+        # сессия держит соединение только до commit/rollback
+        self.engine = get_engine(db_url)
         self.session = Session(self.engine)
 
-    def init_db(self):
+    def init_db(self, bulk_load: bool = False) -> bool:
+        """
+        Создаёт таблицы и HNSW-индекс.
+        bulk_load=True: если code_chunks пуста (первая индексация), индекс не создаётся —
+        его нужно построить через build_index() после загрузки данных, это в разы быстрее
+        инкрементальных вставок в HNSW. Возвращает True, если индекс отложен.
+        """
         Base.metadata.create_all(self.engine)
         with self.engine.connect() as conn:
-            conn.execute(text(f"""
-                CREATE INDEX IF NOT EXISTS ix_{TABLE_NAME}_embedding 
-                ON {TABLE_NAME} USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 200);
-            """))
+            if bulk_load and conn.execute(text(f"SELECT NOT EXISTS (SELECT 1 FROM {TABLE_NAME})")).scalar():
+                conn.execute(text(f"DROP INDEX IF EXISTS {self.storage_mode.index_name(TABLE_NAME)}"))
+                conn.execute(text(f"DROP INDEX IF EXISTS ix_{TABLE_NAME}_tsv"))
+                conn.commit()
+                return True
+            self._create_hnsw_index(conn, TABLE_NAME)
+            self._create_lexical_index(conn, TABLE_NAME)
+            conn.commit()
+        return False
+
+    @staticmethod
+    def _maintenance_settings(conn, maintenance_work_mem: str, parallel_workers: int):
+        """
+        Память и воркеры для CREATE INDEX; значения — параметрами, не в текст SQL.
+        is_local = true: действуют до конца текущей транзакции и не остаются на соединении из пула.
+        """
+        conn.execute(text("SELECT set_config('maintenance_work_mem', :value, true)"),
+                     {"value": str(maintenance_work_mem)})
+        conn.execute(text("SELECT set_config('max_parallel_maintenance_workers', :value, true)"),
+                     {"value": str(int(parallel_workers))})
+
+    def build_index(self, maintenance_work_mem: str = "1GB", parallel_workers: int = 4):
+        """Строит HNSW-индекс по уже загруженным данным (режим bulk load)"""
+        with self.engine.connect() as conn:
+            self._maintenance_settings(conn, maintenance_work_mem, parallel_workers)
+            self._create_hnsw_index(conn, TABLE_NAME)
+            self._create_lexical_index(conn, TABLE_NAME)
             conn.commit()
 
+    def migrate_storage_mode(self, mode: StorageMode,
+                             maintenance_work_mem: str = "1GB", parallel_workers: int = 4):
+        """
+        Переход на другой режим хранения векторов: индексы старых режимов удаляются,
+        индекс нового строится по уже лежащим данным (столбец embedding не меняется).
+        После миграции поменяйте [memory].storage_mode в config.toml.
+        """
+        self.storage_mode = mode
+        with self.engine.connect() as conn:
+            self._maintenance_settings(conn, maintenance_work_mem, parallel_workers)
+            for table in (TABLE_NAME, MEMORY_TABLE_NAME):
+                for index_name in mode.all_index_names(table):
+                    if index_name != mode.index_name(table):
+                        conn.execute(text(f"DROP INDEX IF EXISTS {index_name}"))
+                self._create_hnsw_index(conn, table)
+            conn.commit()
+
+    def _create_hnsw_index(self, conn, table: str):
+        conn.execute(text(self.storage_mode.index_sql(table)))
+
+    @staticmethod
+    def _create_lexical_index(conn, table: str):
+        conn.execute(text(lexical_index_sql(table)))
+
     def memory_init_db(self):
         Base.metadata.create_all(self.engine)
         with self.engine.connect() as conn:
-            conn.execute(text(f"""
-                CREATE INDEX IF NOT EXISTS ix_{MEMORY_TABLE_NAME}_embedding 
-                ON {MEMORY_TABLE_NAME} USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 200);
-            """))
+            for sql in self._memory_schema_sql():
+                conn.execute(text(sql))
             conn.commit()
 
-    def search(self, query_embedding: List[float], top_k: int = 10, max_distance: float = 0.1) -> List[Chunk]:
+    def search(self, query_embedding: List[float], top_k: int = 10, max_distance: float = 0.1,
+               columns: List[str] = None, ef_search: int = None, iterative_scan: str = None) -> List[Chunk]:
         """
-        Поиск по косинусному расстоянию с использованием SQLAlchemy ORM
+        Поиск по косинусному расстоянию с использованием SQLAlchemy ORM.
+        У каждого найденного чанка заполнено поле distance.
+        columns — какие столбцы загружать (по умолчанию всё, кроме embedding),
+        ef_search / iterative_scan — настройки HNSW только для этого запроса.
         """
-        with Session(self.engine) as session:
-            # 1. Создаем запрос с ORM-методом cosine_distance
-            #    Это не raw SQL, а нативная конструкция pgvector.sqlalchemy
-            distance_expr = Chunk.embedding.cosine_distance(query_embedding)
-
-            stmt = (
-                select(
-                    Chunk.id,
-                    Chunk.file_path,
-                    Chunk.source,
-                    Chunk.content,
-                    Chunk.chunk_index,
-                    distance_expr.label("distance")  # Присваиваем имя для доступа к результату
-                )
-                .order_by(distance_expr)  # Сортируем по расстоянию
-                .limit(top_k)
-            )
+        return self.search_many([query_embedding], top_k, max_distance, columns, ef_search, iterative_scan)[0]
 
-            # <-- добавляем фильтр по порогу, если он задан
-            if max_distance is not None:
-                stmt = stmt.where(distance_expr <= max_distance)
+    def search_memory(self, query_embedding: List[float], top_k: int = 10, max_distance: float = 0.1,
+                      columns: List[str] = None, ef_search: int = None,
+                      iterative_scan: str = None) -> List[MemoryChunk]:
+        """То же, что search, но по памяти агента (memory_chunks)"""
+        return self.search_memory_many([query_embedding], top_k, max_distance, columns, ef_search, iterative_scan)[0]
 
-            # 2. Выполняем и получаем результаты
+    def search_many(self, query_embeddings: List[List[float]], top_k: int = 10, max_distance: float = 0.1,
+                    columns: List[str] = None, ef_search: int = None,
+                    iterative_scan: str = None) -> List[List[Chunk]]:
+        """Несколько запросов за один поход в базу: результат — список на каждый запрос, в том же порядке"""
+        return self._search(Chunk, columns or CHUNK_COLUMNS, query_embeddings,
+                            top_k, max_distance, ef_search, iterative_scan)
+
+    def search_memory_many(self, query_embeddings: List[List[float]], top_k: int = 10, max_distance: float = 0.1,
+                           columns: List[str] = None, ef_search: int = None,
+                           iterative_scan: str = None) -> List[List[MemoryChunk]]:
+        return self._search(MemoryChunk, columns or MEMORY_COLUMNS, query_embeddings,
+                            top_k, max_distance, ef_search, iterative_scan)
+
+    def _search(self, model, columns: List[str], query_embeddings: List[List[float]],
+                top_k: int, max_distance: Optional[float],
+                ef_search: Optional[int], iterative_scan: Optional[str]) -> List[list]:
+        if not query_embeddings:
+            return []
+        with Session(self.engine) as session:
+            for stmt, params in self._search_settings(ef_search, iterative_scan):
+                session.execute(stmt, params)
+            stmt = self._search_many_stmt(model, columns, query_embeddings, top_k, max_distance)
             rows = session.execute(stmt).all()
+        return self._rows_to_models(model, columns, rows, len(query_embeddings))
 
-            # 3. Преобразуем в dict
-            return [
-                Chunk(
-                    id = row.id,
-                    file_path = row.file_path,
-                    source = row.source,
-                    content = row.content,
-                    chunk_index = row.chunk_index,
-                )
-                for row in rows
-            ]
+    def lexical_search(self, query_text: str, top_k: int = 10, columns: List[str] = None) -> List[Chunk]:
+        """Полнотекстовый поиск по code_chunks.content (GIN по tsvector): точные идентификаторы, имена файлов"""
+        return self._lexical_search(Chunk, self._chunk_tsvector(), columns or CHUNK_COLUMNS, query_text, top_k)
 
-    def search_memory(self, query_embedding: List[float], top_k: int = 10, max_distance: float = 0.1) -> List[MemoryChunk]:
+    def lexical_search_memory(self, query_text: str, top_k: int = 10,
+                              columns: List[str] = None, exclude: str = None) -> List[MemoryChunk]:
         """
-        Поиск по косинусному расстоянию с использованием SQLAlchemy ORM
+        Полнотекстовый поиск по memory_chunks.situation + result_summary.
+        Только находки с ts_rank_cd >= memory_min_rank: слабое совпадение одного общего слова
+        не должно вытеснять из выдачи близкие по эмбеддингу записи.
         """
+        return self._lexical_search(MemoryChunk, self._memory_tsvector(), columns or MEMORY_COLUMNS,
+                                    query_text, top_k, exclude, self.memory_min_rank)
+
+    def _lexical_search(self, model, tsvector, columns: List[str], query_text: str, top_k: int,
+                        exclude: str = None, min_rank: float = None) -> list:
+        stmt = self._lexical_stmt(model, tsvector, columns, query_text, top_k, exclude, min_rank)
+        if stmt is None:
+            return []
         with Session(self.engine) as session:
-            # 1. Создаем запрос с ORM-методом cosine_distance
-            #    Это не raw SQL, а нативная конструкция pgvector.sqlalchemy
-            distance_expr = MemoryChunk.embedding.cosine_distance(query_embedding)
-
-            stmt = (
-                select(
-                    MemoryChunk.id,
-                    MemoryChunk.situation,
-                    MemoryChunk.action_description,
-                    MemoryChunk.result_summary,
-                    MemoryChunk.reasoning,
-                    MemoryChunk.action_plan,
-                    MemoryChunk.embedding,
-                    MemoryChunk.success,
-                    MemoryChunk.created_at,
-                    distance_expr.label("distance")  # Присваиваем имя для доступа к результату
-                )
-                .order_by(distance_expr)  # Сортируем по расстоянию
-                .limit(top_k)
-            )
+            rows = session.execute(stmt).all()
+        return [model(**{name: getattr(row, name) for name in columns}) for row in rows]
 
-            # <-- добавляем фильтр по порогу, если он задан
-            if max_distance is not None:
-                stmt = stmt.where(distance_expr <= max_distance)
+    def save_memory_chunk(self, chunk: MemoryChunk):
+        self.save_memory_chunks([chunk])
 
-            # 2. Выполняем и получаем результаты
-            rows = session.execute(stmt).all()
+    def save_memory_chunks(self, chunks: List[MemoryChunk]):
+        """Одна транзакция; повтор уже известной ситуации увеличивает счётчики вместо новой строки"""
+        with Session(self.engine) as session, session.begin():
+            for chunk in chunks:
+                stmt = self._duplicate_memory_stmt(chunk)
+                memory_id = session.execute(stmt).scalar() if stmt is not None else None
+                session.execute(self._merge_memory_stmt(memory_id, chunk) if memory_id
+                                else self._insert_memory_stmt(chunk))
 
-            # 3. Преобразуем в dict
-            return [
-                MemoryChunk(
-                    situation=row.situation,
-                    action_description=row.action_description,
-                    result_summary=row.result_summary,
-                    reasoning=row.reasoning,
-                    action_plan=row.action_plan,
-                    embedding=row.embedding,
-                    success=row.success
-                )
-                for row in rows
-            ]
+    def compact_memory(self) -> Dict[str, int]:
+        """
+        Компакция памяти агента одной транзакцией:
+        1. сливает накопившиеся дубли (та же ситуация и то же действие) со сложением счётчиков;
+        2. удаляет записи с ценностью ниже min_score (давно не встречались и редко помогали);
+        3. оставляет не больше max_rows_per_namespace самых ценных записей в каждом namespace.
+        """
+        policy = self.compaction
+        stats = {"merged": 0, "aged_out": 0, "capped": 0}
+        with Session(self.engine) as session, session.begin():
+            if policy.dedup_distance is not None:
+                # KNN по HNSW-индексу: на каждую запись не больше dedup_neighbors соседей, а не все пары
+                pairs = session.execute(text(f"""
+                    SELECT a.id, b.id
+                    FROM {MEMORY_TABLE_NAME} a
+                    JOIN LATERAL (
+                        SELECT b.id, b.embedding <=> a.embedding AS distance
+                        FROM {MEMORY_TABLE_NAME} b
+                        WHERE b.namespace = a.namespace
+                          AND b.action_description = a.action_description
+                          AND b.id <> a.id
+                        ORDER BY b.embedding <=> a.embedding
+                        LIMIT :neighbors
+                    ) b ON b.distance <= :distance
+                """), {"distance": policy.dedup_distance, "neighbors": policy.dedup_neighbors}).all()
+                for keep_id, duplicate_ids in group_duplicates(pairs).items():
+                    session.execute(text(f"""
+                        UPDATE {MEMORY_TABLE_NAME} k SET
+                            hit_count = k.hit_count + d.hits,
+                            success_count = k.success_count + d.successes,
+                            last_used_at = greatest(k.last_used_at, d.last_used)
+                        FROM (
+                            SELECT sum(hit_count) AS hits, sum(success_count) AS successes,
+                                   max(coalesce(last_used_at, created_at)) AS last_used
+                            FROM {MEMORY_TABLE_NAME} WHERE id = ANY(:ids)
+                        ) d
+                        WHERE k.id = :keep_id
+                    """), {"ids": duplicate_ids, "keep_id": keep_id})
+                    session.execute(delete(MemoryChunk).where(MemoryChunk.id.in_(duplicate_ids)))
+                    stats["merged"] += len(duplicate_ids)
 
+            stats["aged_out"] = session.execute(text(f"""
+                DELETE FROM {MEMORY_TABLE_NAME} WHERE {MEMORY_SCORE_SQL} < :min_score
+            """), {"half_life": policy.half_life_days, "min_score": policy.min_score}).rowcount
 
-    def save_memory_chunk(self, chunk: MemoryChunk):
-        self.session.merge(chunk)
-        self.session.commit()
+            if policy.max_rows_per_namespace:
+                stats["capped"] = session.execute(text(f"""
+                    DELETE FROM {MEMORY_TABLE_NAME} WHERE id IN (
+                        SELECT id FROM (
+                            SELECT id, row_number() OVER (
+                                PARTITION BY namespace ORDER BY {MEMORY_SCORE_SQL} DESC, id DESC) AS rn
+                            FROM {MEMORY_TABLE_NAME}
+                        ) ranked WHERE rn > :max_rows
+                    )
+                """), {"half_life": policy.half_life_days,
+                       "max_rows": policy.max_rows_per_namespace}).rowcount
+        print(f"Компакция памяти: {stats}")
+        return stats
 
     def close(self):
         self.session.close()
@@ -138,5 +468,50 @@ class PgVectorRAG:
     def merge(self, chunk: Chunk):
         self.session.merge(chunk)
 
+    def bulk_upsert_chunks(self, chunks: List[Chunk]):
+        """
+        Пакетный upsert: многострочный INSERT ... ON CONFLICT (file_path, chunk_index) DO UPDATE
+        вместо session.merge (SELECT + INSERT/UPDATE на каждую строку). Коммит — за вызывающим.
+        """
+        for stmt in self._upsert_stmts(chunks):
+            self.session.execute(stmt)
+
+    # --- Манифест файлов для инкрементального пересканирования ---
+
+    def load_manifest(self, root: str) -> Dict[str, FileManifest]:
+        """Все записи манифеста для корня сканирования: file_path -> FileManifest"""
+        with Session(self.engine) as session:
+            rows = session.execute(
+                select(FileManifest).where(FileManifest.root == root)
+            ).scalars().all()
+            session.expunge_all()
+            return {row.file_path: row for row in rows}
+
+    def save_manifest(self, entry: FileManifest):
+        self.session.merge(entry)
+
+    def delete_stale_chunks(self, file_path: str, keep_indices: List[int]):
+        """Удаляет чанки файла, которых больше нет (файл стал короче или поменялся)"""
+        if not keep_indices:
+            # NOT IN () удалил бы все чанки файла — для этого есть delete_file_chunks
+            raise ValueError(f"delete_stale_chunks: пустой keep_indices для {file_path}")
+        self.session.execute(
+            delete(Chunk)
+            .where(Chunk.file_path == file_path)
+            .where(Chunk.chunk_index.not_in(keep_indices))
+        )
+
+    def delete_file_chunks(self, file_path: str):
+        """Удаляет все чанки файла (манифест остаётся)"""
+        self.session.execute(delete(Chunk).where(Chunk.file_path == file_path))
+
+    def delete_file(self, file_path: str):
+        """Удаляет все чанки и запись манифеста удалённого файла"""
+        self.session.execute(delete(Chunk).where(Chunk.file_path == file_path))
+        self.session.execute(delete(FileManifest).where(FileManifest.file_path == file_path))
+
     def commit(self):
         self.session.commit()
+
+    def rollback(self):
+        self.session.rollback()
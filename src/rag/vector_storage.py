@@ -0,0 +1,98 @@
+# vector_storage.py
+from typing import List, Optional, Tuple, Union
+
+from pgvector.sqlalchemy import Vector, HALFVEC, BIT
+from sqlalchemy import cast, func, literal, select
+from sqlalchemy.sql.elements import ColumnElement
+
+from src.rag.models import EMBEDDING_DIM
+
+STORAGE_MODES = ("full", "half", "truncate256", "truncate512", "binary")
+BINARY_RERANK_FACTOR = 4  # кандидатов по Хэммингу на один итоговый результат
+
+QueryVector = Union[List[float], ColumnElement]
+
+
+class StorageMode:
+    """
+    Режим хранения/поиска векторов в pgvector.
+    Столбец embedding остаётся vector(768) — источник правды для пересчёта;
+    сжатие делается индексом по выражению, так что переход между режимами —
+    это пересоздание индекса (PgVectorRAG.migrate_storage_mode), без миграции данных:
+      full        — vector(768), HNSW vector_cosine_ops;
+      half        — halfvec(768): индекс вдвое меньше;
+      truncate256 / truncate512 — первые N измерений (Matryoshka у nomic-embed-text-v1.5);
+      binary      — binary_quantize -> bit(768), индекс в 32 раза меньше,
+                    поиск по Хэммингу с пересчётом кандидатов по полному косинусу.
+    Режимы кроме full требуют pgvector >= 0.7.
+    """
+
+    def __init__(self, name: str = "full", rerank_factor: int = BINARY_RERANK_FACTOR):
+        if name not in STORAGE_MODES:
+            raise ValueError(f"Неизвестный режим хранения векторов: {name}, допустимы: {STORAGE_MODES}")
+        self.name = name
+        self.rerank_factor = rerank_factor
+        self.dims = int(name[len("truncate"):]) if name.startswith("truncate") else EMBEDDING_DIM
+
+    @classmethod
+    def from_config(cls, config: dict) -> "StorageMode":
+        memory_config = config.get("memory", {})
+        return cls(memory_config.get("storage_mode", "full"),
+                   memory_config.get("binary_rerank_factor", BINARY_RERANK_FACTOR))
+
+    # --- DDL ---
+
+    def index_name(self, table: str) -> str:
+        # у full прежнее имя — существующие базы не пересоздают индекс
+        return f"ix_{table}_embedding" if self.name == "full" else f"ix_{table}_embedding_{self.name}"
+
+    def all_index_names(self, table: str) -> List[str]:
+        return [StorageMode(name).index_name(table) for name in STORAGE_MODES]
+
+    def index_sql(self, table: str) -> str:
+        expression, opclass = {
+            "full": ("embedding", "vector_cosine_ops"),
+            "half": (f"(embedding::halfvec({EMBEDDING_DIM}))", "halfvec_cosine_ops"),
+            "binary": (f"(binary_quantize(embedding)::bit({EMBEDDING_DIM}))", "bit_hamming_ops"),
+        }.get(self.name, (f"(subvector(embedding, 1, {self.dims})::vector({self.dims}))", "vector_cosine_ops"))
+        return f"""
+            CREATE INDEX IF NOT EXISTS {self.index_name(table)}
+            ON {table} USING hnsw ({expression} {opclass}) WITH (m = 16, ef_construction = 200);
+        """
+
+    # --- Выражения для запросов ---
+
+    def index_distance(self, column, query: QueryVector):
+        """Расстояние ровно в том виде, в каком оно проиндексировано (иначе планировщик не возьмёт индекс)"""
+        query = _as_vector(query)
+        if self.name == "full":
+            return column.cosine_distance(query)
+        if self.name == "half":
+            return cast(column, HALFVEC(EMBEDDING_DIM)).cosine_distance(cast(query, HALFVEC(EMBEDDING_DIM)))
+        if self.name == "binary":
+            return cast(func.binary_quantize(column), BIT(EMBEDDING_DIM)).hamming_distance(
+                cast(func.binary_quantize(query), BIT(EMBEDDING_DIM)))
+        return cast(func.subvector(column, 1, self.dims), Vector(self.dims)).cosine_distance(
+            cast(func.subvector(query, 1, self.dims), Vector(self.dims)))
+
+    def distance_and_filter(self, model, query: QueryVector, top_k: int) -> Tuple[ColumnElement, Optional[ColumnElement]]:
+        """
+        (выражение косинусного расстояния для ORDER BY и порога, доп. условие WHERE или None).
+        Для binary условие — «id среди top_k * rerank_factor ближайших по Хэммингу»,
+        а сортировка идёт уже по полному косинусу (re-ranking).
+        """
+        if self.name != "binary":
+            return self.index_distance(model.embedding, query), None
+        candidates = (
+            select(model.id)
+            .order_by(self.index_distance(model.embedding, query))
+            .limit(top_k * self.rerank_factor)
+            .scalar_subquery()
+        )
+        return model.embedding.cosine_distance(_as_vector(query)), model.id.in_(candidates)
+
+
+def _as_vector(query: QueryVector):
+    if isinstance(query, ColumnElement):
+        return query
+    return literal(query, Vector(EMBEDDING_DIM))
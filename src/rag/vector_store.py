@@ -0,0 +1,59 @@
+# vector_store.py
+from src.rag.async_pgvector_rag import AsyncPgVectorRAG
+from src.rag.numpy_vector_store import NumpyVectorRAG, DEFAULT_STORE_DIR
+from src.rag.pgvector_rag import PgVectorRAG
+from src.utils.config import get_config_dict
+
+# один NumpyVectorRAG на каталог: два экземпляра над одними файлами затирали бы друг друга
+_numpy_stores: dict[str, NumpyVectorRAG] = {}
+
+
+def create_vector_store(db_url: str = None):
+    """
+    Хранилище векторов по [memory].backend из config.toml:
+    "pgvector" (по умолчанию) — PgVectorRAG, "numpy" — NumpyVectorRAG без базы данных.
+    """
+    memory_config = get_config_dict().get("memory", {})
+    backend = memory_config.get("backend", "pgvector")
+    if backend == "numpy":
+        directory = memory_config.get("numpy_dir", DEFAULT_STORE_DIR)
+        if directory not in _numpy_stores:
+            _numpy_stores[directory] = NumpyVectorRAG(directory)
+        return _numpy_stores[directory]
+    if backend == "pgvector":
+        return PgVectorRAG(db_url)
+    raise ValueError(f"Неизвестный backend хранилища векторов: {backend}")
+
+
+class AsyncStoreAdapter:
+    """
+    Асинхронный интерфейс AsyncPgVectorRAG поверх синхронного хранилища в памяти процесса
+    (NumpyVectorRAG): его операции — доли миллисекунды, поток для них не нужен.
+    """
+
+    ASYNC_METHODS = ("search", "search_memory", "search_many", "search_memory_many",
+                     "lexical_search", "lexical_search_memory", "save_memory_chunk", "save_memory_chunks",
+                     "bulk_upsert_chunks", "memory_init_db")
+
+    def __init__(self, store):
+        self.store = store
+
+    def __getattr__(self, name):
+        if name not in self.ASYNC_METHODS:
+            raise AttributeError(name)
+        method = getattr(self.store, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+    async def close(self):
+        pass
+
+
+def create_async_vector_store(db_url: str = None):
+    """Асинхронное хранилище по тому же [memory].backend: AsyncPgVectorRAG или обёртка над NumpyVectorRAG"""
+    backend = get_config_dict().get("memory", {}).get("backend", "pgvector")
+    if backend == "pgvector":
+        return AsyncPgVectorRAG(db_url)
+    return AsyncStoreAdapter(create_vector_store(db_url))
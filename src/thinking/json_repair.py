@@ -0,0 +1,94 @@
+# json_repair.py
+import json
+import re
+from typing import Any, Optional
+
+_decoder = json.JSONDecoder(strict=False)  # сырые переводы строк внутри строк — частая ошибка моделей
+
+_FENCE = re.compile(r"^```[a-zA-Z]*\s*|\s*```\s*$")
+_TRAILING_COMMA = re.compile(r",(\s*[}\]])")
+_DANGLING_KEY = re.compile(r'(?:,\s*|(?<=\{)\s*)"(?:[^"\\]|\\.)*"\s*$')
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+
+def repair_json(text: str) -> Optional[Any]:
+    """
+    Терпимый разбор JSON-ответа модели. По очереди:
+      - markdown-ограда ```json ... ``` и текст до первой { / после последней };
+      - сырые управляющие символы в строках;
+      - висячие запятые, True/False/None вне строк;
+      - оборванный ответ: незакрытая строка и скобки дописываются.
+    None — если не помогло ничего.
+    """
+    if not text:
+        return None
+    text = _FENCE.sub("", text.strip())
+    start = text.find("{")
+    if start < 0:
+        return None
+    text = text[start:]
+    for candidate in (text[:text.rfind("}") + 1], text):
+        if not candidate:
+            continue
+        for fixed in (candidate, _fix_tokens(candidate), _close_open(_fix_tokens(candidate))):
+            try:
+                return _decoder.decode(fixed)
+            except json.JSONDecodeError:
+                continue
+    return None
+
+
+def _fix_tokens(text: str) -> str:
+    """Правки вне строк: висячие запятые и питоновские литералы"""
+    out, i, in_string, escape = [], 0, False, False
+    segment_start = 0
+    while i < len(text):
+        ch = text[i]
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+                out.append(text[segment_start:i + 1])
+                segment_start = i + 1
+        elif ch == '"':
+            out.append(_fix_bare(text[segment_start:i]))
+            segment_start = i
+            in_string = True
+        i += 1
+    tail = text[segment_start:]
+    out.append(tail if in_string else _fix_bare(tail))
+    return "".join(out)
+
+
+def _fix_bare(segment: str) -> str:
+    segment = _TRAILING_COMMA.sub(r"\1", segment)
+    return re.sub(r"\b(True|False|None)\b", lambda m: _PY_LITERALS[m.group(1)], segment)
+
+
+def _close_open(text: str) -> str:
+    """Дописывает закрывающие кавычку и скобки оборванного ответа"""
+    stack, in_string, escape = [], False, False
+    for ch in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]" and stack:
+            stack.pop()
+    if in_string:
+        text += "\\" if escape else ""  # оборвалось на \ — экранируем сам обратный слэш
+        text += '"'
+    text = re.sub(r"[,:]\s*$", "", text.rstrip())
+    if stack and stack[-1] == "}":
+        text = _DANGLING_KEY.sub("", text)  # оборвалось после ключа: значения нет — выбрасываем ключ
+    return text + "".join(reversed(stack))
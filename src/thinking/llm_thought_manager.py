@@ -1,12 +1,29 @@
 import asyncio
 import json
-from typing import Optional
+from typing import Callable, Optional, Tuple
 
 from src.action import Action
 from src.llm.agent_client import AgentClient
+from src.llm.response_cache import ResponseCacheMiss
 from src.memory import Context, Thought
 from src.rag.agent_embeding import Embedder
+from src.thinking.json_repair import repair_json
+from src.thinking.prompt_builder import PromptBuilder, tool_calls_to_plan
+from src.thinking.stream_parser import StreamingThoughtParser
+from src.thinking.token_budget import PromptSection, TokenBudget, SITUATION_MIN_TOKENS
 from src.tool import Tool
+from src.utils.config import get_config_dict
+
+DEFAULT_CONFIDENCE = 0.8  # если модель не указала уверенность (или указала не числом)
+
+
+def coerce_confidence(value) -> float:
+    """confidence из ответа модели: null, "high" и т.п. — DEFAULT_CONFIDENCE, а не исключение"""
+    try:
+        confidence = float(value)
+    except (TypeError, ValueError):
+        return DEFAULT_CONFIDENCE
+    return confidence if 0.0 <= confidence <= 1.0 else DEFAULT_CONFIDENCE
 
 class LlmThoughtManager:
     def __init__(self, context: Context,
@@ -17,84 +34,173 @@ class LlmThoughtManager:
         self.client1 = client1
         self.client2 = client2
         self.embedder = embedder
+        config = get_config_dict()
+        self.prompt_builder = PromptBuilder.from_config(config)
+        # у моделей разные окна — бюджет на каждую
+        self.token_budgets = {client.llm: TokenBudget.from_config(config, client.llm) for client in (client1, client2)}
 
     async def llm_thinking(self, situation: str,
                            template_hints: str = None,  # ← вот они!
                            rag_context: str = None,  # ← и вот это!
-                           recent_error: str = None
+                           recent_error: str = None,
+                           client: AgentClient = None
                            ) -> Thought:
-        prompt = f"""
-Наша Цель пользователя: {self.context.user_goal or "не указана"}
-IMPORTANT:
-The parameter for write_file - "path" is FORBIDDEN.
-Use ONLY "file_path".
-Текущая ситуация:
-{situation}
-
-RAG (если есть):
-{rag_context}
-
-Ответь ТОЛЬКО JSON.
-Правила:
-1. Используй think_along ТОЛЬКО ОДИН РАЗ подряд, если нужно сформулировать новую идею. Если используешь think_along - других действий на этом шаге добавлять нельзя.
-2. После любого think_along (или если идея уже готова) — ОБЯЗАТЕЛЬНО примени её через инструменты файловой системы: create_file, edit_file, write_file и т.д.
-3. НЕ ПОВТОРЯЙ уже существующие идеи — сначала проверь через read_file или list_directory.
-4. Если видишь, что в истории уже было 2–3 think_along подряд — СРАЗУ переходи к действию с файлами.
-5. Когда достигнуты критерии указанные в цели — используй submit_task.
-Ответ строго в JSON, Начни с '{' и закончи '}':
-{{
-    "reasoning": "твои рассуждения на русском",
-    "action_plan": [
-        {{
-            "tool": "write_file",
-            "parameters": {{
-                "path": "test.py",
-                "content": "содержимое файла которое нужно сохранить...",
-                "mkdir": true
-            }}
-        }}
-    ],
-    "confidence": 0.XX
-}}
-"""
+        """client — какой моделью думать (по умолчанию client1; выбирает ModelRouter)"""
+        client = client or self.client1
         json_text = None
         try:
-            response = self.client1.request(
-                msgs=[{"role": "system", "content": "Ты думаешь быстро и по делу."},
-                      {"role": "user", "content": prompt}],
-            )
+            # await: генерация не блокирует event loop (запись памяти, другие агенты работают дальше)
+            msgs, max_tokens = self._prepare(situation, rag_context, client)
+            response = await client.arequest(msgs=msgs, tools=self.prompt_builder.api_tools,
+                                                   max_tokens=max_tokens,
+                                                   extra=self.prompt_builder.structured_kwargs())
 
-            json_text = response.choices[0].message.content.strip()
-            if json_text.startswith("```json"):
-                json_text = json_text[7:-3]
-            try:
-                data = json.loads(json_text)
-
-                return Thought(
-                    reasoning=data.get("reasoning", "LLM сгенерировал мысль"),
-                    confidence=float(data.get("confidence", 0.8)),
-                    source="llm",
-                    action_plan=data.get("action_plan")
-                )
-            except Exception as e:
-                print(f"JSON упал: {e} \n {json_text}")
+            message = response.choices[0].message
+            self._observe_response(response, client)
+            if message.tool_calls:
                 return Thought(
-                    reasoning=f"Ошибка JSON: {e} \n {json_text}",
-                    confidence=1.0,
+                    reasoning=message.content or "LLM сгенерировал мысль",
+                    confidence=0.8,
                     source="llm",
-                    action_plan=[
-                        Action(tool_name="json_error_llm")
-                    ]
+                    action_plan=tool_calls_to_plan(message.tool_calls)
                 )
+            json_text = (message.content or "").strip()
+            return self._thought_from_text(json_text)
 
+        except ResponseCacheMiss:
+            raise  # offline-режим: без ответа в кэше прогон не продолжаем
+        except Exception as e:
+            return self._error_thought(e, json_text)
+
+    async def llm_thinking_stream(self, situation: str,
+                                  rag_context: str = None,
+                                  on_action: Callable[[dict], None] = None,
+                                  on_reasoning: Callable[[str], None] = None,
+                                  client: AgentClient = None) -> Thought:
+        """
+        Потоковый вариант llm_thinking: ответ разбирается по мере генерации,
+        каждое действие action_plan уходит в on_action, как только его объект закрылся,
+        reasoning — в on_reasoning кусками. Итоговый Thought — как у llm_thinking.
+        """
+        client = client or self.client1
+        if self.prompt_builder.native_tools:
+            # tool calls приходят целиком в конце ответа — поток ничего не выигрывает
+            thought = await self.llm_thinking(situation=situation, rag_context=rag_context, client=client)
+            if thought.source == "llm" and on_action:
+                for item in thought.action_plan or []:
+                    on_action(item)
+            return thought
+        parser = StreamingThoughtParser(on_action=on_action, on_reasoning=on_reasoning)
+        try:
+            msgs, max_tokens = self._prepare(situation, rag_context, client)
+            async for delta in client.astream(msgs=msgs, max_tokens=max_tokens,
+                                                    extra=self.prompt_builder.structured_kwargs()):
+                parser.feed(delta)
+        except ResponseCacheMiss:
+            raise
         except Exception as e:
-            print(f"LLM упал: {e} \n {json_text}")
-            # Абсолютный fallback — хотя бы не падаем
-            return Thought(
-                reasoning=f"Ошибка: {e}",
-                confidence=1.0,
-                source="error_llm",
-                action_plan=[
-                    Action(tool_name="error_llm")
-                ]
-            )
\ No newline at end of file
+            if not parser.actions:
+                return self._error_thought(e, parser.text)
+            print(f"LLM оборвал поток: {e}")
+        token_budget = self.token_budgets.get(client.llm)
+        if token_budget is not None:
+            token_budget.observe_response(token_budget.counter.count(parser.text))
+        data = parser.result()
+        if not isinstance(data, dict):
+            if not parser.actions:
+                return self._thought_from_text(parser.text)  # та же обработка ошибки JSON, что без потока
+            # JSON не дописан, но часть действий уже выполняется — собираем мысль из того, что пришло
+            data = repair_json(parser.text)
+            if not isinstance(data, dict):
+                data = {}
+        # ровно те действия, что ушли на выполнение; если поток их не выделил — выполнит Agent после ответа
+        return self._thought_from_data(data, parser.actions or None)
+
+    def set_tools(self, tools: list) -> None:
+        self.prompt_builder.set_tools(tools)
+
+    def _prepare(self, situation: str, rag_context: str = None,
+                 client: AgentClient = None) -> Tuple[list, Optional[int]]:
+        """
+        Сообщения для LLM и max_tokens ответа.
+        Статичная часть (правила, инструменты, цель) — в system, шаговая — в user;
+        ситуация, RAG и история подгоняются под окно модели (TokenBudget).
+        """
+        goal = self.context.user_goal
+        token_budget = self.token_budgets.get((client or self.client1).llm)
+        if token_budget is None:
+            history = self.context.format_recent_history()
+            return self.prompt_builder.messages(goal, situation, rag_context, history), None
+        history_sections = token_budget.history_sections(self.context.memory.history)
+        sections = [
+            PromptSection("situation", situation, priority=0, min_tokens=SITUATION_MIN_TOKENS, required=True),
+            PromptSection("rag", rag_context or "", priority=5, min_tokens=50),
+        ] + history_sections
+        texts, max_tokens = token_budget.fit(self.prompt_builder.system_prompt(goal), sections)
+        # в промпт — по порядку шагов, от старых к новым
+        history = "\n".join(texts[s.name] for s in reversed(history_sections) if texts[s.name])
+        print(f"Бюджет токенов ({(client or self.client1).llm}): {token_budget.last_report}")
+        return self.prompt_builder.messages(goal, texts["situation"], texts["rag"] or None, history), max_tokens
+
+    def _observe_response(self, response, client: AgentClient):
+        token_budget = self.token_budgets.get(client.llm)
+        if token_budget is None:
+            return
+        usage = getattr(response, "usage", None)
+        if usage is not None and usage.completion_tokens:
+            tokens = usage.completion_tokens
+        else:
+            tokens = token_budget.counter.count(response.choices[0].message.content or "")
+        token_budget.observe_response(tokens, truncated=response.choices[0].finish_reason == "length")
+
+    @staticmethod
+    def _thought_from_text(json_text: str) -> Thought:
+        try:
+            data = json.loads(json_text)
+            if not isinstance(data, dict):
+                raise ValueError(f"ожидался JSON-объект, а пришёл {type(data).__name__}")
+        except Exception as e:
+            # ```json-ограда, висячие запятые, оборванный ответ — чиним, а не тратим ещё один шаг
+            data = repair_json(json_text)
+            if not isinstance(data, dict):
+                return LlmThoughtManager._json_error_thought(e, json_text)
+            print(f"JSON починен: {e}")
+        return LlmThoughtManager._thought_from_data(data)
+
+    @staticmethod
+    def _thought_from_data(data: dict, action_plan: list = None) -> Thought:
+        """Мысль из разобранного объекта ответа; поля неверного типа заменяются значениями по умолчанию"""
+        reasoning = data.get("reasoning")
+        if action_plan is None:
+            action_plan = data.get("action_plan")
+        return Thought(
+            reasoning=reasoning if isinstance(reasoning, str) and reasoning else "LLM сгенерировал мысль",
+            confidence=coerce_confidence(data.get("confidence", DEFAULT_CONFIDENCE)),
+            source="llm",
+            action_plan=action_plan if isinstance(action_plan, list) else None
+        )
+
+    @staticmethod
+    def _json_error_thought(e: Exception, json_text: str) -> Thought:
+        print(f"JSON упал: {e} \n {json_text}")
+        return Thought(
+            reasoning=f"Ошибка JSON: {e} \n {json_text}",
+            confidence=1.0,
+            source="llm",
+            action_plan=[
+                Action(tool_name="json_error_llm")
+            ]
+        )
+
+    @staticmethod
+    def _error_thought(e: Exception, json_text: Optional[str]) -> Thought:
+        print(f"LLM упал: {e} \n {json_text}")
+        # Абсолютный fallback — хотя бы не падаем
+        return Thought(
+            reasoning=f"Ошибка: {e}",
+            confidence=1.0,
+            source="error_llm",
+            action_plan=[
+                Action(tool_name="error_llm")
+            ]
+        )
@@ -0,0 +1,155 @@
+# model_router.py
+import json
+import pathlib
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Optional
+
+from src.memory import Context, Thought
+
+SMALL_MODEL = "llm2"
+LARGE_MODEL = "llm1"
+MIN_CONFIDENCE = 0.6          # ниже — ответ маленькой модели не принимаем, и следующий шаг тоже на большой
+COMPLEX_GOAL_CHARS = 1500     # длинная многошаговая цель — планирует большая модель
+MAX_SMALL_STREAK = 4          # подряд шагов на маленькой модели, потом сверка с большой
+ROUTINE_TOOLS = ("read_file", "list_directory", "directory_tree", "get_file_info", "search_files")
+ERROR_TOOLS = ("error_llm", "json_error_llm")
+DEFAULT_LOG_PATH = ".cache/routing.jsonl"
+
+
+@dataclass
+class RouteDecision:
+    llm: str
+    reason: str
+    started: float = field(default_factory=time.monotonic)
+    escalated: bool = False
+    escalation_reason: Optional[str] = None
+    small_confidence: Optional[float] = None  # уверенность отклонённого ответа маленькой модели
+    confidence: Optional[float] = None
+    valid: Optional[bool] = None
+
+
+class ModelRouter:
+    """
+    Каскад моделей: рутинный шаг (после успешного чтения, простое продолжение) думает маленькая llm2,
+    остальные — большая llm1. Ответ маленькой модели с невалидным JSON или низкой уверенностью
+    не исполняется — шаг сразу переспрашивается у большой.
+    Решения и их исходы (уверенность, валидность, успех инструментов, время) пишутся в JSONL,
+    чтобы по логу подбирать пороги.
+    """
+
+    def __init__(self, small: str = SMALL_MODEL, large: str = LARGE_MODEL,
+                 min_confidence: float = MIN_CONFIDENCE,
+                 complex_goal_chars: int = COMPLEX_GOAL_CHARS,
+                 max_small_streak: int = MAX_SMALL_STREAK,
+                 routine_tools=ROUTINE_TOOLS,
+                 log_path: Optional[str] = DEFAULT_LOG_PATH):
+        self.small = small
+        self.large = large
+        self.min_confidence = min_confidence
+        self.complex_goal_chars = complex_goal_chars
+        self.max_small_streak = max_small_streak
+        self.routine_tools = set(routine_tools)
+        self.log_path = None
+        if log_path:
+            self.log_path = pathlib.Path(log_path)
+            if not self.log_path.is_absolute():
+                self.log_path = pathlib.Path(__file__).resolve().parents[2] / self.log_path
+        self.small_streak = 0
+        self.last_thought: Optional[Thought] = None
+        self.pending: Optional[RouteDecision] = None
+        self.stats = {"small": 0, "large": 0, "escalated": 0}
+
+    @classmethod
+    def from_config(cls, config: dict) -> Optional["ModelRouter"]:
+        router_config = config.get("model_router", {})
+        if not router_config.get("enabled", False):
+            return None
+        return cls(
+            small=router_config.get("small", SMALL_MODEL),
+            large=router_config.get("large", LARGE_MODEL),
+            min_confidence=router_config.get("min_confidence", MIN_CONFIDENCE),
+            complex_goal_chars=router_config.get("complex_goal_chars", COMPLEX_GOAL_CHARS),
+            max_small_streak=router_config.get("max_small_streak", MAX_SMALL_STREAK),
+            routine_tools=router_config.get("routine_tools", ROUTINE_TOOLS),
+            log_path=router_config.get("log_path", DEFAULT_LOG_PATH),
+        )
+
+    def route(self, context: Context) -> RouteDecision:
+        """Какая модель думает на этом шаге — по последнему наблюдению и последней мысли"""
+        decision = RouteDecision(*self._choose(context))
+        self.pending = decision
+        return decision
+
+    def _choose(self, context: Context):
+        obs = context.last_observation
+        if obs is None:
+            return self.large, "first_step"
+        if len(str(context.user_goal or "")) > self.complex_goal_chars:
+            return self.large, "complex_task"
+        if not obs.success:
+            return self.large, "tool_error"
+        if obs.action.tool_name in ERROR_TOOLS:
+            return self.large, "invalid_json"
+        if self.last_thought is not None and self.last_thought.confidence < self.min_confidence:
+            return self.large, "low_confidence"
+        if self.small_streak >= self.max_small_streak:
+            return self.large, "small_streak"
+        if obs.action.tool_name in self.routine_tools:
+            return self.small, f"routine:{obs.action.tool_name}"
+        return self.large, "default"
+
+    def accept(self, decision: RouteDecision, thought: Thought) -> bool:
+        """
+        Принять мысль маленькой модели или эскалировать шаг на большую.
+        Мысль большой модели принимается всегда.
+        """
+        decision.valid = thought.source == "llm" and bool(thought.action_plan) and not any(
+            getattr(item, "tool_name", None) in ERROR_TOOLS for item in thought.action_plan)
+        decision.confidence = thought.confidence
+        if decision.llm == self.large:
+            return True
+        if not decision.valid:
+            decision.escalation_reason = "invalid_json"
+        elif thought.confidence < self.min_confidence:
+            decision.escalation_reason = "low_confidence"
+        else:
+            return True
+        decision.escalated = True
+        decision.small_confidence = thought.confidence
+        print(f"Маршрутизация: {self.small} → {self.large} ({decision.escalation_reason})")
+        return False
+
+    def thought_done(self, decision: RouteDecision, thought: Thought):
+        """Итоговая мысль шага (после возможной эскалации)"""
+        self.last_thought = thought
+        used_small = decision.llm == self.small and not decision.escalated
+        self.small_streak = self.small_streak + 1 if used_small else 0
+        self.stats["small" if used_small else "large"] += 1
+        self.stats["escalated"] += decision.escalated
+
+    def record_outcome(self, observations: list):
+        """Исход шага — успех инструментов; пишет строку в лог маршрутизации"""
+        decision, self.pending = self.pending, None
+        if decision is None or self.log_path is None:
+            return
+        record = {
+            "ts": datetime.now().isoformat(timespec="seconds"),
+            "llm": decision.llm,
+            "reason": decision.reason,
+            "escalated": decision.escalated,
+            "escalation_reason": decision.escalation_reason,
+            "small_confidence": decision.small_confidence,
+            "confidence": decision.confidence,
+            "valid": decision.valid,
+            "tools": [obs.action.tool_name for obs in observations],
+            "tools_ok": all(obs.success for obs in observations),
+            "seconds": round(time.monotonic() - decision.started, 3),
+        }
+        try:
+            self.log_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"Не удалось записать лог маршрутизации: {e}")
@@ -0,0 +1,179 @@
+# prompt_builder.py
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.mcp_server.mcp_streamable_client import convert_mcp_tool_to_openai_format
+
+# псевдо-инструменты агента: выполняются в Agent, не на MCP-сервере
+AGENT_TOOLS = [
+    {"type": "function",
+     "function": {"name": "submit_task",
+                  "description": "Задача выполнена, критерии цели достигнуты",
+                  "parameters": {"type": "object", "properties": {}}}},
+    {"type": "function",
+     "function": {"name": "think_along",
+                  "description": "Сформулировать новую идею без действий с файлами",
+                  "parameters": {"type": "object", "properties": {}}}},
+]
+
+SYSTEM_PROMPT = "Ты думаешь быстро и по делу."
+
+RULES = """IMPORTANT:
+The parameter for write_file - "path" is FORBIDDEN.
+Use ONLY "file_path".
+
+Правила:
+1. Используй think_along ТОЛЬКО ОДИН РАЗ подряд, если нужно сформулировать новую идею. Если используешь think_along - других действий на этом шаге добавлять нельзя.
+2. После любого think_along (или если идея уже готова) — ОБЯЗАТЕЛЬНО примени её через инструменты файловой системы: create_file, edit_file, write_file и т.д.
+3. НЕ ПОВТОРЯЙ уже существующие идеи — сначала проверь через read_file или list_directory.
+4. Если видишь, что в истории уже было 2–3 think_along подряд — СРАЗУ переходи к действию с файлами.
+5. Когда достигнуты критерии указанные в цели — используй submit_task."""
+
+JSON_FORMAT = """Ответ строго в JSON, Начни с '{' и закончи '}':
+{
+    "reasoning": "твои рассуждения на русском",
+    "action_plan": [
+        {
+            "tool": "write_file",
+            "parameters": {
+                "path": "test.py",
+                "content": "содержимое файла которое нужно сохранить...",
+                "mkdir": true
+            }
+        }
+    ],
+    "confidence": 0.XX
+}"""
+
+STRUCTURED_MODES = ("off", "response_format", "guided_json")
+
+NATIVE_FORMAT = """Рассуждения на русском пиши обычным текстом, действия — вызовами инструментов (tool calls).
+Несколько независимых действий — несколько вызовов в одном ответе."""
+
+
+class PromptBuilder:
+    """
+    Промпт в порядке «статичное → меняющееся», чтобы префикс совпадал байт-в-байт от шага к шагу
+    и сервер инференса переиспользовал KV-кэш:
+      system: правила, формат ответа, каталог инструментов, цель — неизменны в пределах задачи;
+      user:   текущая ситуация (последний шаг, история, план) и найденная память — каждый шаг свои.
+    Каталог рендерится один раз (json с sort_keys) и пересобирается только при смене списка инструментов.
+    native_tools=True — инструменты уходят в параметр tools= API, а не текстом.
+    structured_output — JSON-схема ответа (мысль + параметры каждого инструмента) для сервера:
+      "response_format" — OpenAI-совместимый response_format json_schema,
+      "guided_json"     — extra_body guided_json (vLLM с guided decoding).
+    """
+
+    def __init__(self, native_tools: bool = False, structured_output: str = "off"):
+        if structured_output not in STRUCTURED_MODES:
+            raise ValueError(f"Неизвестный режим structured_output: {structured_output}")
+        self.native_tools = native_tools
+        self.structured_output = structured_output
+        self._thought_schema: Optional[Dict[str, Any]] = None
+        self._tools_source = None
+        self._tools_key: Optional[Tuple] = None
+        self.tool_specs: List[Dict[str, Any]] = list(AGENT_TOOLS)
+        self.tool_catalog = self._render_catalog(self.tool_specs)
+        self._system_cache: Optional[Tuple[Any, str]] = None
+
+    @classmethod
+    def from_config(cls, config: dict) -> "PromptBuilder":
+        prompt_config = config.get("prompt", {})
+        return cls(prompt_config.get("native_tools", False), prompt_config.get("structured_output", "off"))
+
+    def set_tools(self, tools) -> None:
+        """Список MCP-инструментов; повторный вызов с тем же списком ничего не пересчитывает"""
+        if tools is None or tools is self._tools_source:
+            return
+        key = tuple((t.name, t.description, json.dumps(t.inputSchema, sort_keys=True)) for t in tools)
+        self._tools_source = tools
+        if key == self._tools_key:
+            return
+        self._tools_key = key
+        self.tool_specs = [convert_mcp_tool_to_openai_format(t) for t in tools] + AGENT_TOOLS
+        self.tool_catalog = self._render_catalog(self.tool_specs)
+        self._system_cache = None
+        self._thought_schema = None
+
+    @staticmethod
+    def _render_catalog(specs: List[Dict[str, Any]]) -> str:
+        return "\n".join(json.dumps(spec, ensure_ascii=False, sort_keys=True) for spec in specs)
+
+    def system_prompt(self, goal) -> str:
+        if self._system_cache is not None and self._system_cache[0] == goal:
+            return self._system_cache[1]
+        parts = [SYSTEM_PROMPT, RULES]
+        if self.native_tools:
+            parts.append(NATIVE_FORMAT)
+        else:
+            parts.append(JSON_FORMAT)
+            parts.append(f"MCP инструменты:\n{self.tool_catalog}")
+        parts.append(f"Наша Цель пользователя: {goal or 'не указана'}")
+        prompt = "\n\n".join(parts)
+        self._system_cache = (goal, prompt)
+        return prompt
+
+    def messages(self, goal, situation: str, rag_context: str = None,
+                 history: str = None) -> List[Dict[str, str]]:
+        user = f"Текущая ситуация:\n{situation}"
+        if history is not None:
+            user += f"\n\nИстория:\n{history or 'История пуста'}"
+        user += f"\n\nRAG (если есть):\n{rag_context}"
+        if not self.native_tools:
+            user += "\n\nОтветь ТОЛЬКО JSON."
+        return [{"role": "system", "content": self.system_prompt(goal)},
+                {"role": "user", "content": user}]
+
+    def thought_schema(self) -> Dict[str, Any]:
+        """JSON-схема ответа: reasoning, confidence и action_plan, где у каждого инструмента — свои параметры"""
+        if self._thought_schema is None:
+            actions = []
+            for spec in self.tool_specs:
+                function = spec["function"]
+                action = {"type": "object",
+                          "properties": {"tool": {"const": function["name"]}},
+                          "required": ["tool"]}
+                parameters = function.get("parameters") or {}
+                if parameters.get("properties"):
+                    action["properties"]["parameters"] = parameters
+                    action["required"].append("parameters")
+                actions.append(action)
+            self._thought_schema = {
+                "type": "object",
+                "properties": {
+                    "reasoning": {"type": "string"},
+                    "action_plan": {"type": "array", "items": {"anyOf": actions}, "minItems": 1},
+                    "confidence": {"type": "number", "minimum": 0, "maximum": 1},
+                },
+                "required": ["reasoning", "action_plan", "confidence"],
+            }
+        return self._thought_schema
+
+    def structured_kwargs(self) -> Dict[str, Any]:
+        """Доп. параметры запроса для ограниченной схемой генерации (пусто — режим выключен)"""
+        if self.native_tools or self.structured_output == "off":
+            return {}
+        if self.structured_output == "guided_json":
+            return {"extra_body": {"guided_json": self.thought_schema()}}
+        return {"response_format": {"type": "json_schema",
+                                    "json_schema": {"name": "thought", "schema": self.thought_schema()}}}
+
+    @property
+    def api_tools(self) -> Optional[List[Dict[str, Any]]]:
+        """Для параметра tools= запроса (None — инструменты уже в тексте промпта)"""
+        return self.tool_specs if self.native_tools else None
+
+
+def tool_calls_to_plan(tool_calls) -> List[Dict[str, Any]]:
+    """tool_calls ответа API → action_plan в формате JSON-ответа: [{"tool": ..., "parameters": {...}}]"""
+    plan = []
+    for call in tool_calls or []:
+        try:
+            parameters = json.loads(call.function.arguments or "{}")
+        except json.JSONDecodeError:
+            parameters = {}
+        item = {"tool": call.function.name}
+        if parameters:
+            item["parameters"] = parameters
+        plan.append(item)
+    return plan
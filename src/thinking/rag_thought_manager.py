@@ -6,8 +6,15 @@ from src.action import Action
 from src.llm.agent_client import AgentClient
 from src.memory import Context, Thought
 from src.rag.agent_embeding import Embedder
+from src.rag.embeding_utils import extract_short_text
+from src.rag.memory_writer import MemoryWriteQueue
+from src.thinking.retrieval_cache import RetrievalCache
 from src.tool import Tool
 
+MEMORY_MAX_DISTANCE = 0.12  # порог поиска по памяти; он же — радиус сброса кэша при записи
+STEP_EMBEDDINGS = 8         # эмбеддингов ситуаций, ждущих записи (поиск следующего шага идёт до записи этого)
+
+
 class RagThoughtManager:
     def __init__(self, context: Context,
                  client1: AgentClient,
@@ -17,17 +24,19 @@ class RagThoughtManager:
         self.client1 = client1
         self.client2 = client2
         self.embedder = embedder
+        self.hybrid = embedder.hybrid_config("enabled") if embedder else False
+        self.retrieval_cache = RetrievalCache.from_config(embedder.config) if embedder else None
+        self.memory_writer = MemoryWriteQueue.from_config(
+            embedder, embedder.config, on_written=self._memory_written) if embedder else None
+        # эмбеддинги, посчитанные при поиске: запись памяти их не пересчитывает
+        self.step_embeddings: dict[str, list[float]] = {}
 
     async def rag_thinking(self, situation: str) -> Optional[str]:
         # 1. По коду
         # code_chunks = await asyncio.to_thread(self.embedder.find_chunks, situation, top_k=3)
 
         # 2. По памяти агента — это важнее!
-        memory_chunks = await asyncio.to_thread(
-            self.embedder.find_memory_chunks,
-            situation,
-            top_k=5,
-            max_distance=0.12)
+        memory_chunks = await self._find_memory(situation)
 
         if not memory_chunks:
             return None
@@ -42,12 +51,73 @@ class RagThoughtManager:
         reasoning = "\n".join(lines)
         return reasoning
 
-    async def save_to_rag(self, thought):
+    async def _find_memory(self, situation: str) -> list:
+        """
+        Поиск по памяти через кэш прогона: ключ — нормализованная ситуация,
+        эмбеддинг считается по ключу (пути и id заменены, длина ограничена).
+        """
+        key = RetrievalCache.key(situation)
+        cache = self.retrieval_cache
+        generation = cache.generation if cache is not None else None
+        if cache is not None:
+            cached = cache.get(key)
+            if cached is not None:
+                self._remember_embedding(key, cache.embedding(key))
+                return cached
+
+        embedding = await self.embedder.aget_embedding(key)
+        self._remember_embedding(key, embedding)
+        if cache is not None and embedding:
+            cached = cache.get_near(embedding)
+            if cached is not None:
+                return cached
+
+        # вектор + полнотекст (имена файлов, идентификаторы, тексты ошибок) одним вызовом;
+        # полнотекст — по исходной ситуации, там пути не заменены, но без слов цели —
+        # они совпадают со всеми записями этой задачи
+        if self.hybrid:
+            memory_chunks = await self.embedder.ahybrid_find_memory_chunks(
+                situation, top_k=5, max_distance=MEMORY_MAX_DISTANCE, embedding=embedding,
+                lexical_exclude=str(self.context.user_goal or ""))
+        else:
+            memory_chunks = await self.embedder.afind_memory_chunks(
+                situation, top_k=5, max_distance=MEMORY_MAX_DISTANCE, embedding=embedding)
+        if cache is not None:
+            cache.put(key, embedding, memory_chunks, generation)
+        return memory_chunks
+
+    def _memory_written(self, chunks: list):
+        """
+        Пачка памяти закоммичена (колбэк MemoryWriteQueue): сбрасываем близкие ситуации.
+        Не при постановке в очередь — поиск до записи закэшировал бы выдачу без неё.
+        """
+        if self.retrieval_cache is None:
+            return
+        for chunk in chunks:
+            self.retrieval_cache.invalidate(chunk.embedding, MEMORY_MAX_DISTANCE)
+
+    def _remember_embedding(self, key: str, embedding: Optional[list]):
+        # в конвейере поиск шага N+1 может пройти раньше записи шага N — храним несколько последних
+        if not embedding:
+            return
+        self.step_embeddings.pop(key, None)
+        self.step_embeddings[key] = embedding
+        while len(self.step_embeddings) > STEP_EMBEDDINGS:
+            self.step_embeddings.pop(next(iter(self.step_embeddings)))
+
+    async def save_to_rag(self, thought, retrieval_key: str = None, observation=None):
+        """
+        retrieval_key — краткая ситуация шага (та же, по которой искали в rag_thinking):
+        память пишется под тем же нормализованным ключом и с тем же эмбеддингом.
+        Без него ключ строится так же (extract_short_text), только по текущему контексту.
+        observation — наблюдение шага; по умолчанию последнее в контексте
+        (конвейер пишет шаг N, когда контекст, возможно, уже ушёл дальше).
+        """
         if self.embedder:
-            last_obs = self.context.last_observation
+            last_obs = observation or self.context.last_observation
             if last_obs and last_obs.action.tool_name not in ["think_along", "empty_action"]:
-                # Краткая ситуация — можно взять short_text из build_situation, если перепишешь на возврат кортежа
-                situation_short = f"Цель: {self.context.user_goal} | Последнее: {last_obs.action.tool_name}"
+                # поиск и запись — по одной нормализованной строке, иначе step_embeddings не совпадёт
+                situation_short = RetrievalCache.key(retrieval_key or extract_short_text(self.context))
 
                 action_desc = f"Вызвал {last_obs.action.tool_name} с {str(last_obs.action.params)[:150]}"
 
@@ -60,19 +130,35 @@ class RagThoughtManager:
                 reasoning = thought.reasoning if 'thought' in locals() else None
                 action_plan = thought.action_plan if 'thought' in locals() and hasattr(thought, 'action_plan') else None
 
-                asyncio.create_task(
-                    asyncio.to_thread(
-                        self.embedder.save_memory_chunk,
-                        situation=situation_short,
-                        action_description=action_desc,
-                        result_summary=result_summary,
-                        reasoning=reasoning,
-                        action_plan=str(action_plan) if action_plan else None,
-                        success=last_obs.success
-                    )
-                )
+                embedding = self.step_embeddings.pop(situation_short, None)
+
+                # в очередь отложенной записи: пачками, одной транзакцией; при полной очереди ждём;
+                # кэш поиска сбрасывается после коммита пачки (_memory_written)
+                await self.memory_writer.put(dict(
+                    situation=situation_short,
+                    action_description=action_desc,
+                    result_summary=result_summary,
+                    reasoning=reasoning,
+                    action_plan=str(action_plan) if action_plan else None,
+                    success=last_obs.success
+                ), embedding=embedding)
+
+    async def init(self):
+        """Схема памяти (миграции столбцов компакции, индексы) — до первого поиска"""
+        if self.embedder:
+            await self.embedder.async_rag.memory_init_db()
+        if self.retrieval_cache is not None:
+            self.retrieval_cache.clear()
+
+    async def close(self):
+        """Дописывает отложенную память — вызывается при завершении агента"""
+        if self.memory_writer:
+            await self.memory_writer.close()
+        if self.retrieval_cache is not None:
+            print(f"Кэш поиска по памяти: {self.retrieval_cache.stats}")
 
     async def _get_rag_context(self, situation) -> str:
-        chunk_list = self.embedder.find_chunks(situation, top_k=3, max_distance = 0.1)
+        find = self.embedder.hybrid_find_chunks if self.hybrid else self.embedder.find_chunks
+        chunk_list = find(situation, top_k=3, max_distance = 0.1)
         result = ",".join(x.content for x in chunk_list)
         return result
\ No newline at end of file
@@ -0,0 +1,100 @@
+# retrieval_cache.py
+import math
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+from src.rag.embeding_utils import _normalize_for_embedding
+
+RETRIEVAL_CACHE_SIZE = 64      # ситуаций за прогон
+NEAR_MATCH_DISTANCE = 0.02     # косинусное расстояние, при котором ситуация считается той же
+
+
+def cosine_distance(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return 1.0 - dot / norm if norm else 1.0
+
+
+class RetrievalCache:
+    """
+    Кэш поиска по памяти на один прогон агента: соседние шаги задачи дают почти одинаковые ситуации.
+      - точное совпадение нормализованной ситуации — без эмбеддинга и без запроса к базе;
+      - эмбеддинг ближе near_distance к уже искавшемуся — без запроса к базе;
+      - запись памяти сбрасывает только те ситуации, в выдачу которых она могла попасть.
+    generation растёт при каждом сбросе: поиск, начатый до записи, свой результат не кладёт.
+    """
+
+    def __init__(self, max_entries: int = RETRIEVAL_CACHE_SIZE, near_distance: float = NEAR_MATCH_DISTANCE):
+        self.max_entries = max_entries
+        self.near_distance = near_distance
+        # ключ -> (эмбеддинг, результаты поиска); порядок — LRU
+        self.entries: "OrderedDict[str, Tuple[Optional[List[float]], list]]" = OrderedDict()
+        self.stats = {"exact": 0, "near": 0, "miss": 0, "invalidated": 0}
+        self.generation = 0
+
+    @classmethod
+    def from_config(cls, config: dict) -> Optional["RetrievalCache"]:
+        cache_config = config.get("retrieval_cache", {})
+        if not cache_config.get("enabled", True):
+            return None
+        return cls(cache_config.get("max_entries", RETRIEVAL_CACHE_SIZE),
+                   cache_config.get("near_distance", NEAR_MATCH_DISTANCE))
+
+    @staticmethod
+    def key(situation: str) -> str:
+        return _normalize_for_embedding(situation)
+
+    def get(self, key: str) -> Optional[list]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        self.entries.move_to_end(key)
+        self.stats["exact"] += 1
+        return entry[1]
+
+    def embedding(self, key: str) -> Optional[List[float]]:
+        entry = self.entries.get(key)
+        return entry[0] if entry else None
+
+    def get_near(self, embedding: List[float]) -> Optional[list]:
+        best_key, best_distance = None, self.near_distance
+        for key, (cached_embedding, _) in self.entries.items():
+            if cached_embedding is None:
+                continue
+            distance = cosine_distance(embedding, cached_embedding)
+            if distance <= best_distance:
+                best_key, best_distance = key, distance
+        if best_key is None:
+            self.stats["miss"] += 1
+            return None
+        self.entries.move_to_end(best_key)
+        self.stats["near"] += 1
+        return self.entries[best_key][1]
+
+    def put(self, key: str, embedding: Optional[List[float]], results: list, generation: int = None):
+        """generation — значение self.generation на начало поиска; если с тех пор был сброс, не кэшируем"""
+        if generation is not None and generation != self.generation:
+            return
+        self.entries[key] = (embedding, results)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def invalidate(self, embedding: Optional[List[float]] = None, max_distance: Optional[float] = None):
+        """
+        Новая память с эмбеддингом embedding попадает только в поиски ближе max_distance —
+        их и сбрасываем (лексическую часть гибридного поиска не учитываем — в пределах прогона
+        это допустимая неточность). Без эмбеддинга (или порога) сбрасывается всё.
+        """
+        if embedding is None or max_distance is None:
+            stale = list(self.entries)
+        else:
+            stale = [key for key, (cached_embedding, _) in self.entries.items()
+                     if cached_embedding is None or cosine_distance(embedding, cached_embedding) <= max_distance]
+        for key in stale:
+            del self.entries[key]
+        self.stats["invalidated"] += len(stale)
+        self.generation += 1
+
+    def clear(self):
+        self.entries.clear()
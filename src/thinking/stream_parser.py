@@ -0,0 +1,147 @@
+# stream_parser.py
+import json
+from typing import Callable, List, Optional
+
+REASONING_KEY = "reasoning"
+ACTIONS_KEY = "action_plan"
+
+_decoder = json.JSONDecoder(strict=False)  # модели иногда пишут в строках сырые переводы строк
+
+
+class StreamingThoughtParser:
+    """
+    Инкрементальный разбор ответа LLM вида {"reasoning": "...", "action_plan": [{...}, ...], ...}
+    по мере прихода текста:
+      - on_reasoning(текст) — очередной кусок строки reasoning, уже раскодированный;
+      - on_action(dict)     — очередной объект action_plan, как только закрылась его скобка.
+    Текст до первой { (```json и т.п.) пропускается. Полный JSON в конце — result().
+    """
+
+    def __init__(self, on_action: Callable[[dict], None] = None, on_reasoning: Callable[[str], None] = None):
+        self.on_action = on_action
+        self.on_reasoning = on_reasoning
+        self.parts: List[str] = []   # ответ кусками; целиком склеивается только по запросу (text)
+        self._text: Optional[str] = None
+        self.stack: List[str] = []   # открытые { и [
+        self.in_string = False
+        self.escape = False
+        self.expect_key = False      # внутри объекта верхнего уровня ждём ключ
+        self.top_key: Optional[str] = None  # текущий ключ объекта верхнего уровня
+        # сырой текст открытой строки верхнего уровня (ключ или ещё не отданный хвост reasoning)
+        self.string_parts: Optional[List[str]] = None
+        self.action_parts: Optional[List[str]] = None  # сырой текст открытого объекта action_plan
+        self.actions: List[dict] = []  # ровно те действия, что ушли в on_action
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = "".join(self.parts)
+        return self._text
+
+    def feed(self, delta: str):
+        """Разбирается только новый кусок: между вызовами живут стек скобок и незакрытые строка/объект"""
+        self.parts.append(delta)
+        self._text = None
+        string_from = 0 if self.string_parts is not None else None
+        action_from = 0 if self.action_parts is not None else None
+        for k, ch in enumerate(delta):
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    if string_from is not None:
+                        self.string_parts.append(delta[string_from:k])
+                        string_from = None
+                        self._close_string()
+            elif not self.stack:
+                if ch == "{":
+                    self.stack.append("{")
+                    self.expect_key = True
+            elif ch == '"':
+                self.in_string = True
+                if len(self.stack) == 1:
+                    self.string_parts, string_from = [], k + 1
+            elif ch in "{[":
+                if ch == "{" and self._in_action_list():
+                    self.action_parts, action_from = [], k
+                self.stack.append(ch)
+            elif ch in "}]":
+                self.stack.pop()
+                if ch == "}" and self.action_parts is not None and self._in_action_list():
+                    self.action_parts.append(delta[action_from:k + 1])
+                    self._emit_action("".join(self.action_parts))
+                    self.action_parts, action_from = None, None
+            elif len(self.stack) == 1:
+                if ch == ",":
+                    self.expect_key = True
+                elif ch == ":":
+                    self.expect_key = False
+        if action_from is not None:
+            self.action_parts.append(delta[action_from:])
+        if string_from is not None:
+            self.string_parts.append(delta[string_from:])
+            if self._in_reasoning():
+                self._emit_reasoning()
+
+    def _in_action_list(self) -> bool:
+        return len(self.stack) == 2 and self.stack[1] == "[" and self.top_key == ACTIONS_KEY
+
+    def _in_reasoning(self) -> bool:
+        return len(self.stack) == 1 and not self.expect_key and self.top_key == REASONING_KEY
+
+    def _close_string(self):
+        if self.expect_key:
+            self.top_key = _decode("".join(self.string_parts))
+        elif self.top_key == REASONING_KEY:
+            self._emit_reasoning(final=True)
+        self.string_parts = None
+
+    def _emit_reasoning(self, final: bool = False):
+        """
+        Раскодирует только ещё не отданный хвост reasoning. Хвост может оборваться посреди
+        escape-последовательности или суррогатной пары — такой остаток ждёт следующего куска.
+        """
+        raw = "".join(self.string_parts)
+        for cut in range(len(raw), max(len(raw) - 12, 0) - 1, -1):
+            decoded = _decode(raw[:cut])
+            if decoded is None:
+                continue
+            if not final and decoded and "\ud800" <= decoded[-1] <= "\udbff":
+                continue  # первая половина суррогатной пары, вторая ещё не пришла
+            break
+        else:
+            return
+        self.string_parts = [raw[cut:]]
+        if decoded and self.on_reasoning:
+            self.on_reasoning(decoded)
+
+    def _emit_action(self, raw: str):
+        try:
+            action = _decoder.decode(raw)
+        except json.JSONDecodeError:
+            return
+        if not isinstance(action, dict) or "tool" not in action:
+            return  # без инструмента выполнять нечего — и в action_plan мысли его нет
+        self.actions.append(action)
+        if self.on_action:
+            self.on_action(action)
+
+    def result(self) -> Optional[dict]:
+        """Весь ответ как JSON (от первой { до последней }) или None, если он не разбирается"""
+        start, end = self.text.find("{"), self.text.rfind("}")
+        if start < 0 or end < start:
+            return None
+        try:
+            return _decoder.decode(self.text[start:end + 1])
+        except json.JSONDecodeError:
+            return None
+
+
+def _decode(raw: str) -> Optional[str]:
+    try:
+        return _decoder.decode(f'"{raw}"')
+    except json.JSONDecodeError:
+        return None
@@ -1,15 +1,18 @@
 import asyncio
 import json
-from typing import Optional
+from typing import Callable, Optional
 
 from src.action import Action
 from src.llm.agent_client import AgentClient
 from src.memory import Context, Thought
 from src.rag.agent_embeding import Embedder
+from src.rag.embeding_utils import extract_short_text
 from src.thinking.llm_thought_manager import LlmThoughtManager
+from src.thinking.model_router import ModelRouter
 from src.thinking.rag_thought_manager import RagThoughtManager
 from src.thinking.template_thought_manager import TemplateThoughtManager
 from src.tool import Tool
+from src.utils.config import get_config_dict
 
 
 # Ядро мышления агента
@@ -18,8 +21,12 @@ class ThoughtManager:
         self.context = context
         self.client1 = AgentClient("llm1")
         self.client2 = AgentClient("llm2")
-        self.embedder = Embedder("embedding_llm1")
+        # один Embedder (и пул соединений) можно разделить между агентами — передайте его явно
+        self.embedder = embedder or Embedder("embedding_llm1")
         self.tools = tools
+        self.clients = {self.client1.llm: self.client1, self.client2.llm: self.client2}
+        # каскад llm2 → llm1 ([model_router]); None — всегда client1
+        self.model_router = ModelRouter.from_config(get_config_dict())
         self.rag_thought_manager = RagThoughtManager(
             context = self.context,
             client1 = self.client1,
@@ -40,14 +47,43 @@ class ThoughtManager:
         )
 
     # Основной метод мышления, вызывающий все уровни
-    async def think(self,tools: list[Tool], situation: str) -> Thought:
-        self.tools = tools
-
+    async def think(self,tools: list[Tool], situation: str, retrieval_key: str = None,
+                    on_action: Callable[[dict], None] = None,
+                    on_reasoning: Callable[[str], None] = None) -> Thought:
+        """
+        situation — полный текст для LLM, retrieval_key — краткая ситуация для поиска по памяти.
+        С on_action ответ LLM читается потоком: каждое действие плана отдаётся сразу, как только сгенерировано.
+        """
         #template_hints = self.template_thought_manager.template_thinking(situation)
 
-        rag_context = await self.rag_thought_manager.rag_thinking(situation)
+        # без ключа — та же краткая ситуация, что возьмёт save_to_rag (эмбеддинг переиспользуется)
+        rag_context = await self.retrieve(retrieval_key or extract_short_text(self.context))
         # recent_errors = self._get_recent_errors()
 
+        return await self.reason(tools, situation, rag_context, on_action, on_reasoning)
+
+    async def retrieve(self, retrieval_key: str) -> Optional[str]:
+        """Поиск по памяти — отдельно от reason, чтобы конвейер Agent мог запускать его заранее"""
+        return await self.rag_thought_manager.rag_thinking(retrieval_key)
+
+    async def reason(self, tools: list[Tool], situation: str, rag_context: Optional[str],
+                     on_action: Callable[[dict], None] = None,
+                     on_reasoning: Callable[[str], None] = None) -> Thought:
+        """Мысль LLM по ситуации и уже найденной памяти (rag_context=None — без памяти)"""
+        self.tools = tools
+        self.llm_thought_manager.set_tools(tools)  # каталог пересобирается, только если список изменился
+
+        if self.model_router is not None:
+            return await self._routed_thinking(situation, rag_context, on_action, on_reasoning)
+
+        if on_action is not None:
+            return await self.llm_thought_manager.llm_thinking_stream(
+                situation=situation,
+                rag_context=rag_context,
+                on_action=on_action,
+                on_reasoning=on_reasoning
+            )
+
         llm_thought = await self.llm_thought_manager.llm_thinking(
             situation=situation,
             #template_hints=template_hints,  # ← вот они!
@@ -56,3 +92,34 @@ class ThoughtManager:
         )
 
         return llm_thought
+
+    async def _routed_thinking(self, situation: str, rag_context: str,
+                               on_action: Callable[[dict], None] = None,
+                               on_reasoning: Callable[[str], None] = None) -> Thought:
+        """
+        Каскад: рутинный шаг — маленькой модели, без потока (её ответ ещё может быть отклонён,
+        а действия из потока уже ушли бы на выполнение); отклонённый — сразу большой.
+        """
+        decision = self.model_router.route(self.context)
+        thought = None
+        if decision.llm != self.model_router.large:
+            thought = await self.llm_thought_manager.llm_thinking(
+                situation=situation, rag_context=rag_context, client=self.clients[decision.llm])
+            if self.model_router.accept(decision, thought):
+                if on_action is not None and thought.source == "llm":
+                    for item in thought.action_plan or []:
+                        on_action(item)
+            else:
+                thought = None
+        if thought is None:
+            large = self.clients[self.model_router.large]
+            if on_action is not None:
+                thought = await self.llm_thought_manager.llm_thinking_stream(
+                    situation=situation, rag_context=rag_context,
+                    on_action=on_action, on_reasoning=on_reasoning, client=large)
+            else:
+                thought = await self.llm_thought_manager.llm_thinking(
+                    situation=situation, rag_context=rag_context, client=large)
+            self.model_router.accept(decision, thought)
+        self.model_router.thought_done(decision, thought)
+        return thought
@@ -0,0 +1,203 @@
+# token_budget.py
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import tiktoken  # необязательная зависимость: без неё — оценка по символам
+except ImportError:
+    tiktoken = None
+
+CONTEXT_WINDOW = 32768         # токенов, если у модели в config.toml не указан context_window
+TOKENIZER_ENCODING = "cl100k_base"
+CHARS_PER_TOKEN = 3.0          # оценка без токенизатора (русский текст и код — ближе к 3, чем к 4)
+MIN_RESPONSE_TOKENS = 1024
+MAX_RESPONSE_TOKENS = 16382
+RESPONSE_HEADROOM = 2.0        # запас к самому длинному из недавних ответов
+RECENT_RESPONSES = 8
+HISTORY_STEPS = 10             # сколько последних наблюдений вообще рассматривается
+LAST_OUTPUT_TOKENS = 6000      # вывод последнего действия (часто — прочитанный файл) обрезается до
+HISTORY_OUTPUT_TOKENS = 600    # вывод более старых действий обрезается до
+PROMPT_OVERHEAD_TOKENS = 64    # служебные токены шаблона чата
+SITUATION_MIN_TOKENS = 200     # ситуацию шага не выбрасываем — обрезаем не короче этого
+
+
+class TokenCounter:
+    """Счётчик токенов: tiktoken, если установлен, иначе оценка по длине текста"""
+
+    def __init__(self, encoding: str = TOKENIZER_ENCODING):
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.get_encoding(encoding)
+            except Exception as e:  # словарь не скачан (офлайн) и т.п.
+                print(f"tiktoken недоступен ({e}), токены считаются по символам")
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return int(len(text) / CHARS_PER_TOKEN) + 1
+
+    def truncate(self, text: str, max_tokens: int, keep: str = "head") -> str:
+        """
+        Обрезает текст до max_tokens: keep="head" — начало, "tail" — конец,
+        "both" — начало и конец с пометкой о пропуске посередине (для выводов инструментов).
+        """
+        tokens = self.count(text)
+        if tokens <= max_tokens:
+            return text
+        if max_tokens <= 0:
+            return ""
+        chars = int(len(text) * max_tokens / tokens)
+        if keep == "tail":
+            return "…" + text[-chars:]
+        if keep == "both":
+            half = chars // 2
+            return f"{text[:half]}\n…[пропущено ~{tokens - max_tokens} токенов]…\n{text[-half:]}"
+        return text[:chars] + "…"
+
+
+@dataclass
+class PromptSection:
+    name: str
+    text: str
+    priority: int          # меньше — важнее; обрезаются в первую очередь самые неважные
+    keep: str = "head"     # какую часть оставлять при обрезке (см. TokenCounter.truncate)
+    min_tokens: int = 0    # если после обрезки остаётся меньше — секция выбрасывается целиком
+    required: bool = False  # не выбрасывается: обрезается не короче min_tokens
+    tokens: int = 0
+
+
+class TokenBudget:
+    """
+    Распределение окна контекста модели на шаг:
+      окно = неизменная часть промпта (правила, инструменты, цель) + ситуация + история + RAG + ответ.
+    Неизменная часть не режется (на ней держится кэш префикса), при нехватке места
+    сначала обрезаются и выбрасываются самые старые шаги истории, затем RAG,
+    затем последний шаг; ситуация (required) только обрезается.
+    max_tokens ответа подбирается по длине недавних ответов, а не фиксированные 16К,
+    и не выходит за остаток окна; под ответ всегда остаётся не меньше min_response_tokens.
+    """
+
+    def __init__(self, context_window: int = CONTEXT_WINDOW,
+                 min_response_tokens: int = MIN_RESPONSE_TOKENS,
+                 max_response_tokens: int = MAX_RESPONSE_TOKENS,
+                 history_steps: int = HISTORY_STEPS,
+                 last_output_tokens: int = LAST_OUTPUT_TOKENS,
+                 history_output_tokens: int = HISTORY_OUTPUT_TOKENS,
+                 counter: TokenCounter = None):
+        self.context_window = context_window
+        self.min_response_tokens = min_response_tokens
+        self.max_response_tokens = max_response_tokens
+        self.history_steps = history_steps
+        self.last_output_tokens = last_output_tokens
+        self.history_output_tokens = history_output_tokens
+        self.counter = counter or TokenCounter()
+        self.recent_responses = deque(maxlen=RECENT_RESPONSES)
+        self._system_tokens: Optional[Tuple[str, int]] = None
+        self.last_report: Dict[str, int] = {}
+
+    @classmethod
+    def from_config(cls, config: dict, llm: str = "llm1") -> Optional["TokenBudget"]:
+        budget_config = config.get("token_budget", {})
+        if not budget_config.get("enabled", True):
+            return None
+        return cls(
+            context_window=config.get(llm, {}).get("context_window", CONTEXT_WINDOW),
+            min_response_tokens=budget_config.get("min_response_tokens", MIN_RESPONSE_TOKENS),
+            max_response_tokens=budget_config.get("max_response_tokens", MAX_RESPONSE_TOKENS),
+            history_steps=budget_config.get("history_steps", HISTORY_STEPS),
+            last_output_tokens=budget_config.get("last_output_tokens", LAST_OUTPUT_TOKENS),
+            history_output_tokens=budget_config.get("history_output_tokens", HISTORY_OUTPUT_TOKENS),
+            counter=TokenCounter(budget_config.get("encoding", TOKENIZER_ENCODING)),
+        )
+
+    def response_tokens(self) -> int:
+        """Ожидаемый размер ответа: самый длинный из недавних с запасом, в пределах [min, max]"""
+        if not self.recent_responses:
+            return self.max_response_tokens
+        expected = int(max(self.recent_responses) * RESPONSE_HEADROOM)
+        return max(self.min_response_tokens, min(self.max_response_tokens, expected))
+
+    def observe_response(self, tokens: int, truncated: bool = False):
+        """Размер очередного ответа; обрезанный по max_tokens — сигнал, что лимит был мал"""
+        if truncated:
+            tokens = max(tokens, self.response_tokens())  # следующий лимит будет вдвое больше
+        self.recent_responses.append(tokens)
+
+    def history_sections(self, history: list) -> List[PromptSection]:
+        """Последние history_steps наблюдений: чем старее шаг, тем ниже приоритет; выводы обрезаются сразу"""
+        recent = history[-self.history_steps:]
+        sections = []
+        for age, obs in enumerate(reversed(recent)):
+            mark = "[Success]" if obs.success else "[Error]"
+            limit = self.last_output_tokens if age == 0 else self.history_output_tokens
+            output = self.counter.truncate(str(obs.output), limit, keep="both")
+            sections.append(PromptSection(
+                name=f"history_{age}",
+                text=f"{mark} {obs.action.tool_name}: {obs.action.params} - результат: {output}",
+                priority=1 if age == 0 else 10 + age,  # последний шаг важнее найденной памяти
+                keep="both",
+                min_tokens=40,
+            ))
+        return sections
+
+    def fit(self, system: str, sections: List[PromptSection]) -> Tuple[Dict[str, str], int]:
+        """
+        Подгоняет секции под окно. Возвращает (имя -> текст, max_tokens для ответа).
+        Выброшенная секция — пустая строка.
+        """
+        if self._system_tokens is None or self._system_tokens[0] is not system:
+            self._system_tokens = (system, self.counter.count(system))
+        system_tokens = self._system_tokens[1]
+        response_tokens = self.response_tokens()
+        # ответу резервируется не больше половины окна — иначе первый шаг (max_response_tokens) вытеснит всё,
+        # но и не меньше min_response_tokens — секции режутся, пока столько не освободится
+        reserved = max(self.min_response_tokens, min(response_tokens, self.context_window // 2))
+        for section in sections:
+            section.tokens = self.counter.count(section.text)
+        available = self.context_window - system_tokens - reserved - PROMPT_OVERHEAD_TOKENS
+        overflow = sum(s.tokens for s in sections) - available
+        trimmed = dropped = 0
+        for section in sorted(sections, key=lambda s: -s.priority):
+            if overflow <= 0:
+                break
+            target = section.tokens - overflow
+            if target < section.min_tokens and not section.required:
+                overflow -= section.tokens
+                section.text, section.tokens = "", 0
+                dropped += 1
+                continue
+            target = max(target, min(section.min_tokens, section.tokens))
+            if target >= section.tokens:
+                continue
+            text = self.counter.truncate(section.text, target, section.keep)
+            new_tokens = self.counter.count(text)
+            if new_tokens > target:  # пометка о пропуске и округление — ещё один проход с поправкой
+                text = self.counter.truncate(section.text, 2 * target - new_tokens, section.keep)
+                new_tokens = self.counter.count(text)
+            section.text = text
+            overflow -= section.tokens - new_tokens
+            section.tokens = new_tokens
+            trimmed += 1
+        prompt_tokens = system_tokens + sum(s.tokens for s in sections) + PROMPT_OVERHEAD_TOKENS
+        remaining = self.context_window - prompt_tokens
+        if remaining < self.min_response_tokens:
+            print(f"Промпт не помещается в окно {self.context_window}: "
+                  f"на ответ остаётся {remaining} токенов вместо {self.min_response_tokens}")
+        # ответ получает всё, что осталось в окне, но не больше ожидаемого
+        max_tokens = max(1, min(response_tokens, remaining))
+        self.last_report = {
+            "system": system_tokens,
+            **{s.name: s.tokens for s in sections if not s.name.startswith("history_")},
+            "history": sum(s.tokens for s in sections if s.name.startswith("history_")),
+            "history_steps": sum(1 for s in sections if s.name.startswith("history_") and s.text),
+            "trimmed": trimmed,
+            "dropped": dropped,
+            "prompt": prompt_tokens,
+            "max_tokens": max_tokens,
+            "window": self.context_window,
+        }
+        return {s.name: s.text for s in sections}, max_tokens
@@ -0,0 +1,48 @@
+# test_chunker.py
+import pytest
+
+from src.rag.chunker import Chunker, text_to_chunk, validate_chunk_settings, chunk_text, estimate_tokens
+
+
+def test_text_to_chunk_windows_overlap():
+    text = "".join(chr(ord("a") + i % 26) for i in range(25))
+    chunks = text_to_chunk(text, chunk_size=10, overlap=3)
+    assert chunks == [text[0:10], text[7:17], text[14:24], text[21:25]]
+    for left, right in zip(chunks, chunks[1:]):
+        assert left[-3:] == right[:3]
+
+
+def test_text_to_chunk_short_and_empty():
+    assert text_to_chunk("abc", chunk_size=10, overlap=3) == ["abc"]
+    assert text_to_chunk("", chunk_size=10, overlap=3) == []
+
+
+@pytest.mark.parametrize("size, overlap", [(10, 10), (10, 11), (0, 0), (10, -1)])
+def test_invalid_settings_rejected(size, overlap):
+    with pytest.raises(ValueError):
+        validate_chunk_settings(size, overlap)
+    with pytest.raises(ValueError):
+        text_to_chunk("x" * 50, size, overlap)
+    with pytest.raises(ValueError):
+        Chunker(size, overlap)
+
+
+def test_split_lines_overlap_tail():
+    # абзац больше бюджета режется по строкам, последние строки повторяются в начале следующего чанка
+    lines = [f"line {i:03d} " + "x" * 30 + "\n" for i in range(12)]  # ~10 токенов на строку
+    chunks = Chunker(max_tokens=40, overlap_tokens=12).split("".join(lines))
+    assert len(chunks) > 1
+    for left, right in zip(chunks, chunks[1:]):
+        assert right.splitlines(keepends=True)[0] == left.splitlines(keepends=True)[-1]
+    assert all(sum(estimate_tokens(line) for line in chunk.splitlines(keepends=True)) <= 40 for chunk in chunks)
+
+
+def test_long_line_cut_by_chars():
+    line = "y" * 500
+    chunks = Chunker(max_tokens=40, overlap_tokens=10).split(line)
+    assert chunks == text_to_chunk(line, 160, 40)
+
+
+def test_paragraphs_are_packed_without_overlap():
+    text = "".join(f"абзац {i}\n\n" for i in range(5))
+    assert "".join(chunk_text(text, "notes.md", max_tokens=8, overlap_tokens=2)) == text
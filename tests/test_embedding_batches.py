@@ -0,0 +1,69 @@
+# test_embedding_batches.py
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("openai")
+
+from src.rag.agent_embeding import Embedder
+
+
+class FakeServer:
+    """Сервер эмбеддингов: падает на любой пачке с текстом "bad" """
+
+    def __init__(self):
+        self.requests = []
+
+    def __call__(self, texts):
+        self.requests.append(list(texts))
+        if "bad" in texts:
+            raise ValueError("400 Bad Request")
+        return [[float(len(text))] for text in texts]
+
+
+class DictCache:
+    def __init__(self, stored):
+        self.stored = dict(stored)
+
+    def get_many(self, texts):
+        return [self.stored.get(text) for text in texts]
+
+    def set_many(self, texts, embeddings):
+        self.stored.update((text, emb) for text, emb in zip(texts, embeddings) if emb)
+
+
+def embedder(cache=None) -> Embedder:
+    instance = Embedder.__new__(Embedder)  # без БД и сервера: только разбиение на пачки
+    instance.model = "fake"
+    instance.config = {"fake": {"model": "fake"}}
+    instance.cache = cache
+    instance._post_embeddings = FakeServer()
+    return instance
+
+
+def test_batches_by_count_and_chars():
+    emb = embedder()
+    texts = ["a", "bb", "ccc", "dddd", "eeeee"]
+    assert emb.get_embeddings(texts, batch_size=2, max_chars=100) == [[1.0], [2.0], [3.0], [4.0], [5.0]]
+    assert emb._post_embeddings.requests == [["a", "bb"], ["ccc", "dddd"], ["eeeee"]]
+
+    emb = embedder()
+    emb.get_embeddings(texts, batch_size=10, max_chars=6)
+    assert emb._post_embeddings.requests == [["a", "bb", "ccc"], ["dddd"], ["eeeee"]]
+
+
+def test_bad_text_is_isolated_by_bisection():
+    emb = embedder()
+    result = emb.get_embeddings(["a", "bb", "bad", "dddd"], batch_size=4, max_chars=100)
+    assert result == [[1.0], [2.0], None, [4.0]]
+    # пачка делится пополам, пока плохой текст не останется один
+    assert emb._post_embeddings.requests == [["a", "bb", "bad", "dddd"], ["a", "bb"], ["bad", "dddd"],
+                                             ["bad"], ["dddd"]]
+
+
+def test_cached_texts_are_not_sent():
+    cache = DictCache({"bb": [9.0]})
+    emb = embedder(cache)
+    assert emb.get_embeddings(["a", "bb", "bad"], batch_size=4, max_chars=100) == [[1.0], [9.0], None]
+    assert emb._post_embeddings.requests[0] == ["a", "bad"]
+    assert "bad" not in cache.stored and cache.stored["a"] == [1.0]
@@ -0,0 +1,23 @@
+# test_embedding_cache.py
+import pytest
+
+pytest.importorskip("diskcache")
+
+from src.rag.embedding_cache import EmbeddingCache
+
+
+def test_models_share_directory(tmp_path):
+    first = EmbeddingCache("model-a", directory=str(tmp_path))
+    first.set_many(["текст"], [[0.5, 0.25]])
+    first.close()
+
+    # другая модель в том же каталоге не сбрасывает чужие векторы и не видит их
+    second = EmbeddingCache("model-b", directory=str(tmp_path))
+    assert second.get_many(["текст"]) == [None]
+    second.set_many(["текст"], [[1.0, 0.0]])
+    second.close()
+
+    first = EmbeddingCache("model-a", directory=str(tmp_path))
+    assert first.get_many(["  текст\r\n"]) == [[0.5, 0.25]]
+    assert first.stats()["hits"] == 1
+    first.close()
@@ -0,0 +1,18 @@
+# test_file_id.py
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("openai")
+
+from src.rag.agent_embeding import Embedder
+from src.rag.file_walker import read_text_file, MMAP_THRESHOLD
+
+
+@pytest.mark.parametrize("size", [100, MMAP_THRESHOLD + 10])
+def test_walker_hash_matches_file_id(tmp_path, size):
+    # манифест индексации и Embedder.file_id должны давать один и тот же ID
+    path = tmp_path / "module.py"
+    path.write_text(("x = 1\n" * size)[:size])
+    _, content_hash = read_text_file(str(path), path.stat().st_size)
+    assert content_hash == Embedder.file_id(None, str(path))
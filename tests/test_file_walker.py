@@ -0,0 +1,46 @@
+# test_file_walker.py
+import pytest
+
+from src.rag.file_walker import GitIgnore, walk_files
+
+
+@pytest.mark.parametrize("pattern, path, is_dir, ignored", [
+    ("*.log", "app.log", False, True),
+    ("*.log", "logs/deep/app.log", False, True),
+    ("docs/*.md", "docs/index.md", False, True),
+    ("docs/*.md", "docs/api/index.md", False, False),  # * не переходит через /
+    ("**/cache", "a/b/cache", True, True),
+    ("**/cache", "cache", True, True),
+    ("build/**", "build/x/y.o", False, True),
+    ("a/**/b.txt", "a/b.txt", False, True),
+    ("a/**/b.txt", "a/x/y/b.txt", False, True),
+    ("a/**/b.txt", "c/a/x/b.txt", False, False),
+    ("/root.txt", "sub/root.txt", False, False),
+    ("out/", "out", False, False),
+    ("out/", "src/out", True, True),
+    ("file[0-9].py", "file7.py", False, True),
+])
+def test_gitignore_patterns(tmp_path, pattern, path, is_dir, ignored):
+    gitignore = GitIgnore(str(tmp_path), [pattern])
+    assert bool(gitignore.match(str(tmp_path / path), is_dir)) is ignored
+
+
+def test_walk_files_negation(tmp_path):
+    (tmp_path / ".gitignore").write_text("*.txt\n!keep.txt\nvendor/**\n")
+    (tmp_path / "vendor" / "lib").mkdir(parents=True)
+    (tmp_path / "vendor" / "lib" / "v.py").write_text("x = 1")
+    for name in ("a.txt", "keep.txt", "main.py"):
+        (tmp_path / name).write_text("x")
+    found = sorted(path[len(str(tmp_path)) + 1:] for path, _ in walk_files(str(tmp_path), set(), set()))
+    assert found == [".gitignore", "keep.txt", "main.py"]
+
+
+def test_walk_files_hidden(tmp_path):
+    # скрытые каталоги пропускаются целиком, скрытые файлы — только по шаблонам
+    (tmp_path / ".gitignore").write_text(".env\n")
+    (tmp_path / ".git").mkdir()
+    (tmp_path / ".git" / "config").write_text("x")
+    for name in (".env", ".eslintrc.js", "main.py"):
+        (tmp_path / name).write_text("x")
+    found = sorted(path[len(str(tmp_path)) + 1:] for path, _ in walk_files(str(tmp_path), set(), set()))
+    assert found == [".eslintrc.js", ".gitignore", "main.py"]
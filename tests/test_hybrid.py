@@ -0,0 +1,60 @@
+# test_hybrid.py
+from types import SimpleNamespace
+
+from src.rag.hybrid import BM25Index, rrf_fuse, lexical_terms, tokenize, RRF_K
+
+
+def test_tokenize_splits_identifiers():
+    assert tokenize("Open src/rag/hybrid.py") == ["open", "src/rag/hybrid.py", "src", "rag", "hybrid", "py"]
+    assert tokenize("get_config_dict") == ["get_config_dict", "get", "config", "dict"]
+
+
+def test_lexical_terms_identifiers_first():
+    terms = lexical_terms("Почему падает parse_config в файле settings.toml на строке 42", limit=3)
+    assert terms == ["settings.toml", "parse_config", "Почему"]
+
+
+def test_lexical_terms_exclude_goal_words():
+    goal = "Исправить загрузку конфигурации"
+    situation = "Исправить загрузку конфигурации: KeyError в load_settings"
+    terms = lexical_terms(situation, exclude=goal)
+    assert "load_settings" in terms and "KeyError" in terms
+    assert not {"Исправить", "загрузку", "конфигурации"} & set(terms)
+
+
+def test_rrf_fuse_rewards_agreement():
+    def item(name):
+        return SimpleNamespace(name=name, score=None)
+
+    vector = [item("a"), item("b"), item("c")]
+    lexical = [item("c"), item("d")]
+    fused = rrf_fuse([vector, lexical], key=lambda it: it.name)
+    assert [it.name for it in fused] == ["c", "a", "b", "d"]  # b и d — оба вторые, порядок появления
+    assert fused[0] is vector[2]  # берётся первое вхождение объекта
+    assert abs(fused[0].score - (1 / (RRF_K + 3) + 1 / (RRF_K + 1))) < 1e-12
+    assert [it.name for it in rrf_fuse([vector, lexical], key=lambda it: it.name, top_k=2)] == ["c", "a"]
+
+
+def test_bm25_ranks_rare_terms_and_removes():
+    index = BM25Index()
+    index.add(1, "def load_settings(path): return toml.load(path)")
+    index.add(2, "def save_settings(path, data): write the settings file")
+    index.add(3, "README: how to run the agent")
+    hits = index.search("load_settings падает", top_k=5)
+    assert hits[0][0] == 1
+    assert 3 not in dict(hits)
+
+    index.remove(1, "def load_settings(path): return toml.load(path)")
+    assert 1 not in dict(index.search("load_settings", top_k=5))
+    assert index.total_len == sum(index.doc_len.values())
+
+
+def test_bm25_min_score():
+    index = BM25Index()
+    for doc_id in range(5):
+        index.add(doc_id, f"ответ номер {doc_id} про конфигурацию")
+    index.add(9, "конфигурацию ломает load_settings load_settings")
+    scores = dict(index.search("load_settings конфигурацию", top_k=10))
+    assert set(scores) == {0, 1, 2, 3, 4, 9}
+    threshold = scores[9] - 1e-9
+    assert [doc_id for doc_id, _ in index.search("load_settings конфигурацию", top_k=10, min_score=threshold)] == [9]
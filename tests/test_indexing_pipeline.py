@@ -0,0 +1,105 @@
+# test_indexing_pipeline.py
+import os
+import threading
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("sqlalchemy")
+
+from src.rag.indexing_pipeline import IndexingPipeline
+from src.rag.numpy_vector_store import NumpyVectorRAG
+
+DIM = 8
+
+
+class FakeEmbedder:
+    """Эмбеддинги без сервера: вектор зависит только от длины текста"""
+    model = "fake"
+    config = {"fake": {"batch_size": 4}}
+
+    def get_embeddings(self, texts):
+        return [[float(len(text) % 7 + 1)] + [1.0] * (DIM - 1) for text in texts]
+
+
+def scan(rag, root):
+    pipeline = IndexingPipeline(FakeEmbedder(), rag, {"use_processes": False, "respect_gitignore": False})
+    return pipeline.run(root).counters
+
+
+def chunk_count(rag, file_path):
+    return len(rag.chunk_positions.get(file_path, {}))
+
+
+def test_touch_keeps_chunks(tmp_path):
+    root = tmp_path / "repo"
+    root.mkdir()
+    source = root / "module.py"
+    source.write_text("\n\n".join(f"def f{i}():\n    return {i} * {i} + {i}  # " + "x" * 40
+                                  for i in range(20)))
+    rag = NumpyVectorRAG(str(tmp_path / "store"))
+    scan(rag, root)
+    before = chunk_count(rag, str(source))
+    assert before > 0
+
+    stat = source.stat()
+    os.utime(source, (stat.st_atime, stat.st_mtime + 10))  # touch: mtime новый, содержимое то же
+    stats = scan(rag, root)
+
+    assert stats["files_skipped"] == 1
+    assert chunk_count(rag, str(source)) == before
+    assert rag.manifest[str(source)]["mtime"] == stat.st_mtime + 10
+
+
+def test_emptied_file_loses_chunks(tmp_path):
+    root = tmp_path / "repo"
+    root.mkdir()
+    source = root / "notes.md"
+    source.write_text("# Заметки\n\n" + "строка текста заметки " * 20)
+    rag = NumpyVectorRAG(str(tmp_path / "store"))
+    scan(rag, root)
+    assert chunk_count(rag, str(source)) > 0
+
+    source.write_text("")
+    scan(rag, root)
+    assert chunk_count(rag, str(source)) == 0
+
+
+def test_delete_stale_chunks_refuses_empty_keep(tmp_path):
+    rag = NumpyVectorRAG(str(tmp_path / "store"))
+    with pytest.raises(ValueError):
+        rag.delete_stale_chunks("/nonexistent.py", [])
+
+
+class BrokenRAG(NumpyVectorRAG):
+    """БД, в которой падают и commit, и rollback"""
+
+    def commit(self):
+        raise ConnectionError("соединение потеряно")
+
+    def rollback(self):
+        raise ConnectionError("соединение потеряно")
+
+
+def test_writer_failure_stops_run(tmp_path):
+    root = tmp_path / "repo"
+    root.mkdir()
+    for i in range(40):
+        (root / f"m{i}.py").write_text(f"def f{i}():\n    return {i} * {i} + {i}  # " + "x" * 40)
+    rag = BrokenRAG(str(tmp_path / "store"))
+    pipeline = IndexingPipeline(FakeEmbedder(), rag, {"use_processes": False, "respect_gitignore": False,
+                                                      "queue_size": 2, "write_batch_size": 1,
+                                                      "embed_workers": 1, "reader_workers": 1})
+    result = []
+
+    def target():
+        try:
+            pipeline.run(root)
+        except ConnectionError as e:
+            result.append(e)
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout=30)
+    assert not thread.is_alive(), "индексация зависла на очередях"
+    assert len(result) == 1
@@ -0,0 +1,36 @@
+# test_json_repair.py
+from src.thinking.json_repair import repair_json
+
+
+def test_fenced_and_surrounding_text():
+    text = 'Вот ответ:\n```json\n{"reasoning": "ok", "confidence": 0.9}\n```\nготово'
+    assert repair_json(text) == {"reasoning": "ok", "confidence": 0.9}
+
+
+def test_trailing_commas_and_python_literals():
+    text = '{"a": [1, 2,], "b": True, "c": None, "d": "True, None",}'
+    assert repair_json(text) == {"a": [1, 2], "b": True, "c": None, "d": "True, None"}
+
+
+def test_raw_newlines_in_strings():
+    assert repair_json('{"content": "строка 1\nстрока 2"}') == {"content": "строка 1\nстрока 2"}
+
+
+def test_truncated_response_is_closed():
+    text = '{"reasoning": "думаю", "action_plan": [{"tool": "read_file", "parameters": {"path": "a.p'
+    assert repair_json(text) == {"reasoning": "думаю",
+                                 "action_plan": [{"tool": "read_file", "parameters": {"path": "a.p"}}]}
+
+
+def test_truncated_after_key():
+    assert repair_json('{"reasoning": "x", "confidence":') == {"reasoning": "x"}
+
+
+def test_unrepairable():
+    assert repair_json("") is None
+    assert repair_json("нет JSON вообще") is None
+
+
+def test_dangling_key_inside_array_value_kept():
+    assert repair_json('{"a": ["x", "y"') == {"a": ["x", "y"]}
+    assert repair_json('{"a": {"b": 1, "c"') == {"a": {"b": 1}}
@@ -0,0 +1,91 @@
+# test_llm_thought_manager.py
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("openai")
+
+from src.thinking.llm_thought_manager import LlmThoughtManager, coerce_confidence, DEFAULT_CONFIDENCE
+
+
+def is_json_error(thought) -> bool:
+    return [action.tool_name for action in thought.action_plan] == ["json_error_llm"]
+
+
+@pytest.mark.parametrize("value, expected", [
+    (0.3, 0.3), ("0.7", 0.7), (None, DEFAULT_CONFIDENCE), ("high", DEFAULT_CONFIDENCE),
+    ([1], DEFAULT_CONFIDENCE), (7, DEFAULT_CONFIDENCE), (float("nan"), DEFAULT_CONFIDENCE),
+])
+def test_coerce_confidence(value, expected):
+    assert coerce_confidence(value) == expected
+
+
+def test_valid_json():
+    thought = LlmThoughtManager._thought_from_text(
+        '{"reasoning": "r", "action_plan": [{"tool": "read_file"}], "confidence": 0.4}')
+    assert (thought.reasoning, thought.confidence, thought.action_plan) == ("r", 0.4, [{"tool": "read_file"}])
+
+
+@pytest.mark.parametrize("confidence", ["null", '"high"', "[]"])
+def test_bad_confidence_does_not_raise(confidence):
+    thought = LlmThoughtManager._thought_from_text(
+        f'{{"reasoning": "r", "action_plan": [], "confidence": {confidence}}}')
+    assert thought.confidence == DEFAULT_CONFIDENCE
+
+
+def test_repaired_json():
+    thought = LlmThoughtManager._thought_from_text('```json\n{"reasoning": "r", "confidence": "high",}\n```')
+    assert thought.reasoning == "r" and thought.confidence == DEFAULT_CONFIDENCE
+
+
+@pytest.mark.parametrize("text", ["[1, 2]", "не JSON", ""])
+def test_non_object_gives_json_error(text):
+    assert is_json_error(LlmThoughtManager._thought_from_text(text))
+
+
+def test_list_of_objects_does_not_raise():
+    thought = LlmThoughtManager._thought_from_text('[{"tool": "read_file"}]')
+    assert thought.action_plan is None or is_json_error(thought)
+
+
+def test_wrong_field_types():
+    thought = LlmThoughtManager._thought_from_text('{"reasoning": 5, "action_plan": "read_file"}')
+    assert thought.reasoning == "LLM сгенерировал мысль" and thought.action_plan is None
+
+
+class FakeStreamClient:
+    llm = "fake"
+
+    def __init__(self, deltas):
+        self.deltas = deltas
+
+    async def astream(self, msgs, max_tokens, extra=None):
+        for delta in self.deltas:
+            yield delta
+
+
+def stream_thought(deltas, on_action=None):
+    manager = LlmThoughtManager.__new__(LlmThoughtManager)  # без конфига и клиентов: нужен только разбор потока
+    manager.prompt_builder = SimpleNamespace(native_tools=False, structured_kwargs=lambda: None)
+    manager.token_budgets = {}
+    manager._prepare = lambda situation, rag_context, client: ([], 100)
+    return asyncio.run(manager.llm_thinking_stream("s", on_action=on_action, client=FakeStreamClient(deltas)))
+
+
+def test_stream_bad_confidence():
+    thought = stream_thought(['{"reasoning": "r", "action_plan": [], ', '"confidence": "high"}'])
+    assert thought.reasoning == "r" and thought.confidence == DEFAULT_CONFIDENCE
+
+
+def test_stream_non_object_gives_json_error():
+    assert is_json_error(stream_thought(["[1, ", "2]"]))
+    assert is_json_error(stream_thought(["{не JSON}"]))
+
+
+def test_stream_truncated_after_actions():
+    actions = []
+    thought = stream_thought(['{"reasoning": "r", "action_plan": [{"tool": "read_file"}', ', {"tool": "wr'],
+                             on_action=actions.append)
+    assert actions == [{"tool": "read_file"}]
+    assert thought.action_plan == actions and thought.confidence == DEFAULT_CONFIDENCE
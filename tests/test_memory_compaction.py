@@ -0,0 +1,48 @@
+# test_memory_compaction.py
+import pytest
+
+from src.rag.memory_compaction import CompactionPolicy, group_duplicates
+
+
+def test_group_duplicates_chains_keep_oldest():
+    # 5~3, 3~1 — одна цепочка; 7~9 — отдельная группа; порядок в паре не важен
+    groups = group_duplicates([(5, 3), (3, 1), (9, 7), (1, 5)])
+    assert {keep: sorted(ids) for keep, ids in groups.items()} == {1: [3, 5], 7: [9]}
+
+
+def test_group_duplicates_empty():
+    assert group_duplicates([]) == {}
+
+
+def test_policy_from_config():
+    policy = CompactionPolicy.from_config({"memory_compaction": {"dedup_distance": 0.1, "dedup_neighbors": 3}})
+    assert (policy.dedup_distance, policy.dedup_neighbors, policy.min_score) == (0.1, 3, 0.25)
+
+
+def test_numpy_compact_memory_merges_counts(tmp_path):
+    pytest.importorskip("numpy")
+    pytest.importorskip("sqlalchemy")
+    from src.rag.models import MemoryChunk
+    from src.rag.numpy_vector_store import NumpyVectorRAG
+
+    def memory(embedding, action="read_file", namespace=None, success=True):
+        return MemoryChunk(situation="ситуация", action_description=action, result_summary="ok",
+                           success=success, namespace=namespace, embedding=embedding + [0.0] * 6)
+
+    rag = NumpyVectorRAG(str(tmp_path))
+    policy = rag.compaction
+    rag.compaction = CompactionPolicy(dedup_distance=None)  # дубли копятся, как до появления слияния при записи
+    rag.save_memory_chunks([
+        memory([1.0, 0.0]), memory([1.0, 0.01]), memory([1.0, 0.02], success=False),  # одна ситуация трижды
+        memory([1.0, 0.0], action="write_file"),                                       # другое действие
+        memory([1.0, 0.0], namespace="other"),                                         # другой namespace
+        memory([0.0, 1.0]),                                                            # другая ситуация
+    ])
+    rag.compaction = policy
+
+    assert rag.compact_memory() == {"merged": 2, "aged_out": 0, "capped": 0}
+    rows = [row for row in rag.memory.rows if row is not None]
+    assert len(rows) == 4
+    kept = rows[0]
+    assert kept["id"] == 1 and (kept["hit_count"], kept["success_count"]) == (3, 2)
+    assert all(row["hit_count"] == 1 for row in rows[1:])
@@ -0,0 +1,107 @@
+# test_memory_writer.py
+import asyncio
+
+import pytest
+
+from src.rag.memory_writer import MemoryWriteQueue
+
+
+class FakeRAG:
+    def __init__(self, gate: asyncio.Event = None, fail: bool = False):
+        self.gate = gate
+        self.fail = fail
+        self.batches = []
+
+    async def save_memory_chunks(self, chunks):
+        if self.gate is not None:
+            await self.gate.wait()
+        if self.fail:
+            raise ConnectionError("БД недоступна")
+        self.batches.append(chunks)
+
+
+class FakeEmbedder:
+    def __init__(self, rag: FakeRAG):
+        self.async_rag = rag
+        self.requests = []
+
+    async def aget_embeddings(self, texts):
+        self.requests.append(list(texts))
+        return [None if text == "без эмбеддинга" else [1.0] for text in texts]
+
+    @staticmethod
+    def memory_chunk(item, embedding):
+        return item["situation"]
+
+
+def item(situation: str) -> dict:
+    return {"situation": situation}
+
+
+def test_batches_by_size_and_reuses_embeddings():
+    async def scenario():
+        embedder = FakeEmbedder(FakeRAG())
+        writer = MemoryWriteQueue(embedder, batch_size=3, flush_interval=10.0)
+        for i in range(7):
+            await writer.put(item(f"s{i}"), embedding=[0.5] if i == 1 else None)
+        await writer.close()
+        return embedder, writer
+
+    embedder, writer = asyncio.run(scenario())
+    assert embedder.async_rag.batches == [["s0", "s1", "s2"], ["s3", "s4", "s5"], ["s6"]]
+    assert embedder.requests[0] == ["s0", "s2"]  # s1 уже эмбеддили при поиске
+    assert writer.stats == {"queued": 7, "written": 7, "failed": 0, "batches": 3, "embeddings_reused": 1}
+
+
+def test_flush_interval_and_on_written():
+    written = []
+
+    async def scenario():
+        embedder = FakeEmbedder(FakeRAG())
+        writer = MemoryWriteQueue(embedder, batch_size=100, flush_interval=0.05, on_written=written.append)
+        await writer.put(item("a"))
+        await writer.put(item("без эмбеддинга"))
+        await asyncio.wait_for(writer.flush(), 2.0)  # неполная пачка уходит по таймеру
+        assert written == [["a"]]
+        await writer.close()
+        return writer
+
+    writer = asyncio.run(scenario())
+    assert (writer.stats["written"], writer.stats["failed"]) == (1, 1)
+
+
+def test_full_queue_blocks_put():
+    async def scenario():
+        gate = asyncio.Event()
+        embedder = FakeEmbedder(FakeRAG(gate))
+        writer = MemoryWriteQueue(embedder, batch_size=1, flush_interval=0.01, queue_size=2)
+        await writer.put(item("s0"))
+        await asyncio.sleep(0.05)  # s0 забран писателем и ждёт БД
+        await writer.put(item("s1"))
+        await writer.put(item("s2"))
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(writer.put(item("s3")), 0.1)
+        gate.set()
+        await writer.put(item("s3"))
+        await writer.close()
+        return embedder
+
+    embedder = asyncio.run(scenario())
+    assert [chunk for batch in embedder.async_rag.batches for chunk in batch] == ["s0", "s1", "s2", "s3"]
+
+
+def test_write_error_does_not_stop_queue():
+    async def scenario():
+        rag = FakeRAG(fail=True)
+        writer = MemoryWriteQueue(FakeEmbedder(rag), batch_size=2, flush_interval=0.01)
+        await writer.put(item("a"))
+        await writer.put(item("b"))
+        await writer.flush()
+        rag.fail = False
+        await writer.put(item("c"))
+        await writer.close()
+        return rag, writer
+
+    rag, writer = asyncio.run(scenario())
+    assert rag.batches == [["c"]]
+    assert (writer.stats["failed"], writer.stats["written"]) == (2, 1)
@@ -0,0 +1,93 @@
+# test_model_router.py
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from src.action import Action
+from src.memory import Thought
+from src.thinking.model_router import ModelRouter
+
+
+def context(tool_name: str = None, success: bool = True, goal: str = "прочитать README"):
+    obs = None
+    if tool_name is not None:
+        obs = SimpleNamespace(action=Action(tool_name=tool_name), success=success)
+    return SimpleNamespace(last_observation=obs, user_goal=goal)
+
+
+def thought(confidence: float = 0.9, plan=None, source: str = "llm") -> Thought:
+    return Thought(reasoning="r", confidence=confidence, source=source,
+                   action_plan=[{"tool": "read_file"}] if plan is None else plan)
+
+
+def router(**kwargs) -> ModelRouter:
+    return ModelRouter(log_path=None, **kwargs)
+
+
+@pytest.mark.parametrize("ctx, llm, reason", [
+    (context(), "llm1", "first_step"),
+    (context("read_file", goal="x" * 2000), "llm1", "complex_task"),
+    (context("read_file", success=False), "llm1", "tool_error"),
+    (context("json_error_llm"), "llm1", "invalid_json"),
+    (context("read_file"), "llm2", "routine:read_file"),
+    (context("write_file"), "llm1", "default"),
+])
+def test_route_reasons(ctx, llm, reason):
+    decision = router().route(ctx)
+    assert (decision.llm, decision.reason) == (llm, reason)
+
+
+def test_low_confidence_routes_next_step_to_large():
+    model_router = router()
+    decision = model_router.route(context("write_file"))
+    model_router.thought_done(decision, thought(confidence=0.3))
+    assert model_router.route(context("read_file")).reason == "low_confidence"
+
+
+@pytest.mark.parametrize("small_thought, reason", [
+    (thought(plan=[Action(tool_name="json_error_llm")]), "invalid_json"),
+    (thought(plan=[]), "invalid_json"),
+    (thought(source="error_llm"), "invalid_json"),
+    (thought(confidence=0.4), "low_confidence"),
+])
+def test_small_answer_escalated(small_thought, reason):
+    model_router = router()
+    decision = model_router.route(context("read_file"))
+    assert not model_router.accept(decision, small_thought)
+    assert decision.escalated and decision.escalation_reason == reason
+    assert decision.small_confidence == small_thought.confidence
+
+    model_router.thought_done(decision, thought())  # ответ большой модели после эскалации
+    assert model_router.stats == {"small": 0, "large": 1, "escalated": 1}
+    assert model_router.small_streak == 0
+
+
+def test_large_answer_always_accepted():
+    model_router = router()
+    decision = model_router.route(context("write_file"))
+    assert model_router.accept(decision, thought(confidence=0.1))
+    assert not decision.escalated and decision.confidence == 0.1
+
+
+def test_small_streak_checked_by_large():
+    model_router = router(max_small_streak=2)
+    reasons = []
+    for _ in range(4):
+        decision = model_router.route(context("read_file"))
+        reasons.append(decision.reason)
+        assert model_router.accept(decision, thought())
+        model_router.thought_done(decision, thought())
+    assert reasons == ["routine:read_file", "routine:read_file", "small_streak", "routine:read_file"]
+    assert model_router.stats == {"small": 3, "large": 1, "escalated": 0}
+
+
+def test_record_outcome_log(tmp_path):
+    log_path = tmp_path / "routing.jsonl"
+    model_router = ModelRouter(log_path=str(log_path))
+    decision = model_router.route(context("read_file"))
+    model_router.accept(decision, thought(confidence=0.4))
+    model_router.record_outcome([SimpleNamespace(action=Action(tool_name="read_file"), success=True)])
+    record = json.loads(log_path.read_text(encoding="utf-8"))
+    assert (record["llm"], record["escalation_reason"], record["tools_ok"]) == ("llm2", "low_confidence", True)
+    assert model_router.pending is None
@@ -0,0 +1,58 @@
+# test_numpy_vector_store.py
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("sqlalchemy")
+
+from src.rag.models import Chunk, MemoryChunk
+from src.rag.numpy_vector_store import NumpyVectorRAG
+
+
+def memory(i: int) -> MemoryChunk:
+    embedding = [0.0] * 8
+    embedding[i % 8] = 1.0
+    return MemoryChunk(situation=f"ситуация {i}", action_description=f"действие {i}",
+                       result_summary="ok", success=True, embedding=embedding)
+
+
+def chunk(i: int) -> Chunk:
+    return Chunk(file_path="/repo/a.py", source="a.py", chunk_index=i,
+                 content=f"def handler_{i}(): pass", embedding=[1.0, float(i)] + [0.0] * 6)
+
+
+def test_commit_appends_to_journal_and_reloads(tmp_path):
+    rag = NumpyVectorRAG(str(tmp_path))
+    rag.save_memory_chunks([memory(0), memory(1)])
+    rag.save_memory_chunks([memory(2)])
+    assert not (tmp_path / "memory_chunks.json").exists()  # снимок не переписывается на каждую пачку
+
+    reopened = NumpyVectorRAG(str(tmp_path))
+    assert [row["situation"] for row in reopened.memory.rows] == ["ситуация 0", "ситуация 1", "ситуация 2"]
+    assert reopened.search_memory(memory(2).embedding, top_k=1)[0].situation == "ситуация 2"
+
+
+def test_close_checkpoints(tmp_path):
+    rag = NumpyVectorRAG(str(tmp_path))
+    rag.save_memory_chunks([memory(0)])
+    rag.close()
+    assert (tmp_path / "memory_chunks.json").exists()
+    assert not (tmp_path / "memory_chunks.journal").exists()
+    assert len(NumpyVectorRAG(str(tmp_path)).memory.rows) == 1
+
+
+def test_rollback_discards_uncommitted(tmp_path):
+    rag = NumpyVectorRAG(str(tmp_path))
+    rag.bulk_upsert_chunks([chunk(0), chunk(1)])
+    rag.commit()
+
+    rag.bulk_upsert_chunks([chunk(2)])
+    rag.delete_stale_chunks("/repo/a.py", [2])
+    rag.rollback()
+
+    assert sorted(rag.chunk_positions["/repo/a.py"]) == [0, 1]
+    assert sorted(hit.chunk_index for hit in rag.lexical_search("handler", top_k=5)) == [0, 1]
+    rag.bulk_upsert_chunks([chunk(3)])  # запись после отката — поверх отброшенных векторов
+    rag.commit()
+    reopened = NumpyVectorRAG(str(tmp_path))
+    assert sorted(reopened.chunk_positions["/repo/a.py"]) == [0, 1, 3]
+    assert reopened.search(chunk(3).embedding, top_k=1, max_distance=0.01)[0].chunk_index == 3
@@ -0,0 +1,59 @@
+# test_retrieval_cache.py
+from src.thinking.retrieval_cache import RetrievalCache, cosine_distance
+
+
+def test_key_normalizes_whitespace_and_paths():
+    assert RetrievalCache.key("Открыть  /home/user/a.py\n") == RetrievalCache.key("Открыть /tmp/b.py")
+    assert RetrievalCache.key("Открыть src/a.py") != RetrievalCache.key("Открыть src/b.py")
+
+
+def test_exact_and_near_hits():
+    cache = RetrievalCache(near_distance=0.02)
+    cache.put("a", [1.0, 0.0], ["память a"])
+    assert cache.get("a") == ["память a"]
+    assert cache.get("b") is None
+    assert cache.embedding("a") == [1.0, 0.0]
+
+    assert cache.get_near([1.0, 0.01]) == ["память a"]  # почти та же ситуация
+    assert cache.get_near([0.0, 1.0]) is None
+    assert cache.stats == {"exact": 1, "near": 1, "miss": 1, "invalidated": 0}
+
+
+def test_get_near_picks_closest():
+    cache = RetrievalCache(near_distance=0.1)
+    cache.put("far", [1.0, 0.3], ["far"])
+    cache.put("close", [1.0, 0.05], ["close"])
+    assert cosine_distance([1.0, 0.0], [1.0, 0.3]) < 0.1
+    assert cache.get_near([1.0, 0.0]) == ["close"]
+
+
+def test_lru_eviction():
+    cache = RetrievalCache(max_entries=2)
+    cache.put("a", None, [1])
+    cache.put("b", None, [2])
+    cache.get("a")  # a свежее b
+    cache.put("c", None, [3])
+    assert list(cache.entries) == ["a", "c"]
+
+
+def test_put_skipped_after_invalidation():
+    cache = RetrievalCache()
+    generation = cache.generation  # поиск начался
+    cache.invalidate()             # пока искали, записалась память
+    cache.put("a", [1.0, 0.0], ["устарело"], generation=generation)
+    assert cache.get("a") is None
+    cache.put("a", [1.0, 0.0], ["свежее"], generation=cache.generation)
+    assert cache.get("a") == ["свежее"]
+
+
+def test_invalidate_only_nearby():
+    cache = RetrievalCache()
+    cache.put("near", [1.0, 0.0], [1])
+    cache.put("far", [0.0, 1.0], [2])
+    cache.put("text-only", None, [3])  # без эмбеддинга — близость неизвестна, сбрасывается
+    cache.invalidate([1.0, 0.1], max_distance=0.1)
+    assert list(cache.entries) == ["far"]
+    assert cache.stats["invalidated"] == 2 and cache.generation == 1
+
+    cache.invalidate()
+    assert not cache.entries
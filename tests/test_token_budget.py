@@ -0,0 +1,80 @@
+# test_token_budget.py
+from types import SimpleNamespace
+
+from src.thinking.token_budget import (TokenBudget, TokenCounter, PromptSection, SITUATION_MIN_TOKENS,
+                                       PROMPT_OVERHEAD_TOKENS)
+
+
+def char_counter() -> TokenCounter:
+    counter = TokenCounter()
+    counter.encoding = None  # оценка по символам: тест не зависит от tiktoken и его словарей
+    return counter
+
+
+def budget(window: int, **kwargs) -> TokenBudget:
+    return TokenBudget(context_window=window, min_response_tokens=100, max_response_tokens=1000,
+                       counter=char_counter(), **kwargs)
+
+
+def sections(situation: str, rag: str, history: list, token_budget: TokenBudget) -> list:
+    return [
+        PromptSection("situation", situation, priority=0, min_tokens=SITUATION_MIN_TOKENS, required=True),
+        PromptSection("rag", rag, priority=5, min_tokens=50),
+    ] + token_budget.history_sections(history)
+
+
+def observation(i: int, size: int):
+    action = SimpleNamespace(tool_name="read_file", params={"path": f"f{i}.py"})
+    return SimpleNamespace(success=True, action=action, output="x" * size)
+
+
+def test_everything_fits():
+    token_budget = budget(8000)
+    texts, max_tokens = token_budget.fit("правила", sections("ситуация", "память", [observation(0, 30)],
+                                                            token_budget))
+    assert texts["situation"] == "ситуация" and texts["rag"] == "память" and texts["history_0"]
+    assert max_tokens == 1000
+    assert token_budget.last_report["trimmed"] == token_budget.last_report["dropped"] == 0
+
+
+def test_oldest_history_dropped_first():
+    token_budget = budget(4000)
+    history = [observation(i, 3000) for i in range(6)]  # ~1000 токенов; старые выводы обрезаются до 600
+    texts, max_tokens = token_budget.fit("правила", sections("ситуация", "память " * 50, history, token_budget))
+    kept = [name for name in texts if name.startswith("history_") and texts[name]]
+    assert "history_0" in kept and "history_5" not in kept
+    assert kept == [f"history_{age}" for age in range(len(kept))]  # выбрасываются с самого старого
+    assert texts["rag"]
+    report = token_budget.last_report
+    assert report["prompt"] + max_tokens <= token_budget.context_window
+
+
+def test_required_situation_is_trimmed_not_dropped():
+    token_budget = budget(1500)
+    history = [observation(0, 3000)]
+    texts, max_tokens = token_budget.fit("правила", sections("с" * 12000, "память " * 300, history, token_budget))
+    situation_tokens = token_budget.counter.count(texts["situation"])
+    assert texts["situation"] and situation_tokens >= SITUATION_MIN_TOKENS
+    assert texts["rag"] == ""
+    assert max_tokens >= 1
+    assert token_budget.last_report["prompt"] + max_tokens <= token_budget.context_window
+
+
+def test_max_tokens_limited_by_window():
+    token_budget = budget(2500)
+    system = "п" * 3000  # ~1000 токенов неизменной части
+    texts, max_tokens = token_budget.fit(system, sections("ситуация", "", [], token_budget))
+    prompt = token_budget.last_report["prompt"]
+    assert prompt >= 1000 + PROMPT_OVERHEAD_TOKENS
+    assert max_tokens == min(1000, token_budget.context_window - prompt)
+
+
+def test_response_tokens_follow_recent_answers():
+    token_budget = budget(32000)
+    assert token_budget.response_tokens() == 1000  # ответов ещё не было — максимум
+    token_budget.observe_response(30)
+    assert token_budget.response_tokens() == 100   # не меньше min_response_tokens
+    token_budget.observe_response(200)
+    assert token_budget.response_tokens() == 400   # самый длинный с запасом x2
+    token_budget.observe_response(50, truncated=True)
+    assert token_budget.response_tokens() == 800   # обрезанный ответ — лимит вдвое больше